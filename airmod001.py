@@ -3,12 +3,61 @@
 Copyright (c) 2008-2025 synodriver <diguohuangjiajinweijun@gmail.com>
 """
 import asyncio
+import time
 
 from machine import UART
 
+from framering import FrameRing
 
-class AirMod:
-    def __init__(self, id_: int, tx: int, rx: int):
+FRAME_LEN = 17
+_HEADER0 = 0x3C
+_HEADER1 = 0x02
+
+
+class AirModRecord:
+    """
+    最近一帧的测量值，每帧原地更新，不创建新对象
+    温湿度保存为0.1单位的整数，读取属性时才换算成float
+    """
+    __slots__ = ("version", "co2", "ch2o", "voc", "pm25", "pm10", "temperature_x10", "humidity_x10")
+
+    def __init__(self):
+        self.version = 0  # 每解析出一帧加一，消费者比较版本号判断有没有新数据
+        self.co2 = 0
+        self.ch2o = 0
+        self.voc = 0
+        self.pm25 = 0
+        self.pm10 = 0
+        self.temperature_x10 = 0
+        self.humidity_x10 = 0
+
+    @property
+    def temperature(self) -> float:
+        return self.temperature_x10 / 10
+
+    @property
+    def humidity(self) -> float:
+        return self.humidity_x10 / 10
+
+    def store(self, state: dict, ch2o=True):
+        """
+        写入状态dict里已有的键
+        :param ch2o: 接了DART甲醛传感器时为False，ch2o由DART提供
+        """
+        state["temperature"] = self.temperature_x10 / 10
+        state["humidity"] = self.humidity_x10 / 10
+        state["voc"] = self.voc
+        state["pm25"] = self.pm25
+        state["pm10"] = self.pm10
+        if ch2o:
+            state["ch2o"] = self.ch2o
+        state["co2"] = self.co2
+
+
+class AirMod(FrameRing):
+    frame_len = FRAME_LEN
+
+    def __init__(self, id_: int, tx: int, rx: int, buffer_size: int = 64):
         try:
             self._uart = UART(id_, baudrate=9600, bits=8, stop=1, tx=tx, rx=rx, timeout=0)
             # self._writer = asyncio.StreamWriter(self._uart, {}) # type: ignore
@@ -17,44 +66,79 @@ class AirMod:
             raise
         self._reader = asyncio.StreamReader(self._uart)  # type: ignore
         self._should_stop = False
-        self.data = None
+        self._init_parser(buffer_size)
+        self.fps = 0.0
+        self._fps_frames = 0  # 上一次stats()时的frames
+        self._fps_start = time.ticks_ms()
         self.has_data = asyncio.Event()
         self.has_data.clear()
         asyncio.create_task(self._reading_task())
 
-    async def _reading_task(self):
-        while not self._should_stop:
-            res = await self._reader.readexactly(17)
-            if res[0] != 0x3C or res[1] != 0x02:
-                print("header error")
+    def _init_parser(self, buffer_size):
+        self._init_ring(buffer_size)
+        self.record = AirModRecord()
+
+    def _parse(self) -> int:
+        """
+        解析缓冲区里所有完整的帧
+        :return: 解析出的帧数
+        """
+        buf = self._buf
+        count = 0
+        while self._end - self._start >= FRAME_LEN:
+            i = self._start
+            if buf[i] != _HEADER0 or buf[i + 1] != _HEADER1:
+                self._slide()
                 continue
-            checksum = res[16]
-            tmp = sum(res[:16]) & 0xFF
-            if checksum != tmp:
-                print("checksum error")
+            checksum = 0
+            for k in range(i, i + FRAME_LEN - 1):  # 逐字节累加，不创建切片
+                checksum += buf[k]
+            if checksum & 0xFF != buf[i + FRAME_LEN - 1]:
+                self.checksum_errors += 1
+                self._slide()
                 continue
-            co2 = int.from_bytes(res[2:4], "big")
-            ch2o = int.from_bytes(res[4:6], "big")
-            voc = int.from_bytes(res[6:8], "big")
-            pm25 = int.from_bytes(res[8:10], "big")
-            pm10 = int.from_bytes(res[10:12], "big")
-            if res[12] & 0x80:
-                # <0
-                tempreture = -(float(res[12] & 0x7F) + res[13] / 10)
-            else:
-                tempreture = float(res[12] & 0x7F) + res[13] / 10
-            humidity = float(res[14]) + res[15] / 10
-            self.data = {
-                "temperature": tempreture,
-                "humidity": humidity,
-                "voc": voc,
-                "pm25": pm25,
-                "pm10": pm10,
-                "ch2o": ch2o,
-                "co2": co2
-            }
-            self.has_data.set()
+            self._decode(i)
+            self._synced = True
+            self._start += FRAME_LEN
+            count += 1
+        if self._start == self._end:
+            self._start = self._end = 0
+        return count
+
+    def _decode(self, i):
+        res = self._buf
+        record = self.record
+        record.co2 = res[i + 2] << 8 | res[i + 3]
+        record.ch2o = res[i + 4] << 8 | res[i + 5]
+        record.voc = res[i + 6] << 8 | res[i + 7]
+        record.pm25 = res[i + 8] << 8 | res[i + 9]
+        record.pm10 = res[i + 10] << 8 | res[i + 11]
+        tempreture = (res[i + 12] & 0x7F) * 10 + res[i + 13]
+        if res[i + 12] & 0x80:
+            # <0
+            tempreture = -tempreture
+        record.temperature_x10 = tempreture
+        record.humidity_x10 = res[i + 14] * 10 + res[i + 15]
+        record.version += 1
+
+    def _update_fps(self):
+        """上一次调用到现在的平均帧率，串口没有数据时也会降到0"""
+        now = time.ticks_ms()
+        elapsed = time.ticks_diff(now, self._fps_start)
+        if elapsed > 0:
+            self.fps = (self.frames - self._fps_frames) * 1000 / elapsed
+            self._fps_frames = self.frames
+            self._fps_start = now
+
+    def stats(self) -> dict:
+        """诊断信息，帧率是距离上一次调用的平均值"""
+        self._update_fps()
+        return {
+            "airmod_fps": self.fps,
+            "airmod_resyncs": self.resyncs,
+            "airmod_checksum_errors": self.checksum_errors,
+        }
 
     def deinit(self):
         self._should_stop = True
-        self._uart.deinit()
\ No newline at end of file
+        self._uart.deinit()
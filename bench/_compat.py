@@ -0,0 +1,22 @@
+# -*- coding: utf-8 -*-
+"""
+在CPython上跑benchmark时用sim里的stub模块补上驱动依赖的MicroPython模块
+在MicroPython上什么都不做
+"""
+import sys
+import time
+
+sys.path.insert(0, __file__.rsplit("/", 2)[0] if "/" in __file__ else "..")
+
+try:
+    import micropython  # noqa: F401
+except ImportError:
+    import sim
+
+    sim.install()
+
+
+def ticks_us():
+    if hasattr(time, "perf_counter_ns"):
+        return time.perf_counter_ns() // 1000
+    return time.ticks_us()
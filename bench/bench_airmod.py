@@ -0,0 +1,116 @@
+# -*- coding: utf-8 -*-
+"""
+AirMod 每帧解码的耗时和内存分配：原来的 readexactly + 切片 + dict 对比 readinto + 原地解析到 AirModRecord
+MicroPython上统计的是关掉gc之后 gc.mem_alloc() 的增量，也就是每帧真正分配的字节数；
+CPython上只能给出 tracemalloc 的峰值
+
+    python bench/bench_airmod.py
+    micropython bench/bench_airmod.py
+"""
+import _compat  # noqa: F401
+import gc
+
+from _compat import ticks_us
+from airmod001 import AirMod, FRAME_LEN
+
+try:
+    import tracemalloc
+except ImportError:  # micropython
+    tracemalloc = None
+
+N = 2000
+
+
+def make_frame(co2):
+    frame = bytearray([0x3C, 0x02, co2 >> 8, co2 & 0xFF, 0x00, 0x05, 0x00, 0x0C, 0x00, 0x08, 0x00, 0x0B,
+                       0x17, 0x04, 0x2D, 0x01])
+    frame.append(sum(frame) & 0xFF)
+    return bytes(frame)
+
+
+def reference_decode(res, state):
+    """原来的实现：readexactly返回的新bytes，切片转int，再构造一个dict"""
+    if res[0] != 0x3C or res[1] != 0x02:
+        return
+    checksum = res[16]
+    tmp = sum(res[:16]) & 0xFF
+    if checksum != tmp:
+        return
+    co2 = int.from_bytes(res[2:4], "big")
+    ch2o = int.from_bytes(res[4:6], "big")
+    voc = int.from_bytes(res[6:8], "big")
+    pm25 = int.from_bytes(res[8:10], "big")
+    pm10 = int.from_bytes(res[10:12], "big")
+    if res[12] & 0x80:
+        tempreture = -(float(res[12] & 0x7F) + res[13] / 10)
+    else:
+        tempreture = float(res[12] & 0x7F) + res[13] / 10
+    humidity = float(res[14]) + res[15] / 10
+    data = {
+        "temperature": tempreture,
+        "humidity": humidity,
+        "voc": voc,
+        "pm25": pm25,
+        "pm10": pm10,
+        "ch2o": ch2o,
+        "co2": co2
+    }
+    state.update(data)
+
+
+def measure(name, fn):
+    fn()  # warm up
+    gc.collect()
+    if tracemalloc is not None:
+        tracemalloc.start()
+        tracemalloc.reset_peak()
+        before = tracemalloc.get_traced_memory()[0]
+        fn()
+        alloc = "peak %d B" % (tracemalloc.get_traced_memory()[1] - before)
+        tracemalloc.stop()
+    else:
+        gc.disable()
+        before = gc.mem_alloc()
+        for _ in range(100):
+            fn()
+        alloc = "%d B" % ((gc.mem_alloc() - before) // 100)
+        gc.enable()
+    start = ticks_us()
+    for _ in range(N):
+        fn()
+    us = (ticks_us() - start) / N
+    print("%-12s %8.2f us/frame   %s/frame" % (name, us, alloc))
+
+
+def main():
+    frame = make_frame(612)
+    state = {"temperature": 0.0, "humidity": 0.0, "voc": 0, "pm25": 0, "pm10": 0, "ch2o": 0, "co2": 0}
+
+    def reference_path():
+        res = bytes(frame)  # readexactly(17)每次都返回新的bytes
+        reference_decode(res, state)
+
+    airmod = AirMod.__new__(AirMod)  # 不打开UART，只用解析部分
+    airmod._init_parser(64)
+    record = airmod.record
+    last = [record.version]
+
+    def record_path():
+        airmod._compact()
+        end = airmod._end
+        airmod._mv[end:end + FRAME_LEN] = frame  # 相当于readinto写进缓冲区尾部
+        airmod._end = end + FRAME_LEN
+        airmod._parse()
+        if record.version != last[0]:
+            last[0] = record.version
+            record.store(state)
+
+    measure("reference", reference_path)
+    expected = dict(state)
+    measure("record", record_path)
+    for key, value in expected.items():
+        assert abs(state[key] - value) < 1e-6, key
+    assert airmod.checksum_errors == 0 and airmod.resyncs == 0
+
+
+main()
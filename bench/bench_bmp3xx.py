@@ -0,0 +1,29 @@
+# -*- coding: utf-8 -*-
+"""
+BMP3XX._compensate_data 的耗时对比
+参考实现是原来带 ** 的浮点版本，精度检查见 check_bmp3xx.py
+
+    python bench/bench_bmp3xx.py
+"""
+import _compat  # noqa: F401
+
+from _compat import ticks_us
+from check_bmp3xx import make_samples, make_sensor, reference_compensate
+
+
+def bench(name, fn, samples):
+    start = ticks_us()
+    for adc_p, adc_t in samples:
+        fn(adc_p, adc_t)
+    print("%-14s %8.2f us/op" % (name, (ticks_us() - start) / len(samples)))
+
+
+def main():
+    sensor = make_sensor()
+    samples = make_samples()
+    calib = sensor._data_calib
+    bench("reference", lambda p, t: reference_compensate(calib, p, t), samples)
+    bench("horner", sensor._compensate_data, samples)
+
+
+main()
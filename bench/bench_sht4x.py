@@ -0,0 +1,68 @@
+# -*- coding: utf-8 -*-
+"""
+SHT4X 每次测量的CRC校验耗时：原来逐位计算加切片，对比查表/viper原地校验
+
+    python bench/bench_sht4x.py
+    micropython bench/bench_sht4x.py
+"""
+import _compat  # noqa: F401
+
+from _compat import ticks_us
+import sht4x
+
+N = 5000
+
+
+def reference_crc(buffer):
+    """原来的实现"""
+    crc = 0xFF
+    for byte in buffer:
+        crc ^= byte
+        for _ in range(8):
+            if crc & 0x80:
+                crc = (crc << 1) ^ 0x31
+            else:
+                crc = crc << 1
+    return crc & 0xFF
+
+
+def make_measurement(t_raw, rh_raw):
+    data = bytearray(6)
+    data[0], data[1] = t_raw >> 8, t_raw & 0xFF
+    data[2] = reference_crc(data[0:2])
+    data[3], data[4] = rh_raw >> 8, rh_raw & 0xFF
+    data[5] = reference_crc(data[3:5])
+    return data
+
+
+def measure(name, fn, data):
+    start = ticks_us()
+    for _ in range(N):
+        fn(data)
+    us = (ticks_us() - start) / N
+    print("%-12s %8.2f us/measurement" % (name, us))
+
+
+def main():
+    # 数据手册里的例子: 0xBEEF -> 0x92
+    assert reference_crc(b"\xbe\xef") == 0x92 and sht4x.SHT4X._crc(b"\xbe\xef") == 0x92
+    for t_raw, rh_raw in ((0x6666, 0x5A5A), (0x0000, 0xFFFF), (0xBEEF, 0x1234)):
+        data = make_measurement(t_raw, rh_raw)
+        assert sht4x._check_crc(data, sht4x._CRC_TABLE)
+        data[5] ^= 1
+        assert not sht4x._check_crc(data, sht4x._CRC_TABLE)
+
+    data = make_measurement(0x6666, 0x5A5A)
+
+    def reference_path(data):
+        return reference_crc(memoryview(data[0:2])) == data[2] and reference_crc(memoryview(data[3:5])) == data[5]
+
+    def table_path(data):
+        return sht4x._check_crc(data, sht4x._CRC_TABLE)
+
+    print("viper" if type(sht4x._check_crc) is not type(reference_crc) else "pure python", "check")
+    measure("reference", reference_path, data)
+    measure("table", table_path, data)
+
+
+main()
@@ -0,0 +1,79 @@
+# -*- coding: utf-8 -*-
+"""
+对比 json.dumps(sensor_state).encode() 和 StateSerializer 每次发送的耗时和内存分配
+
+    python bench/bench_state.py
+    micropython bench/bench_state.py
+"""
+import gc
+import json
+import sys
+import time
+
+sys.path.insert(0, __file__.rsplit("/", 2)[0] if "/" in __file__ else "..")
+
+from state import StateSerializer
+
+try:
+    import tracemalloc
+except ImportError:  # micropython
+    tracemalloc = None
+
+STATE = {
+    "temperature": 23.4, "humidity": 45.1, "voc": 12, "pm25": 8, "pm10": 11, "ch2o": 3, "co2": 612,
+    "light": 152.83714, "uv": 0.0371, "pressure": 97.12345, "pressure_temperature": 24.81,
+    "ip_address": "192.168.0.101", "ssid": "home-2.4G", "essid": "home-2.4G",
+    "mac_address": "A0B765C3D2E1", "dns_address": "192.168.0.1", "txpower": 20,
+    "flash_size": 4194304, "raw_temperature": 48.3, "flash_available": 1818624, "free_memory": 83456,
+    "uvs_resolution": "20", "uvs_rate": "500ms", "uvs_gain": "18", "uvs_sensitivity_max": 1400,
+    "Wfac": 1.0, "altitude": 280.0,
+}
+STATE_TOPIC = "homeassistant/device/a0b765c3d2e1/state"
+N = 2000
+
+
+def _ticks():
+    if hasattr(time, "perf_counter_ns"):
+        return time.perf_counter_ns() // 1000
+    return time.ticks_us()
+
+
+def measure(name, fn):
+    fn()  # warm up caches
+    gc.collect()
+    if tracemalloc is not None:
+        tracemalloc.start()
+        tracemalloc.reset_peak()
+        before = tracemalloc.get_traced_memory()[0]
+        fn()
+        peak = tracemalloc.get_traced_memory()[1] - before
+        tracemalloc.stop()
+        alloc = "peak %d B" % peak
+    else:
+        gc.disable()
+        before = gc.mem_alloc()
+        fn()
+        alloc = "%d B" % (gc.mem_alloc() - before)
+        gc.enable()
+    start = _ticks()
+    for _ in range(N):
+        fn()
+    us = (_ticks() - start) / N
+    print("%-16s %8.2f us/publish   %s/publish" % (name, us, alloc))
+
+
+def main():
+    serializer = StateSerializer(tuple(STATE), {"pressure": 3})
+    topic = STATE_TOPIC.encode()
+
+    def json_path():
+        return STATE_TOPIC.encode(), json.dumps(STATE).encode()
+
+    def serializer_path():
+        return topic, serializer.serialize(STATE)
+
+    measure("json.dumps", json_path)
+    measure("StateSerializer", serializer_path)
+
+
+main()
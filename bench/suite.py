@@ -0,0 +1,360 @@
+# -*- coding: utf-8 -*-
+"""
+驱动解码和发布热路径的benchmark，和保存的基线比较，内存分配超过容差就返回非0
+
+    python bench/suite.py                    # 运行并和 bench/baseline.json 比较
+    python bench/suite.py --save             # 把这次的结果写成新的基线
+    python bench/suite.py --tolerance 0.5    # 内存允许比基线多50%
+    python bench/suite.py airmod sht4x       # 只跑名字以这些前缀开头的项目
+    micropython bench/suite.py               # 依赖machine/main的项目在unix port上会跳过
+
+每一项输出 ns/op、第二列和 bytes/op：
+MicroPython上关掉gc之后用 gc.mem_alloc() 的增量计算，第二列是bytes/16，只是按GC块大小折算，不是分配次数；
+CPython上 bytes 是 tracemalloc 在一次调用中的峰值，第二列(live blks)是调用前后两次快照之间新增、调用结束时还活着的块数，
+中途已经释放的临时对象不计
+只有内存超过基线才算回归；耗时和机器负载有关，只在超过容差时标出来，不影响返回值
+基线按解释器分开保存，换机器之后先用 --save 重新生成
+"""
+import _compat  # noqa: F401
+import gc
+import json
+import sys
+import time
+
+try:
+    import tracemalloc
+except ImportError:  # micropython
+    tracemalloc = None
+
+_HERE = __file__.rsplit("/", 1)[0] if "/" in __file__ else "."
+BASELINE = _HERE + "/baseline.json"
+IMPL = sys.implementation.name
+GC_BLOCK = 16
+
+
+def _ns():
+    if hasattr(time, "perf_counter_ns"):
+        return time.perf_counter_ns()
+    return time.ticks_us() * 1000
+
+
+def _elapsed_ns(start):
+    if hasattr(time, "perf_counter_ns"):
+        return time.perf_counter_ns() - start
+    return time.ticks_diff(time.ticks_us() * 1000, start)
+
+
+def run_sync(coro):
+    """执行一个不会真正挂起的协程，省掉事件循环的开销"""
+    try:
+        while True:
+            coro.send(None)
+    except StopIteration as e:
+        return e.value
+
+
+def _live_blocks(snapshot, before):
+    """两次tracemalloc快照之间新增的块数，不算tracemalloc自己的分配"""
+    ignore = (tracemalloc.Filter(False, tracemalloc.__file__),)
+    stats = snapshot.filter_traces(ignore).compare_to(before.filter_traces(ignore), "lineno")
+    return sum(stat.count_diff for stat in stats if stat.count_diff > 0)
+
+
+def measure(fn, n):
+    """返回 (ns/op, 第二列, bytes/op)，第二列的含义见模块说明"""
+    fn()  # 预热缓存
+    gc.collect()
+    if tracemalloc is not None:
+        tracemalloc.start()
+        before = tracemalloc.get_traced_memory()[0]
+        tracemalloc.reset_peak()
+        fn()
+        nbytes = tracemalloc.get_traced_memory()[1] - before
+        # 再调用一次数块数，快照之间除了被测函数之外不做别的事
+        before_snapshot = tracemalloc.take_snapshot()
+        result = fn()
+        after_snapshot = tracemalloc.take_snapshot()
+        tracemalloc.stop()
+        blocks = _live_blocks(after_snapshot, before_snapshot)
+        del result, before_snapshot, after_snapshot
+    else:
+        rounds = 50
+        gc.disable()
+        before = gc.mem_alloc()
+        for _ in range(rounds):
+            fn()
+        nbytes = (gc.mem_alloc() - before) / rounds
+        gc.enable()
+        blocks = nbytes / GC_BLOCK
+    gc.collect()
+    start = _ns()
+    for _ in range(n):
+        fn()
+    return _elapsed_ns(start) / n, blocks, nbytes
+
+
+# 各个benchmark的准备函数，返回无参数的被测函数
+
+def setup_airmod():
+    from airmod001 import AirMod, FRAME_LEN
+
+    frame = bytearray([0x3C, 0x02, 0x02, 0x64, 0x00, 0x05, 0x00, 0x0C, 0x00, 0x08, 0x00, 0x0B, 0x17, 0x04, 0x2D, 0x01])
+    frame.append(sum(frame) & 0xFF)
+    airmod = AirMod.__new__(AirMod)  # 不打开UART，只用解析部分
+    airmod._init_parser(64)
+    record = airmod.record
+    state = {}
+
+    def decode():
+        airmod._compact()
+        end = airmod._end
+        airmod._mv[end:end + FRAME_LEN] = frame
+        airmod._end = end + FRAME_LEN
+        airmod._parse()
+        record.store(state)
+
+    return decode
+
+
+def _bmp():
+    from bmp3xx import BMP3XX
+
+    calib = bytes([0x1E, 0x6B, 0xE4, 0x48, 0xF6, 0x8C, 0xFC, 0x1E, 0x03, 0x1A, 0x00,
+                   0x23, 0x4A, 0xA6, 0x74, 0x03, 0xFA, 0x0E, 0x0B, 0x0D, 0x00])
+
+    class FakeBMP(BMP3XX):
+        def _read_reg(self, reg, length):
+            return calib[:length]
+
+    sensor = FakeBMP()
+    sensor._get_coefficients()
+    return sensor
+
+
+def setup_bmp3xx_float():
+    sensor = _bmp()
+    return lambda: sensor._compensate_data(8388608, 8480000)
+
+
+class _LTRBus:
+    """只回放固定寄存器值的I2C，测的是驱动本身而不是总线"""
+
+    def __init__(self):
+        self.regs = bytearray(256)
+        self.regs[0x06] = 0xB2
+        self.regs[0x07] = 0x08
+        self.regs[0x0D:0x10] = (2400).to_bytes(3, "little")
+        self.regs[0x10:0x13] = (120).to_bytes(3, "little")
+
+    def readfrom_mem(self, addr, reg, nbytes):
+        return bytes(self.regs[reg:reg + nbytes])
+
+    def writeto_mem(self, addr, reg, buf):
+        pass
+
+
+def _ltr390():
+    import ltr390
+
+    _sleep_ms = time.sleep_ms
+    time.sleep_ms = lambda ms: None  # 初始化里的阻塞等待和benchmark无关
+    try:
+        sensor = ltr390.LTR390(_LTRBus(), ltr390.LTR390.GAIN_18)
+    finally:
+        time.sleep_ms = _sleep_ms
+    sensor._settle = lambda ms: None  # 不等模式切换，只测读取和换算
+    return sensor
+
+
+def setup_ltr390_uvs():
+    sensor = _ltr390()
+    return lambda: run_sync(sensor.read_uvs())
+
+
+def setup_ltr390_als():
+    sensor = _ltr390()
+    return lambda: run_sync(sensor.read_als())
+
+
+def setup_sht4x_check():
+    import sht4x
+
+    data = bytearray((0x66, 0x66, 0x93, 0x5A, 0x5A, 0x00))
+    data[5] = sht4x.SHT4X._crc(data[3:5])
+    data[2] = sht4x.SHT4X._crc(data[0:2])
+    table = sht4x._CRC_TABLE
+    check = sht4x._check_crc
+    return lambda: check(data, table)
+
+
+def setup_sht4x_crc():
+    import sht4x
+
+    word = bytearray(b"\xbe\xef")
+    return lambda: sht4x.SHT4X._crc(word)
+
+
+_main = None
+
+STATE = {
+    "temperature": 23.4, "humidity": 45.1, "voc": 12, "pm25": 8, "pm10": 11, "ch2o": 3, "co2": 612,
+    "light": 152.83714, "uv": 0.0371, "pressure": 97.12345, "pressure_temperature": 24.81,
+    "ip_address": "192.168.0.101", "ssid": "home-2.4G", "essid": "home-2.4G",
+    "mac_address": b"A0B765C3D2E1", "dns_address": "192.168.0.1", "txpower": 20,
+    "flash_size": 4194304, "raw_temperature": 48.3, "flash_available": 1818624, "free_memory": 83456,
+    "uvs_resolution": "20", "uvs_rate": "500ms", "uvs_gain": "18", "uvs_sensitivity_max": 1400,
+    "Wfac": 1.0, "altitude": 280.0,
+}
+
+
+class _Client:
+    """什么都不发送的MQTT客户端，只保留publish_data用到的接口"""
+
+    def __init__(self, sta_if):
+        self._sta_if = sta_if
+
+    def isconnected(self):
+        return True
+
+    async def publish(self, topic, msg, retain=False, qos=0, properties=None):
+        pass
+
+
+def _load_main():
+    """在模拟环境里import main，不启动事件循环"""
+    global _main
+    if _main is None:
+        import os
+        from sim.run import load_main
+
+        cwd = os.getcwd()
+        try:
+            _main = load_main({"publish_mode": "delta"})
+        finally:
+            os.chdir(cwd)
+        _main.sensor_state.update(STATE)
+    return _main
+
+
+def setup_wifi_data():
+    main = _load_main()
+    client = main.client
+    return lambda: main.get_wifi_data(client)
+
+
+def _publish_cycle(main, client):
+    """一个发布周期：调度器里的publish_data登记发送，send_state取出状态发送"""
+    run_sync(main.publish_data(client))
+    payload = main.next_state()
+    if payload is not None:
+        run_sync(client.publish(main.state_topic_b, payload, qos=1))
+
+
+def setup_publish_full():
+    main = _load_main()
+    client = _Client(main.client._sta_if)
+
+    def publish():
+        main.netconfig["publish_mode"] = "full"
+        _publish_cycle(main, client)
+
+    return publish
+
+
+def setup_publish_delta():
+    main = _load_main()
+    client = _Client(main.client._sta_if)
+    main.netconfig["publish_mode"] = "delta"
+    main.tracker.reset()
+    _publish_cycle(main, client)  # 第一次是完整状态
+    state = main.sensor_state
+    flip = [0]
+
+    def publish():
+        main.netconfig["publish_mode"] = "delta"
+        flip[0] ^= 1
+        state["temperature"] = 23.4 + flip[0]  # 每次一个键超过死区
+        _publish_cycle(main, client)
+
+    return publish
+
+
+# (名字, 准备函数, 循环次数)
+BENCHMARKS = (
+    ("airmod_decode", setup_airmod, 5000),
+    ("bmp3xx_compensate", setup_bmp3xx_float, 5000),
+    ("ltr390_read_uvs", setup_ltr390_uvs, 2000),
+    ("ltr390_read_als", setup_ltr390_als, 2000),
+    ("sht4x_check_crc", setup_sht4x_check, 20000),
+    ("sht4x_crc", setup_sht4x_crc, 20000),
+    ("get_wifi_data", setup_wifi_data, 5000),
+    ("publish_full", setup_publish_full, 2000),
+    ("publish_delta", setup_publish_delta, 2000),
+)
+
+
+def load_baseline():
+    try:
+        with open(BASELINE) as f:
+            return json.load(f)
+    except (OSError, ValueError):
+        return {}
+
+
+def main():
+    args = sys.argv[1:]
+    save = "--save" in args
+    tolerance = 0.25
+    prefixes = []
+    i = 0
+    while i < len(args):
+        if args[i] == "--tolerance":
+            tolerance = float(args[i + 1])
+            i += 1
+        elif not args[i].startswith("--"):
+            prefixes.append(args[i])
+        i += 1
+
+    baseline = load_baseline()
+    base = baseline.get(IMPL, {})
+    results = {}
+    failures = []
+    print("%-24s %12s %10s %10s   %s" % (
+        "benchmark", "ns/op", "live blks" if tracemalloc is not None else "bytes/16", "bytes/op", "vs baseline"))
+    for name, setup, n in BENCHMARKS:
+        if prefixes and not any(name.startswith(p) for p in prefixes):
+            continue
+        try:
+            fn = setup()
+        except ImportError as e:
+            print("%-24s skipped (%s)" % (name, e))
+            continue
+        ns, blocks, nbytes = measure(fn, n)
+        results[name] = {"ns": round(ns, 1), "bytes": round(nbytes, 1)}
+        note = ""
+        ref = base.get(name)
+        if ref is not None:
+            ratio = ns / ref["ns"] if ref["ns"] else 1.0
+            note = "%+.0f%% time" % ((ratio - 1) * 100)
+            if ratio > 1 + tolerance:
+                note += " (slower, advisory)"
+            if nbytes > ref["bytes"] * (1 + tolerance) + GC_BLOCK:
+                failures.append("%s: %.1f bytes/op, baseline %.1f" % (name, nbytes, ref["bytes"]))
+                note += " ALLOC REGRESSION"
+        print("%-24s %12.1f %10.1f %10.1f   %s" % (name, ns, blocks, nbytes, note))
+
+    if save:
+        baseline.setdefault(IMPL, {}).update(results)
+        with open(BASELINE, "w") as f:
+            json.dump(baseline, f, indent=1, sort_keys=True)
+        print("baseline saved to %s" % BASELINE)
+        return 0
+    if failures:
+        print("allocation regressions (tolerance %d%%):" % (tolerance * 100))
+        for failure in failures:
+            print("  " + failure)
+        return 1
+    return 0
+
+
+sys.exit(main())
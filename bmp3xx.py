@@ -1,6 +1,8 @@
 # -*- coding: utf-8 -*-
 
+import asyncio
 import utime
+from array import array
 from machine import I2C, Pin
 from micropython import const
 
@@ -177,6 +179,14 @@ class BMP3XX:
     # Immediate data
     ## The byte length of each data in a frame of FIFO data is 3
     BMP3XX_FIFO_DATA_FRAME_LENGTH = const(7)
+    ## FIFO empty frame header, returned when reading past the end of the FIFO
+    BMP3_FIFO_EMPTY_FRAME = const(0x80)
+    ## FIFO buffer size in bytes
+    BMP3XX_FIFO_SIZE = const(512)
+    ## Extra bytes read after the FIFO content so the trailing sensor time frame is included
+    BMP3XX_FIFO_SENSORTIME_OVERHEAD = const(4)
+    ## Maximum number of pressure frames that fit in the FIFO (4-byte pressure-only frames)
+    BMP3XX_FIFO_MAX_FRAMES = const(128)
     ## Standard sea level pressure, unit: pa
     STANDARD_SEA_LEVEL_PRESSURE_PA = const(101325)
 
@@ -187,6 +197,25 @@ class BMP3XX:
         # Sea level pressure in Pa.
         self.sea_level_pressure = BMP3XX.STANDARD_SEA_LEVEL_PRESSURE_PA
         self._debug = debug
+        # Reusable buffer for the 6-byte pressure/temperature burst read
+        self._data_buf = bytearray(6)
+        # FIFO drain buffers, allocated on first use
+        self._fifo_buf = None
+        self._fifo_mv = None
+        self.fifo_pressure = None
+        self.fifo_temperature = None
+        self.fifo_sensor_time = 0
+        self.fifo_errors = 0
+        # Held across the async sequences (forced measurement, power mode and FIFO changes);
+        # code outside the driver takes it too before touching the sensor
+        self.lock = asyncio.Lock()
+        # Last raw temperature seen, pressure-only FIFO frames are compensated with it
+        self._last_adc_t = 0
+        self._int_flag = None
+        # Shadow of the power mode and OSR register, the forced-mode path needs both
+        # without a bus read. OSR reset value is 0x02 (pressure x4, temperature x1)
+        self._power_mode = BMP3XX.SLEEP_MODE
+        self._osr = 0x02
 
     def dprint(self, *args, **kwargs):
         if self._debug:
@@ -253,6 +282,22 @@ class BMP3XX:
         # see https://www.weather.gov/media/epz/wxcalc/pressureAltitude.pdf
         return 44307.7 * (1 - (self.pressure / BMP3XX.STANDARD_SEA_LEVEL_PRESSURE_PA) ** 0.190284)
 
+    def measure(self):
+        """!
+          @brief Read pressure, temperature and altitude from one conversion
+          @details One 6-byte burst read into a preallocated buffer and one compensation,
+          @n       instead of a bus transaction and compensation per property
+          @return Return (pressure, temperature, altitude), unit: Pa, °C, m
+        """
+        data = self._data_buf
+        self._read_reg_into(BMP3XX.BMP3XX_P_DATA_PA, data)
+        adc_p = data[2] << 16 | data[1] << 8 | data[0]
+        adc_t = data[5] << 16 | data[4] << 8 | data[3]
+        self._last_adc_t = adc_t
+        pressure, temperature = self._compensate_data(adc_p, adc_t)
+        altitude = 44307.7 * (1 - (pressure / BMP3XX.STANDARD_SEA_LEVEL_PRESSURE_PA) ** 0.190284)
+        return pressure, temperature, altitude
+
     def set_power_mode(self, mode):
         """!
           @brief Configure measurement mode and power mode
@@ -275,6 +320,59 @@ class BMP3XX:
                 utime.sleep_ms(20)
             self._write_reg(BMP3XX.BMP3XX_PWR_CTRL, (mode & 0x30) | 0x03)
             utime.sleep_ms(20)
+        self._power_mode = mode & 0x30
+
+    async def set_power_mode_async(self, mode):
+        """!
+          @brief Same as set_power_mode, but waits with asyncio.sleep_ms so the event loop keeps running
+          @param mode SLEEP_MODE, FORCED_MODE or NORMAL_MODE
+        """
+        async with self.lock:
+            temp = self._read_reg(BMP3XX.BMP3XX_PWR_CTRL, 1)[0]
+            if (mode | 0x03) == temp:
+                self.dprint("Same configuration as before!")
+            else:
+                if mode != BMP3XX.SLEEP_MODE:
+                    self._write_reg(BMP3XX.BMP3XX_PWR_CTRL, (BMP3XX.SLEEP_MODE & 0x30) | 0x03)
+                    await asyncio.sleep_ms(20)
+                self._write_reg(BMP3XX.BMP3XX_PWR_CTRL, (mode & 0x30) | 0x03)
+                await asyncio.sleep_ms(20)
+            self._power_mode = mode & 0x30
+
+    def conversion_time_us(self):
+        """!
+          @brief Typical duration of one pressure + temperature conversion with the current oversampling
+          @details T_conv = 234 + (392 + 2^osr_p * 2020) + (163 + 2^osr_t * 2020) us, see datasheet 3.9.2
+          @return Conversion time, unit: us
+        """
+        osr_p = self._osr & 0x07
+        osr_t = (self._osr >> 3) & 0x07
+        return 234 + 392 + (2020 << osr_p) + 163 + (2020 << osr_t)
+
+    async def measure_forced(self, timeout_ms=100):
+        """!
+          @brief Trigger one forced-mode conversion and return its result
+          @details The sensor converts once and goes back to sleep by itself, so it only draws
+          @n       measurement current when a value is actually needed. The task sleeps for the
+          @n       calculated conversion time, then polls the data-ready bits in STATUS.
+          @param timeout_ms Give up polling after this many ms past the expected conversion time
+          @return Return (pressure, temperature, altitude), unit: Pa, °C, m
+          @exception OSError The data-ready bits were not set in time
+        """
+        async with self.lock:
+            if self._power_mode == BMP3XX.NORMAL_MODE:
+                # normal -> forced has to go through sleep mode
+                self._write_reg(BMP3XX.BMP3XX_PWR_CTRL, (BMP3XX.SLEEP_MODE & 0x30) | 0x03)
+                self._power_mode = BMP3XX.SLEEP_MODE
+            self._write_reg(BMP3XX.BMP3XX_PWR_CTRL, BMP3XX.FORCED_MODE | 0x03)
+            await asyncio.sleep_ms(self.conversion_time_us() // 1000 + 1)
+            deadline = utime.ticks_add(utime.ticks_ms(), timeout_ms)
+            # drdy_press (bit 5) and drdy_temp (bit 6), cleared when the data registers are read
+            while self._read_reg(BMP3XX.BMP3XX_STATUS, 1)[0] & 0x60 != 0x60:
+                if utime.ticks_diff(deadline, utime.ticks_ms()) <= 0:
+                    raise OSError("BMP3XX forced conversion timeout")
+                await asyncio.sleep_ms(1)
+            return self.measure()
 
     def enable_fifo(self, mode):
         """!
@@ -293,6 +391,16 @@ class BMP3XX:
             self._write_reg(BMP3XX.BMP3XX_FIFO_CONF_2, 0x0C)
         utime.sleep_ms(20)
 
+    async def enable_fifo_async(self, mode):
+        """!
+          @brief Same as enable_fifo, but waits with asyncio.sleep_ms so the event loop keeps running
+          @param mode True: Enable FIFO, False: Disable FIFO
+        """
+        async with self.lock:
+            self._write_reg(BMP3XX.BMP3XX_FIFO_CONF_1, 0x1D if mode else 0x1C)
+            self._write_reg(BMP3XX.BMP3XX_FIFO_CONF_2, 0x0C)
+            await asyncio.sleep_ms(20)
+
     def set_oversampling(self, press_osr_set, temp_osr_set):
         """!
           @brief Configure the oversampling when measuring pressure and temperature (OSR:over-sampling register)
@@ -312,7 +420,8 @@ class BMP3XX:
           @n       BMP3XX_TEMP_OSR_SETTINGS[4], Temperature sampling×16, 20 bit / 0.0003 °C
           @n       BMP3XX_TEMP_OSR_SETTINGS[5], Temperature sampling×32, 21 bit / 0.00015 °C
         """
-        self._write_reg(BMP3XX.BMP3XX_OSR, (press_osr_set | temp_osr_set) & 0x3F)
+        self._osr = (press_osr_set | temp_osr_set) & 0x3F
+        self._write_reg(BMP3XX.BMP3XX_OSR, self._osr)
 
     def filter_coefficient(self, iir_config_coef):
         """!
@@ -447,6 +556,8 @@ class BMP3XX:
     def _get_coefficients(self):
         """!
           @brief Get the calibration data in the NVM register of the sensor
+          @details The coefficients are also stored as separate attributes so _compensate_data
+          @n       does not unpack a 14-tuple on every call
         """
         calib = self._read_reg(BMP3XX.BMP3XX_CALIB_DATA, 21)
         self._data_calib = (
@@ -465,37 +576,30 @@ class BMP3XX:
             self._uint8_to_int(calib[19]) / 2 ** 48.0,  # P10
             self._uint8_to_int(calib[20]) / 2 ** 65.0,  # P11
         )
+        (self._t1, self._t2, self._t3, self._p1, self._p2, self._p3, self._p4, self._p5, self._p6, self._p7,
+         self._p8, self._p9, self._p10, self._p11) = self._data_calib
 
     def _compensate_data(self, adc_p, adc_t):
         """!
           @brief Use the obtained calibration data to calibrate and compensate the original value of the measured data
+          @details The datasheet polynomials evaluated with Horner's scheme, no float pow
           @param adc_p the variable for storing pressure measured data
           @param adc_t the variable for storing temperature measured data
           @note Temperature unit: °C; Pressure unit: Pa
           @return Return the calibrated pressure data and the calibrated temperature data
         """
         # datasheet, p28, Trimming Coefficient listing in register map with size and sign attributes
-        t1, t2, t3, p1, p2, p3, p4, p5, p6, p7, p8, p9, p10, p11 = self._data_calib
-
-        # Temperature compensation
-        pd1 = adc_t - t1
-        pd2 = pd1 * t2
-        temperature = pd2 + (pd1 * pd1) * t3
-
-        # Pressure compensation
-        pd1 = p6 * temperature
-        pd2 = p7 * temperature ** 2.0
-        pd3 = p8 * temperature ** 3.0
-        po1 = p5 + pd1 + pd2 + pd3
-        pd1 = p2 * temperature
-        pd2 = p3 * temperature ** 2.0
-        pd3 = p4 * temperature ** 3.0
-        po2 = adc_p * (p1 + pd1 + pd2 + pd3)
-        pd1 = adc_p ** 2.0
-        pd2 = p9 + p10 * temperature
-        pd3 = pd1 * pd2
-        pd4 = pd3 + p11 * adc_p ** 3.0
-        pressure = po1 + po2 + pd4  # - self.sea_level_pressure + STANDARD_SEA_LEVEL_PRESSURE_PA
+        # Temperature compensation: T = pd1 * t2 + pd1^2 * t3
+        pd1 = adc_t - self._t1
+        temperature = pd1 * (self._t2 + pd1 * self._t3)
+
+        # Pressure compensation:
+        # offset      = p5 + p6*T + p7*T^2 + p8*T^3
+        # sensitivity = p1 + p2*T + p3*T^2 + p4*T^3
+        # P = offset + adc_p * sensitivity + adc_p^2 * (p9 + p10*T) + adc_p^3 * p11
+        offset = self._p5 + temperature * (self._p6 + temperature * (self._p7 + temperature * self._p8))
+        sensitivity = self._p1 + temperature * (self._p2 + temperature * (self._p3 + temperature * self._p4))
+        pressure = offset + adc_p * (sensitivity + adc_p * (self._p9 + self._p10 * temperature + adc_p * self._p11))
         return round(pressure, 2), round(temperature, 2)
 
     def _get_reg_temp_press_data(self):
@@ -506,7 +610,7 @@ class BMP3XX:
         data = self._read_reg(BMP3XX.BMP3XX_P_DATA_PA, 6)
         adc_p = data[2] << 16 | data[1] << 8 | data[0]
         adc_t = data[5] << 16 | data[4] << 8 | data[3]
-
+        self._last_adc_t = adc_t
         return adc_p, adc_t
 
     def get_fifo_temp_press_data(self):
@@ -536,6 +640,89 @@ class BMP3XX:
 
         return adc_p, adc_t
 
+    def drain_fifo(self):
+        """!
+          @brief Read the whole FIFO fill level in one burst and decode all frames
+          @details Pressure frames are compensated into self.fifo_pressure / self.fifo_temperature
+          @n       (array('f'), reused between calls). Temperature-only frames update the temperature
+          @n       used for the following pressure-only frames; before the first one, the last temperature
+          @n       read from the sensor (FIFO or data registers) is used, so a pressure-only FIFO still
+          @n       decodes. The sensor time frame is stored in self.fifo_sensor_time, config change and
+          @n       error frames are counted in self.fifo_errors. Samples beyond the array length are dropped.
+          @return Number of samples written to fifo_pressure / fifo_temperature
+          @n      Temperature unit: °C; Pressure unit: Pa
+        """
+        if self._fifo_buf is None:
+            self._fifo_buf = bytearray(BMP3XX.BMP3XX_FIFO_SIZE + BMP3XX.BMP3XX_FIFO_SENSORTIME_OVERHEAD)
+            self._fifo_mv = memoryview(self._fifo_buf)
+            self.fifo_pressure = array('f', bytes(4 * BMP3XX.BMP3XX_FIFO_MAX_FRAMES))
+            self.fifo_temperature = array('f', bytes(4 * BMP3XX.BMP3XX_FIFO_MAX_FRAMES))
+        length = self.get_fifo_length()
+        if length == 0:
+            return 0
+        length = min(length + BMP3XX.BMP3XX_FIFO_SENSORTIME_OVERHEAD, len(self._fifo_buf))
+        data = self._fifo_mv[:length]
+        self._read_reg_into(BMP3XX.BMP3XX_FIFO_DATA, data)
+        pressure = self.fifo_pressure
+        temperature = self.fifo_temperature
+        frames = len(pressure)  # 512 bytes of 4-byte pressure frames plus overhead is more than 128
+        count = 0
+        adc_t = self._last_adc_t
+        i = 0
+        while i < length and count < frames:
+            header = data[i]
+            if header == BMP3XX.BMP3_FIFO_TEMP_PRESS_FRAME:
+                if i + 7 > length:
+                    break
+                adc_t = data[i + 3] << 16 | data[i + 2] << 8 | data[i + 1]
+                adc_p = data[i + 6] << 16 | data[i + 5] << 8 | data[i + 4]
+                pressure[count], temperature[count] = self._compensate_data(adc_p, adc_t)
+                count += 1
+                i += 7
+            elif header == BMP3XX.BMP3_FIFO_PRESS_FRAME:
+                if i + 4 > length:
+                    break
+                if adc_t:  # pressure compensation needs a temperature reading
+                    adc_p = data[i + 3] << 16 | data[i + 2] << 8 | data[i + 1]
+                    pressure[count], temperature[count] = self._compensate_data(adc_p, adc_t)
+                    count += 1
+                i += 4
+            elif header == BMP3XX.BMP3_FIFO_TEMP_FRAME:
+                if i + 4 > length:
+                    break
+                adc_t = data[i + 3] << 16 | data[i + 2] << 8 | data[i + 1]
+                i += 4
+            elif header == BMP3XX.BMP3_FIFO_TIME_FRAME:
+                if i + 4 > length:
+                    break
+                self.fifo_sensor_time = data[i + 3] << 16 | data[i + 2] << 8 | data[i + 1]
+                i += 4
+            elif header == BMP3XX.BMP3_FIFO_CONFIG_CHANGE or header == BMP3XX.BMP3_FIFO_ERROR_FRAME:
+                self.fifo_errors += 1
+                self.dprint("FIFO config change!!!" if header == BMP3XX.BMP3_FIFO_CONFIG_CHANGE else "FIFO ERROR!!!")
+                i += 2
+            else:  # empty frame or garbage, nothing more to parse
+                break
+        self._last_adc_t = adc_t
+        return count
+
+    def attach_int(self, pin):
+        """!
+          @brief Wake a waiting task on the sensor INT pin (active high, as configured by the enable_*_int methods)
+          @param pin INT pin number
+        """
+        self._int_flag = asyncio.ThreadSafeFlag()
+        self._int_pin = Pin(pin, Pin.IN)
+        self._int_pin.irq(lambda p: self._int_flag.set(), Pin.IRQ_RISING)
+
+    async def wait_int(self):
+        """!
+          @brief Wait for the next interrupt, e.g. the FIFO watermark, then clear INT_STATUS
+          @return INT_STATUS register value
+        """
+        await self._int_flag.wait()
+        return self._read_reg(BMP3XX.BMP3XX_INT_STATUS, 1)[0]
+
     def get_fifo_length(self):
         """!
           @brief Get FIFO cached data size
@@ -556,6 +743,8 @@ class BMP3XX:
           @brief Reset and restart the sensor, restoring the sensor configuration to the default configuration
         """
         self._write_reg(BMP3XX.BMP3XX_CMD, BMP3XX.BMP3XX_CMD_RESET)
+        self._power_mode = BMP3XX.SLEEP_MODE
+        self._osr = 0x02
 
     def _write_reg(self, reg, data):
         """!
@@ -576,6 +765,15 @@ class BMP3XX:
         # Low level register writing, not implemented in base class
         raise NotImplementedError()
 
+    def _read_reg_into(self, reg, buf):
+        """!
+          @brief read len(buf) bytes from the register into buf
+          @param reg register address
+          @param buf buffer to fill
+        """
+        # Low level register reading, not implemented in base class
+        raise NotImplementedError()
+
 
 class BMP3XX_I2C(BMP3XX):
     """!
@@ -592,6 +790,8 @@ class BMP3XX_I2C(BMP3XX):
         self._addr = i2c_addr
         self.i2c = i2c
         super().__init__(debug)
+        if hasattr(i2c, "lock"):  # i2cbus.I2CBus, share the per-device lock
+            self.lock = i2c.lock(i2c_addr)
 
     def _write_reg(self, reg, data):
         """!
@@ -611,3 +811,11 @@ class BMP3XX_I2C(BMP3XX):
           @return read data list
         """
         return self.i2c.readfrom_mem(self._addr, reg, length)
+
+    def _read_reg_into(self, reg, buf):
+        """
+          @brief read len(buf) bytes from the register into buf
+          @param reg register address
+          @param buf buffer to fill
+        """
+        self.i2c.readfrom_mem_into(self._addr, reg, buf)
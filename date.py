@@ -5,53 +5,99 @@ DART高精度甲醛传感器
 from machine import Pin, UART
 import asyncio
 
-def calcchecksum(data: bytes) -> int:
-    """
-    计算校验和
-    :param data: 数据
-    :return: 校验和
-    """
-    return (0xFF ^ (sum(data) & 0xFF))+1
+from framering import FrameRing
 
-class Dart:
-    def __init__(self, id_: int, tx: int, rx: int):
+FRAME_LEN = 9
+_ACTIVE = 0x17  # 主动上传的帧
+_RESPONSE = 0x86  # 询问模式下的应答帧
+
+
+class Dart(FrameRing):
+    frame_len = FRAME_LEN
+
+    def __init__(self, id_: int, tx: int, rx: int, buffer_size: int = 32):
         self._uart = UART(id_, baudrate=9600, bits=8, stop=1, tx=tx, rx=rx, timeout=0)
         self._writer = asyncio.StreamWriter(self._uart, {}) # type: ignore
         self._reader = asyncio.StreamReader(self._uart) # type: ignore
         self.has_data = asyncio.Event()
         self.has_data.clear()
-        self.data = None
-        self.data_mg = None
+        self._response = asyncio.Event()  # 收到0x86应答时置位，query等待它
+        self._late = False  # 上一次query超时，它的应答可能还在路上
+        self._lock = asyncio.Lock()  # 同一时间只有一个query在等应答
+        self.data = None  # ppb
+        self.data_mg = None  # 询问模式下应答里的质量浓度(µg/m³)
         self.mode = 0 # 0主动 1询问
+        self._init_ring(buffer_size)
+        self.timeouts = 0
+        self.late_replies = 0  # 丢弃的迟到应答
         self._should_stop = False
         asyncio.create_task(self._reading_task())
 
-    async def _reading_task(self):
-        while not self._should_stop:
-            data = await self._reader.readexactly(9)
-            checksum = data[8]
-            if checksum != calcchecksum(data[1:8]):
-                print("Checksum error")
+    def _parse(self) -> int:
+        """
+        解析缓冲区里所有完整的帧
+        :return: 解析出的帧数
+        """
+        buf = self._buf
+        count = 0
+        while self._end - self._start >= FRAME_LEN:
+            i = self._start
+            kind = buf[i + 1]
+            if buf[i] != 0xFF or (kind != _ACTIVE and kind != _RESPONSE):
+                self._slide()
                 continue
-            if self.mode == 0:
-                assert data[0] == 0xFF and data[1] == 0x17 and data[2] == 0x04 and data[3] == 0x00
-                ch2o = int.from_bytes(data[4:6], byteorder='big')
-                full = int.from_bytes(data[6:8], byteorder='big')
-                assert full == 2000
-                self.data = ch2o
-                self.has_data.set()
+            checksum = 0
+            for k in range(i + 1, i + FRAME_LEN - 1):
+                checksum += buf[k]
+            if ((0xFF ^ (checksum & 0xFF)) + 1) & 0xFF != buf[i + FRAME_LEN - 1]:
+                self.checksum_errors += 1
+                self._slide()
+                continue
+            if kind == _ACTIVE:
+                # FF 17 04 00 浓度H 浓度L 满量程H 满量程L 校验
+                if buf[i + 2] != 0x04 or buf[i + 3] != 0x00:
+                    self._slide()
+                    continue
+                self.data = buf[i + 4] << 8 | buf[i + 5]
+            elif self._late:
+                # 应答里没有序号，超时之后收到的第一个应答算作上一次询问的，丢弃
+                self._late = False
+                self.late_replies += 1
             else:
-                assert data[0] == 0xFF and data[1] == 0x86
-                ch2o_mg = int.from_bytes(data[2:4], byteorder='big')
-                ch2o = int.from_bytes(data[6:8], byteorder='big')
-                self.data = ch2o
-                self.data_mg = ch2o_mg
-                self.has_data.set()
+                # FF 86 质量浓度H 质量浓度L 00 00 浓度H 浓度L 校验
+                self.data_mg = buf[i + 2] << 8 | buf[i + 3]
+                self.data = buf[i + 6] << 8 | buf[i + 7]
+                self._response.set()
+            self._synced = True
+            self._start += FRAME_LEN
+            count += 1
+        if self._start == self._end:
+            self._start = self._end = 0
+        return count
 
     async def request(self):
         self._writer.write(b'\xff\x01\x86\x00\x00\x00\x00\x00y')
         await self._writer.drain()
-        # await self.has_data.wait()
+
+    async def query(self, timeout=1):
+        """
+        询问一次浓度，等到对应的0x86应答才返回
+        超时的询问的应答如果迟到，会被丢弃而不是当成下一次询问的结果；应答彻底丢失时下一次询问多超时一次
+        :param timeout: 等待应答的秒数，超时抛出asyncio.TimeoutError
+        :return: (质量浓度µg/m³, 浓度ppb)
+        """
+        async with self._lock:
+            if self.mode != 1:
+                await self.ask_mode()
+            self._response.clear()
+            await self.request()
+            try:
+                await asyncio.wait_for(self._response.wait(), timeout)
+            except asyncio.TimeoutError:
+                self.timeouts += 1
+                self._late = True
+                raise
+            return self.data_mg, self.data
 
     async def ask_mode(self):
         """
@@ -73,4 +119,4 @@ class Dart:
 
     def deinit(self):
         self._should_stop = True
-        self._uart.deinit()
\ No newline at end of file
+        self._uart.deinit()
@@ -0,0 +1,173 @@
+# -*- coding: utf-8 -*-
+"""
+Copyright (c) 2008-2025 synodriver <diguohuangjiajinweijun@gmail.com>
+
+Home Assistant设备发现信息
+组件定义成紧凑的元组表，只在发布的时候逐段展开成JSON写进MQTT负载，不在内存里常驻一整个大dict
+"""
+import binascii
+import hashlib
+import json
+
+# (key, platform, device_class, unit, icon, name, category, extras)
+# key同时是组件id和状态JSON里的键；extras是额外字段((name, value), ...)
+COMPONENTS = (
+    ("temperature", "sensor", "temperature", "°C", None, None, None, None),
+    ("humidity", "sensor", "humidity", "%", None, None, None, None),
+    ("tvoc", "sensor", "volatile_organic_compounds", "µg/m³", None, None, None, None),
+    ("pm25", "sensor", "pm25", "µg/m³", None, None, None, None),
+    ("pm10", "sensor", "pm10", "µg/m³", None, None, None, None),
+    ("ch2o", "sensor", None, "µg/m³", "mdi:chemical-weapon", "甲醛", None, None),
+    ("co2", "sensor", "carbon_dioxide", "ppm", None, None, None, None),
+    ("light", "sensor", "illuminance", "lx", None, None, None, None),
+    ("uv", "sensor", None, "UV index", None, "紫外线指数", None, None),
+    ("pressure", "sensor", "pressure", "kPa", None, None, None, None),
+    ("pressure_temperature", "sensor", "temperature", "°C", None, "气压传感器内部温度", None,
+     (("enabled_by_default", False),)),
+    ("sht4x_temperature", "sensor", "temperature", "°C", None, "SHT4X温度", None, None),
+    ("sht4x_humidity", "sensor", "humidity", "%", None, "SHT4X湿度", None, None),
+
+    ("ip_address", "sensor", None, None, "mdi:ip", "IP地址", "diagnostic", None),
+    ("ssid", "sensor", None, None, "mdi:wifi", "SSID", "diagnostic", None),
+    ("essid", "sensor", None, None, "mdi:wifi", "ESSID", "diagnostic", None),
+    ("mac_address", "sensor", None, None, "mdi:wifi", "MAC", "diagnostic", None),
+    ("dns_address", "sensor", None, None, "mdi:dns", "DNS", "diagnostic", None),
+    ("txpower", "sensor", None, "dBm", "mdi:wifi", "发射功率", "diagnostic", None),
+    ("flash_size", "sensor", "data_size", "B", "mdi:file", "flash总大小", "diagnostic", None),
+    ("raw_temperature", "sensor", "temperature", "°C", "mdi:cpu-32-bit", "核心温度", "diagnostic", None),
+    ("flash_available", "sensor", "data_size", "B", "mdi:file-alert", "flash剩余空间", "diagnostic", None),
+    ("free_memory", "sensor", "data_size", "B", "mdi:memory", "剩余内存", "diagnostic", None),
+    ("i2c0_usage", "sensor", None, "%", "mdi:chip", "I2C0总线占用率", "diagnostic", None),
+    ("i2c1_usage", "sensor", None, "%", "mdi:chip", "I2C1总线占用率", "diagnostic", None),
+    ("i2c_errors", "sensor", None, None, "mdi:alert-circle", "I2C错误数", "diagnostic", None),
+    ("airmod_fps", "sensor", None, "fps", "mdi:speedometer", "空气模块帧率", "diagnostic", None),
+    ("airmod_resyncs", "sensor", None, None, "mdi:sync-alert", "空气模块重新同步次数", "diagnostic", None),
+    ("airmod_checksum_errors", "sensor", None, None, "mdi:alert-circle", "空气模块校验错误数", "diagnostic", None),
+    ("loop_lag_p50", "sensor", "duration", "ms", "mdi:timer-sand", "事件循环延迟p50", "diagnostic", None),
+    ("loop_lag_p99", "sensor", "duration", "ms", "mdi:timer-sand", "事件循环延迟p99", "diagnostic", None),
+    ("loop_lag_max", "sensor", "duration", "ms", "mdi:timer-sand", "事件循环最大延迟", "diagnostic", None),
+    ("task_step_p50", "sensor", "duration", "ms", "mdi:timer-outline", "任务单步耗时p50", "diagnostic", None),
+    ("task_step_p99", "sensor", "duration", "ms", "mdi:timer-outline", "任务单步耗时p99", "diagnostic", None),
+    ("task_step_max", "sensor", "duration", "ms", "mdi:timer-alert", "任务最长单步耗时", "diagnostic", None),
+    ("blocking_task", "sensor", None, None, "mdi:timer-alert", "阻塞事件循环最久的任务", "diagnostic", None),
+    ("heap_min_free", "sensor", "data_size", "B", "mdi:memory", "最低剩余内存", "diagnostic", None),
+    ("heap_largest_block", "sensor", "data_size", "B", "mdi:memory", "最大连续空闲块", "diagnostic", None),
+    ("cycle_alloc", "sensor", "data_size", "B", "mdi:memory-arrow-down", "每个发布周期分配的内存", "diagnostic", None),
+    ("cycle_alloc_max", "sensor", "data_size", "B", "mdi:memory-arrow-down", "单个发布周期最大分配量", "diagnostic",
+     None),
+
+    ("uvs_resolution", "select", None, None, "mdi:numeric", "紫外线传感器分辨率(位)", None,
+     (("options", ("20", "19", "18", "17", "16", "13")),)),  # option list must be List[str]
+    ("uvs_rate", "select", None, None, "mdi:numeric", "紫外线传感器测量速率", None,
+     (("options", ("25ms", "50ms", "100ms", "200ms", "500ms", "1000ms", "2000ms")),)),
+    ("uvs_gain", "select", None, None, "mdi:numeric", "紫外线传感器增益", None,
+     (("options", ("1", "3", "6", "9", "18")),)),
+    ("uvs_sensitivity_max", "number", None, None, "mdi:numeric", "紫外线传感器sensitivity_max", None,
+     (("min", 1), ("max", 10000), ("step", 1))),
+    ("Wfac", "number", None, None, "mdi:numeric", "紫外线传感器Wfac", None,
+     (("min", 1), ("max", 10), ("step", 0.01))),
+    ("altitude", "number", None, None, "mdi:terrain", "参考海拔高度", None,
+     (("min", -1000000), ("max", 1000000), ("step", 0.1))),
+    ("reset", "button", None, None, "mdi:restart", "重启", "diagnostic", None),
+)
+
+# 只在对应功能打开时才有状态的组件
+_SHT4X = ("sht4x_temperature", "sht4x_humidity")
+_PROFILE = ("loop_lag_p50", "loop_lag_p99", "loop_lag_max", "task_step_p50", "task_step_p99", "task_step_max",
+            "blocking_task")
+_HEAP = ("heap_min_free", "heap_largest_block", "cycle_alloc", "cycle_alloc_max")
+
+# 组件id和状态键不一致的组件
+_STATE_KEYS = {"tvoc": "voc"}
+# 历史遗留的unique_id，改掉的话HA里会变成一个新实体
+_UNIQUE_IDS = {"essid": "b'%s'.essid"}
+
+
+def components(config: dict) -> tuple:
+    """按配置挑出要发布的组件，没有接的SHT4X和没有打开的统计不会在HA里留下一直unknown的实体"""
+    skip = ()
+    if config.get("sht4x_bus") is None:
+        skip += _SHT4X
+    if not config.get("profile_interval"):
+        skip += _PROFILE
+    if not config.get("heap_interval"):
+        skip += _HEAP
+    return tuple(row for row in COMPONENTS if row[0] not in skip)
+
+
+def state_keys(components=COMPONENTS):
+    """有状态的组件在状态JSON里的键，顺序和components一致"""
+    return tuple(_STATE_KEYS.get(row[0], row[0]) for row in components if row[1] != "button")
+
+
+def _field(name, value):
+    return ',"%s":%s' % (name, json.dumps(value))
+
+
+def iter_chunks(object_id, state_topic, availability_topic, command_topic, components=COMPONENTS):
+    """逐段生成discovery JSON"""
+    oid = json.dumps(object_id)
+    yield ('{"device":{"identifiers":%s,"name":%s,"manufacturer":"Synodriver Corp","model":"synosensor 01",'
+           '"sw_version":"0.1","serial_number":%s,"hw_version":"0.1"},'
+           '"origin":{"name":"7in1sensor","sw_version":"0.1","support_url":"https://github.com/synodriver"},'
+           '"components":{') % (oid, json.dumps("十合一传感器模组"), oid)
+    first = True
+    for key, platform, device_class, unit, icon, name, category, extras in components:
+        yield '%s"%s.%s":{"platform":"%s"' % ("" if first else ",", object_id, key, platform)
+        first = False
+        if device_class is not None:
+            yield _field("device_class", device_class)
+        if unit is not None:
+            yield _field("unit_of_measurement", unit)
+        if icon is not None:
+            yield _field("icon", icon)
+        if name is not None:
+            yield _field("name", name)
+        if category is not None:
+            yield _field("entity_category", category)
+        if extras is not None:
+            for field, value in extras:
+                yield _field(field, value)
+        if platform != "button":
+            yield ',"value_template":"{{value_json.%s|default(this.state)}}"' % _STATE_KEYS.get(key, key)
+        if platform == "number":
+            yield ',"command_template":"{\\"%s\\": {{value}}}"' % key
+        elif platform != "sensor":
+            yield ',"command_template":"{\\"%s\\": \\"{{value}}\\"}"' % key
+        if key in _UNIQUE_IDS:
+            yield _field("unique_id", _UNIQUE_IDS[key] % object_id)
+        else:
+            yield _field("unique_id", "%s.%s" % (object_id, key))
+        yield "}"
+    yield '},"state_topic":%s,"availability_topic":%s,"command_topic":%s,"qos":1}' % (
+        json.dumps(state_topic), json.dumps(availability_topic), json.dumps(command_topic))
+
+
+def fingerprint(object_id, state_topic, availability_topic, command_topic, components=COMPONENTS) -> tuple:
+    """
+    一次生成同时算出discovery JSON的md5(hex)和总长度，不需要拼出完整负载
+    :return: (digest, size)，size传给build_payload
+    """
+    md5 = hashlib.md5()
+    size = 0
+    for chunk in iter_chunks(object_id, state_topic, availability_topic, command_topic, components):
+        data = chunk.encode()
+        md5.update(data)
+        size += len(data)
+    return binascii.hexlify(md5.digest()), size
+
+
+def build_payload(size, object_id, state_topic, availability_topic, command_topic, components=COMPONENTS) -> bytearray:
+    """
+    把各段依次写进一块刚好够大的bytearray，发布完就可以释放
+    mqtt_as的publish需要完整的负载和长度，没办法边生成边发送，所以只在hash变了要发布时才生成第二遍
+    :param size: fingerprint算出的总长度
+    """
+    payload = bytearray(size)
+    mv = memoryview(payload)
+    pos = 0
+    for chunk in iter_chunks(object_id, state_topic, availability_topic, command_topic, components):
+        data = chunk.encode()
+        mv[pos:pos + len(data)] = data
+        pos += len(data)
+    return payload
@@ -0,0 +1,55 @@
+# -*- coding: utf-8 -*-
+"""
+Copyright (c) 2008-2025 synodriver <diguohuangjiajinweijun@gmail.com>
+
+串口定长帧的接收缓冲区，空气模块和DART共用
+"""
+
+
+class FrameRing:
+    """
+    预分配的接收缓冲区，[_start, _end)是还没解析的字节
+    子类设置frame_len，实现_parse()返回解析出的帧数，并提供_reader、_should_stop和has_data
+    """
+    frame_len = 0
+
+    def _init_ring(self, buffer_size):
+        self._buf = bytearray(buffer_size)
+        self._mv = memoryview(self._buf)
+        self._start = 0
+        self._end = 0
+        self._synced = True
+        # 诊断计数
+        self.frames = 0
+        self.resyncs = 0  # 丢失帧对齐的次数
+        self.discarded = 0  # 重新对齐时丢弃的字节数
+        self.checksum_errors = 0
+
+    def _compact(self):
+        """尾部放不下一整帧时把未解析的字节挪到缓冲区开头"""
+        if len(self._buf) - self._end < self.frame_len and self._start:
+            remain = self._end - self._start
+            self._mv[0:remain] = self._mv[self._start:self._end]
+            self._start = 0
+            self._end = remain
+
+    def _slide(self):
+        """当前位置不是合法的帧，向后滑动一个字节重新找帧头"""
+        if self._synced:
+            self._synced = False
+            self.resyncs += 1
+        self.discarded += 1
+        self._start += 1
+
+    async def _reading_task(self):
+        while not self._should_stop:
+            self._compact()
+            # 直接读进缓冲区尾部，只有这个memoryview切片需要分配
+            n = await self._reader.readinto(self._mv[self._end:])
+            if not n:
+                continue
+            self._end += n
+            count = self._parse()
+            self.frames += count
+            if count:
+                self.has_data.set()
@@ -0,0 +1,93 @@
+# -*- coding: utf-8 -*-
+"""
+Copyright (c) 2008-2025 synodriver <diguohuangjiajinweijun@gmail.com>
+
+堆内存统计
+- 采样只调用一次gc.mem_free()，已分配量用堆的总大小减出来。mem_free和mem_alloc都要扫描整个堆的分配表，
+  所以只在发布周期的边界和少数可能出现峰值的地方采样，不在每个任务之后采样
+- 最低剩余：每次sample()都比较，记下统计窗口内的最低值
+- 每个发布周期的分配量：周期内两次采样之间已分配量的增量累加起来，end_cycle()时结算一个周期。
+  中间如果自动gc回收过，那一段的增量是负数，只能丢掉，所以这个值是下限
+- 最大空闲块：MicroPython没有直接查询GC堆碎片的接口，用esp32.idf_heap_info看IDF堆的最大连续空闲块，
+  socket/TLS的缓冲区和GC堆的扩展都从这里分配
+"""
+import gc
+
+try:
+    import esp32
+except ImportError:
+    esp32 = None
+
+
+def largest_free_block():
+    """IDF数据堆里最大的连续空闲块(字节)，不支持的port返回None"""
+    if esp32 is None or not hasattr(esp32, "idf_heap_info"):
+        return None
+    largest = 0
+    for total, free, block, min_free in esp32.idf_heap_info(esp32.HEAP_DATA):
+        if block > largest:
+            largest = block
+    return largest
+
+
+class HeapMonitor:
+    def __init__(self):
+        free = gc.mem_free()
+        self._total = gc.mem_alloc() + free  # GC堆的总大小，只在初始化和回收之后量一次
+        self.min_free = free  # 统计窗口内的最低剩余
+        self.cycles = 0
+        self.cycle_alloc = 0  # 上一个周期的分配量
+        self.max_cycle_alloc = 0
+        self.total_alloc = 0  # 统计窗口内所有周期的分配量
+        self.collects = 0
+        self._alloc = 0  # 当前周期到目前为止的分配量
+        self._base = self._total - free
+
+    def sample(self):
+        """记录到目前为止的分配量和最低剩余，在可能出现峰值的地方调用"""
+        free = gc.mem_free()
+        used = self._total - free
+        if used > self._base:
+            self._alloc += used - self._base
+        self._base = used
+        if free < self.min_free:
+            self.min_free = free
+
+    def collect(self):
+        """代替gc.collect()，回收之前先把这段时间的分配量记下来"""
+        self.sample()
+        gc.collect()
+        self.collects += 1
+        free = gc.mem_free()
+        self._total = gc.mem_alloc() + free  # 新版本的port堆不够时会扩展，趁回收之后重新量一次
+        self._base = self._total - free
+
+    def end_cycle(self):
+        """一个发布周期结束"""
+        self.sample()
+        self.cycle_alloc = self._alloc
+        self._alloc = 0
+        self.cycles += 1
+        self.total_alloc += self.cycle_alloc
+        if self.cycle_alloc > self.max_cycle_alloc:
+            self.max_cycle_alloc = self.cycle_alloc
+
+    def snapshot(self) -> dict:
+        """当前统计窗口的结果，用reset()开始新的窗口"""
+        return {
+            "heap_min_free": self.min_free,
+            "heap_largest_block": largest_free_block(),
+            "cycle_alloc": self.total_alloc // self.cycles if self.cycles else 0,
+            "cycle_alloc_max": self.max_cycle_alloc,
+        }
+
+    def report(self) -> str:
+        return "heap: min free %d B, last cycle %d B, max cycle %d B over %d cycles, %d idle collects" % (
+            self.min_free, self.cycle_alloc, self.max_cycle_alloc, self.cycles, self.collects)
+
+    def reset(self):
+        self.min_free = gc.mem_free()
+        self.cycles = 0
+        self.max_cycle_alloc = 0
+        self.total_alloc = 0
+        self.collects = 0
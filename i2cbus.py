@@ -0,0 +1,134 @@
+# -*- coding: utf-8 -*-
+"""
+Copyright (c) 2008-2025 synodriver <diguohuangjiajinweijun@gmail.com>
+
+I2C总线管理
+每条总线只创建一个machine.I2C，驱动通过I2CBus访问：
+同步方法和machine.I2C同名，可以直接替换原来的I2C对象；async方法在设备锁内完成整个事务，
+适合写命令-等待转换-读结果这种中间会让出事件循环的访问。所有访问都会计入统计
+
+锁按设备地址分开：单个同步方法是一个完整的I2C事务，在C里执行完才返回，不会和其他协程的事务在总线上交错，
+需要保护的是同一个设备上跨越await的多步操作(切换模式-等待转换-读结果、复位-校准-测量)。
+驱动用lock(addr)拿到自己的锁，在这些操作期间持有；命令处理等驱动以外的代码也要先拿同一把锁再访问设备。
+一个设备等待转换的时候，总线上的其他设备不受影响
+"""
+import asyncio
+import time
+
+from machine import I2C, Pin
+
+
+class I2CBus:
+    def __init__(self, i2c, name=""):
+        self.i2c = i2c
+        self.name = name
+        self._locks = {}  # 设备地址 -> asyncio.Lock
+        self.transactions = 0
+        self.bytes = 0
+        self.errors = 0
+        self.busy_us = 0  # 花在总线传输上的时间
+
+    def _done(self, start, nbytes):
+        self.busy_us += time.ticks_diff(time.ticks_us(), start)
+        self.transactions += 1
+        self.bytes += nbytes
+
+    # machine.I2C兼容的同步接口
+    def readfrom_mem(self, addr, reg, nbytes):
+        start = time.ticks_us()
+        try:
+            data = self.i2c.readfrom_mem(addr, reg, nbytes)
+        except OSError:
+            self.errors += 1
+            raise
+        self._done(start, nbytes)
+        return data
+
+    def readfrom_mem_into(self, addr, reg, buf):
+        start = time.ticks_us()
+        try:
+            self.i2c.readfrom_mem_into(addr, reg, buf)
+        except OSError:
+            self.errors += 1
+            raise
+        self._done(start, len(buf))
+
+    def writeto_mem(self, addr, reg, buf):
+        start = time.ticks_us()
+        try:
+            self.i2c.writeto_mem(addr, reg, buf)
+        except OSError:
+            self.errors += 1
+            raise
+        self._done(start, len(buf))
+
+    def readfrom_into(self, addr, buf, stop=True):
+        start = time.ticks_us()
+        try:
+            self.i2c.readfrom_into(addr, buf, stop)
+        except OSError:
+            self.errors += 1
+            raise
+        self._done(start, len(buf))
+
+    def writeto(self, addr, buf, stop=True):
+        start = time.ticks_us()
+        try:
+            ret = self.i2c.writeto(addr, buf, stop)
+        except OSError:
+            self.errors += 1
+            raise
+        self._done(start, len(buf))
+        return ret
+
+    def scan(self):
+        return self.i2c.scan()
+
+    def lock(self, addr) -> asyncio.Lock:
+        """地址为addr的设备的锁，同一个地址总是返回同一个对象"""
+        lock = self._locks.get(addr)
+        if lock is None:
+            lock = self._locks[addr] = asyncio.Lock()
+        return lock
+
+    # 带锁的事务接口，调用的时候不能已经持有同一个设备的锁
+    async def read(self, addr, reg, nbytes) -> bytes:
+        async with self.lock(addr):
+            return self.readfrom_mem(addr, reg, nbytes)
+
+    async def readinto(self, addr, reg, buf):
+        async with self.lock(addr):
+            self.readfrom_mem_into(addr, reg, buf)
+
+    async def write(self, addr, reg, buf):
+        async with self.lock(addr):
+            self.writeto_mem(addr, reg, buf)
+
+    async def write_then_read(self, addr, out, buf, delay_ms=0):
+        """
+        写入out，等待delay_ms之后读满buf，整个过程都持有设备锁；等待期间总线上的其他设备可以访问
+        """
+        async with self.lock(addr):
+            self.writeto(addr, out)
+            if delay_ms:
+                await asyncio.sleep_ms(delay_ms)
+            self.readfrom_into(addr, buf)
+
+    def stats(self) -> tuple:
+        """(transactions, bytes, errors, busy_us)"""
+        return self.transactions, self.bytes, self.errors, self.busy_us
+
+
+_buses = {}
+
+
+def get_bus(id_, sda, scl, freq=400000) -> I2CBus:
+    """同一个id只会创建一次machine.I2C"""
+    bus = _buses.get(id_)
+    if bus is None:
+        bus = _buses[id_] = I2CBus(I2C(id_, sda=Pin(sda), scl=Pin(scl), freq=freq), "i2c%d" % id_)
+    return bus
+
+
+def buses():
+    return _buses.values()
@@ -15,7 +15,7 @@ class LTR390:
     REG_UVS_DATA = const(0x10)
     REG_ALS_DATA = const(0x0D)
     REG_INT_CFG = const(0x19)
-    REG_INT_PST = const(0x1aA)
+    REG_INT_PST = const(0x1A)
     PART_ID = const(0x06)
     MAIN_STATUS = const(0x07)
 
@@ -44,19 +44,56 @@ class LTR390:
     GAIN_9 = const(0x3)
     GAIN_18 = const(0x4)
 
-    def __init__(self, i2c: I2C, gain=0x1, sensitivity_max=1400, debug=False):
+    # 各测量速率对应的周期(ms)
+    _RATE_MS = (25, 50, 100, 200, 500, 1000, 2000, 2000)
+    # 按寄存器值索引的解码表
+    _RATE_LABELS = ("25ms", "50ms", "100ms", "200ms", "500ms", "1000ms", "2000ms", "2000ms")
+    _RESOLUTION_LABELS = ("20", "19", "18", "17", "16", "13")  # resolution >> 4
+    _INT_TIME = (4, 2, 1, 0.5, 0.25, 0.125)  # 积分时间，以100ms为单位
+    _GAIN_LABELS = ("1", "3", "6", "9", "18")
+    _GAIN_FACTOR = (1, 3, 6, 9, 18)
+
+    def __init__(self, i2c: I2C, gain=0x1, sensitivity_max=1400, debug=False, int_pin=None):
         """
         初始化传感器
         :param i2c: I2C对象
+        :param int_pin: INT引脚编号，设置后用中断等待转换完成，不再轮询MAIN_STATUS
         """
         self.i2c = i2c
         self.addr = self.I2C_ADDR
+        # 跨越await的多步操作(切换模式-等待-读取、修改配置)都持有这把锁，驱动以外的代码访问传感器之前也要先拿到它
+        self.lock = i2c.lock(self.addr) if hasattr(i2c, "lock") else asyncio.Lock()
+        # 配置寄存器的影子副本，只在setter里更新，读数据时不需要再从I2C读回来
+        self.mode = self.MODE_UVS
+        self._resolution = self.RESOLUTION_18BIT_TIME100MS
+        self._rate = self.RATE_100MS
+        self._gain = self.GAIN_3
+        self._wfac = 1.0  # 光照强度转换系数
+        self._sensitivity_max = sensitivity_max
+        self._uvs_scale = 0.0
+        self._als_scale = 0.0
+        self._ready_at = time.ticks_ms()  # 模式切换或者配置写入之后，传感器稳定下来的时间
         self._verify_device()
         self._init_sensor()
-        self.wfac = 1.0  # 光照强度转换系数
-        self.sensitivity_max = sensitivity_max
         self.set_gain(gain)
         self._debug = debug
+        self._ready = None
+        if int_pin is not None:
+            self._init_int(int_pin)
+
+    def _init_int(self, int_pin):
+        """
+        INT是阈值中断，低电平有效，读MAIN_STATUS清除
+        阈值设为0并且不做持续判断，这样每次转换出非0结果都会触发，相当于数据就绪中断
+        """
+        self._ready = asyncio.ThreadSafeFlag()
+        self._write_reg(self.REG_INT_PST, 0x00)
+        self.set_thresh(0, 0)
+        self._int_pin = Pin(int_pin, Pin.IN, Pin.PULL_UP)
+        self._int_pin.irq(self._on_int, Pin.IRQ_FALLING)
+
+    def _on_int(self, pin):
+        self._ready.set()
 
     def _verify_device(self):
         """验证设备ID"""
@@ -84,8 +121,56 @@ class LTR390:
         获取当前分辨率和测量速率
         :return:
         """
+        return self._resolution, self._rate
+
+    def sync(self):
+        """从传感器重新读取配置寄存器，更新影子副本"""
         data = self._read_reg(self.REG_MEAS_RATE, 1)[0]
-        return data & 0xF0, data & 0x0F
+        self._resolution = data & 0xF0
+        self._rate = data & 0x0F
+        self._gain = self._read_reg(self.REG_UVS_GAIN, 1)[0] & 0x07
+        self._update_scale()
+
+    def _update_scale(self):
+        """
+        配置变化时预先算好换算系数，每次采样只需要一次乘法
+        https://esphome.io/components/sensor/ltr390
+        """
+        gain = self._GAIN_FACTOR[self._gain]
+        int_time = self._INT_TIME[self._resolution >> 4]
+        self._uvs_scale = self._wfac / (self._sensitivity_max * gain / 18 * int_time / 4)
+        self._als_scale = 0.6 * self._wfac / (gain * int_time)
+
+    @property
+    def wfac(self):
+        return self._wfac
+
+    @wfac.setter
+    def wfac(self, value):
+        self._wfac = value
+        self._update_scale()
+
+    @property
+    def sensitivity_max(self):
+        return self._sensitivity_max
+
+    @sensitivity_max.setter
+    def sensitivity_max(self, value):
+        self._sensitivity_max = value
+        self._update_scale()
+
+    @property
+    def resolution_label(self) -> str:
+        """分辨率(位)"""
+        return self._RESOLUTION_LABELS[self._resolution >> 4]
+
+    @property
+    def rate_label(self) -> str:
+        return self._RATE_LABELS[self._rate]
+
+    @property
+    def gain_label(self) -> str:
+        return self._GAIN_LABELS[self._gain]
 
     def set_resolution_rate(self, resolution: int, rate: int):
         """
@@ -120,8 +205,39 @@ class LTR390:
         #     2000: "110",
         # }
         self._write_reg(self.REG_MEAS_RATE, resolution | rate)
+        self._resolution = resolution
+        self._rate = rate
+        self._update_scale()
         time.sleep(0.05)
 
+    async def set_resolution_rate_async(self, resolution: int, rate: int):
+        """set_resolution_rate的非阻塞版本，等待配置生效期间不占用事件循环"""
+        async with self.lock:
+            self._write_reg(self.REG_MEAS_RATE, resolution | rate)
+            self._resolution = resolution
+            self._rate = rate
+            self._update_scale()
+            self._settle(50)
+            await self.wait_ready()
+
+    async def configure_async(self, resolution=None, rate=None, gain=None):
+        """
+        同时修改分辨率、测量速率和增益，None表示保持不变
+        MEAS_RATE和UVS_GAIN是相邻的寄存器，地址自动递增，一次I2C写入两个，换算系数也只重新算一次
+        """
+        async with self.lock:
+            resolution = self._resolution if resolution is None else resolution
+            rate = self._rate if rate is None else rate
+            gain = self._gain if gain is None else gain
+            self.i2c.writeto_mem(self.addr, self.REG_MEAS_RATE, bytes((resolution | rate, gain)))
+            # 写入成功之后才更新影子副本，失败时和传感器保持一致
+            self._resolution = resolution
+            self._rate = rate
+            self._gain = gain
+            self._update_scale()
+            self._settle(50)
+            await self.wait_ready()
+
     def set_mode(self, mode):
         """
         设置测量模式
@@ -133,12 +249,36 @@ class LTR390:
         self.mode = mode
         time.sleep_ms(50)  # 等待模式切换
 
+    async def set_mode_async(self, mode):
+        """
+        set_mode的非阻塞版本，只记录传感器什么时候切换完成，需要的时候用wait_ready等待
+        :param mode: MODE_ALS 或 MODE_UVS
+        """
+        if mode not in (self.MODE_ALS, self.MODE_UVS):
+            raise ValueError("Invalid mode")
+        self._write_reg(self.REG_MAIN_CTRL, mode)
+        self.mode = mode
+        self._settle(50)
+
+    def _settle(self, ms):
+        ready_at = time.ticks_add(time.ticks_ms(), ms)
+        if time.ticks_diff(ready_at, self._ready_at) > 0:
+            self._ready_at = ready_at
+
+    async def wait_ready(self):
+        """等到最近一次模式切换/配置写入生效"""
+        remain = time.ticks_diff(self._ready_at, time.ticks_ms())
+        if remain > 0:
+            await asyncio.sleep_ms(remain)
+
     ########
     def set_gain(self, gain: int):
         self._write_reg(self.REG_UVS_GAIN, gain)
+        self._gain = gain
+        self._update_scale()
 
     def get_gain(self):
-        return self._read_reg(self.REG_UVS_GAIN, 1)[0]
+        return self._gain
 
     def _read_reg(self, reg, length) -> bytes:
         """读取寄存器"""
@@ -148,8 +288,20 @@ class LTR390:
         """写入寄存器"""
         self.i2c.writeto_mem(self.addr, reg, bytes([value]))
 
+    async def _wait_int(self):
+        """等待INT中断，超时(比如暗光下结果为0不会触发)之后回退到轮询"""
+        _, rate = self.get_resolution_rate()
+        try:
+            await asyncio.wait_for(self._ready.wait(), (self._RATE_MS[rate] + 100) / 1000)
+        except asyncio.TimeoutError:
+            if self._debug:
+                print("ltr390 int timeout, fall back to polling")
+
     async def _read_data_reg(self):
         """读取当前模式的数据寄存器"""
+        await self.wait_ready()
+        if self._ready is not None:
+            await self._wait_int()
         while True:
             status = self.status()
             if status & 0x08:  # new data comming
@@ -164,66 +316,27 @@ class LTR390:
 
     async def read_uvs(self):
         """读取紫外线数据（需要先设置为UVS模式）"""
-        self._write_reg(self.REG_INT_CFG, 0x34)
-        self.set_mode(self.MODE_UVS)
-        raw = await self._read_data_reg()
-        if self._debug:
-            print("raw uvs:%d, main status:%d" % (raw, self.status()))
-        gain = self.get_gain()
-        if gain == self.GAIN_1:
-            gain = 1
-        elif gain == self.GAIN_3:
-            gain = 3
-        elif gain == self.GAIN_6:
-            gain = 6
-        elif gain == self.GAIN_9:
-            gain = 9
-        elif gain == self.GAIN_18:
-            gain = 18
-        re, _ = self.get_resolution_rate()
-        if re == self.RESOLUTION_16BIT_TIME25MS:  # 积分时间
-            re = 0.25
-        elif re == self.RESOLUTION_17BIT_TIME50MS:
-            re = 0.5
-        elif re == self.RESOLUTION_18BIT_TIME100MS:
-            re = 1
-        elif re == self.RESOLUTION_19BIT_TIME200MS:
-            re = 2
-        elif re == self.RESOLUTION_20BIT_TIME400MS:
-            re = 4
-        sensitivity = self.sensitivity_max * gain / 18 * re / 4
-        return raw / sensitivity * self.wfac  # https://esphome.io/components/sensor/ltr390
+        async with self.lock:
+            self._write_reg(self.REG_INT_CFG, 0x34)
+            if self._ready is not None:
+                self._ready.clear()
+            await self.set_mode_async(self.MODE_UVS)
+            raw = await self._read_data_reg()
+            if self._debug:
+                print("raw uvs:%d, main status:%d" % (raw, self.status()))
+            return raw * self._uvs_scale
 
     async def read_als(self):
         """读取环境光数据（需要先设置为ALS模式）"""
-        self._write_reg(self.REG_INT_CFG, 0x14)
-        self.set_mode(self.MODE_ALS)
-        raw = await self._read_data_reg()
-        if self._debug:
-            print("raw als:%d, main status:%d" % (raw, self.status()))
-        gain = self.get_gain()
-        if gain == self.GAIN_1:
-            gain = 1
-        elif gain == self.GAIN_3:
-            gain = 3
-        elif gain == self.GAIN_6:
-            gain = 6
-        elif gain == self.GAIN_9:
-            gain = 9
-        elif gain == self.GAIN_18:
-            gain = 18
-        re, _ = self.get_resolution_rate()
-        if re == self.RESOLUTION_16BIT_TIME25MS:  # 积分时间
-            re = 0.25
-        elif re == self.RESOLUTION_17BIT_TIME50MS:
-            re = 0.5
-        elif re == self.RESOLUTION_18BIT_TIME100MS:
-            re = 1
-        elif re == self.RESOLUTION_19BIT_TIME200MS:
-            re = 2
-        elif re == self.RESOLUTION_20BIT_TIME400MS:
-            re = 4
-        return 0.6 * raw / gain / re * self.wfac  # https://esphome.io/components/sensor/ltr390
+        async with self.lock:
+            self._write_reg(self.REG_INT_CFG, 0x14)
+            if self._ready is not None:
+                self._ready.clear()
+            await self.set_mode_async(self.MODE_ALS)
+            raw = await self._read_data_reg()
+            if self._debug:
+                print("raw als:%d, main status:%d" % (raw, self.status()))
+            return raw * self._als_scale
 
     def set_thresh(self, low, high):  # LTR390_THRESH_UP and LTR390_THRESH_LOW
         self._write_reg(0x21, high & 0xff)
@@ -7,6 +7,7 @@ import binascii
 import hashlib
 import os
 import sys
+import time
 import ota.rollback
 
 gc.collect()
@@ -21,10 +22,20 @@ gc.collect()
 from ltr390 import LTR390
 from bmp3xx import BMP3XX_I2C
 from airmod001 import AirMod
+from date import Dart
+import sht4x
+from state import ChangeTracker, StateSerializer
+from spool import Spool
+from scheduler import Scheduler
+from profiler import Profiler
+from heap import HeapMonitor
+import i2cbus
+import discovery
 
 import asyncio
 import json
 import machine
+import ntptime
 from mqtt_as import MQTTClient, config
 gc.collect()
 
@@ -40,7 +51,56 @@ DEFAULT_CONFIG = {
     "broker_port": 1883,
     "broker_user": "",
     "broker_password": "",
-    "debug": True
+    "debug": True,
+    "publish_mode": "full",  # "full": 每次发送完整状态; "delta": 只发送超过死区的变化，需要手动打开
+    "publish_interval": 1,  # seconds
+    "heartbeat_interval": 60,  # delta模式下强制发送完整状态的间隔(秒)
+    "deadbands": {},  # 覆盖DEFAULT_DEADBANDS中的死区
+    "spool_interval": 10,  # 断网期间每隔多少秒缓存一条采样到flash
+    "publish_timeout": 3,  # 一次状态发送超过这么多秒还没完成就当作断网，之后的采样改为缓存，不等mqtt_as发现断线
+    "spool_segments": 8,  # flash上最多保留的缓存分段数，每段60条记录
+    "ltr390_int_pin": None,  # LTR390 INT引脚，接上之后用中断代替轮询
+    "dart_uart": None,  # DART甲醛传感器的(uart_id, tx, rx)，接上之后ch2o改用它的读数
+    "dart_max_timeouts": 5,  # DART连续这么多次没有应答之后ch2o改回空气模块的读数，直到DART恢复
+    "sht4x_bus": None,  # SHT4X所在的I2C总线号(0或1)，None表示没有接
+    "sht4x_interval": 5,  # SHT4X采样周期(秒)
+    "sht4x_precision": "high",  # "high" / "medium" / "low"
+    "profile_interval": 60,  # 事件循环延迟和任务耗时的统计窗口(秒)，0表示不统计
+    "heap_interval": 60,  # 堆内存统计窗口(秒)，0表示不统计
+    "heap_attribution": False,  # 按任务统计分配量，每一步多扫描两次堆，需要profile_interval不为0
+    "ntp_host": "pool.ntp.org",  # 连上网络之后校准RTC，缓存的采样才有正确的时间戳
+    "idle_collect": False,  # 在发布之前的空闲间隙里gc.collect()，每秒一次完整回收，只在自动gc打断任务时打开，需要heap_interval不为0
+}
+
+# I2C总线号 -> (sda, scl, freq)
+I2C_PINS = {
+    1: (18, 19, 400000),
+    0: (4, 5, 40000),
+}
+
+SHT4X_PRECISIONS = {
+    "high": sht4x.HIGH_PRECISION,
+    "medium": sht4x.MEDIUM_PRECISION,
+    "low": sht4x.LOW_PRECISION,
+}
+
+# 断网期间缓存到flash的测量值
+SPOOL_FIELDS = ("temperature", "humidity", "voc", "pm25", "pm10", "ch2o", "co2", "light", "uv", "pressure")
+
+# delta模式下各个键的默认死区，变化量小于死区的抖动不会触发发送
+DEFAULT_DEADBANDS = {
+    "temperature": 0.2,
+    "humidity": 0.5,
+    "light": 2,
+    "uv": 0.05,
+    "pressure": 0.01,  # kPa
+    "pressure_temperature": 0.1,
+    "sht4x_temperature": 0.05,
+    "sht4x_humidity": 0.2,
+    "altitude": 0.5,
+    "raw_temperature": 1,
+    "flash_available": 4096,
+    "free_memory": 2048,
 }
 
 # 配置文件路径
@@ -92,6 +152,11 @@ availability_topic = "%s/%s/%s/availability" % (discovery_prefix, component, obj
 state_topic = "%s/%s/%s/state" % (discovery_prefix, component, object_id)
 command_topic = "%s/%s/%s/set" % (discovery_prefix, component, object_id)
 log_topic = "%s/%s/%s/log" % (discovery_prefix, component, object_id) # log topic for debug
+# 断网期间缓存的采样，带原始时间戳重放到这里。HA的MQTT传感器不能导入过去时间点的数据，
+# 所以HA的历史记录在断网期间仍然是空的；这个topic给外部的记录程序(比如Node-RED/Telegraf写入数据库)用
+history_topic = "%s/%s/%s/history" % (discovery_prefix, component, object_id)
+discovery_hash_topic = "%s/%s/%s/discovery_hash" % (discovery_prefix, component, object_id)  # retained, 判断broker上的discovery是否还在
+DISCOVERY_HASH_FILE = 'discovery.hash'  # 上次发布的discovery的hash
 # ap = network.WLAN(network.AP_IF)  # fail back
 
 # async def setup_ap(activate=True):     
@@ -115,269 +180,6 @@ log_topic = "%s/%s/%s/log" % (discovery_prefix, component, object_id) # log topi
 #     "update_interval": 1,  # seconds
 # }
 
-discovery_payload = {
-    "device": {
-        "identifiers": object_id,
-        "name": "十合一传感器模组",
-        "manufacturer": "Synodriver Corp",
-        "model": "synosensor 01",
-        "sw_version": "0.1",
-        "serial_number": object_id,
-        "hw_version": "0.1"
-    },
-    "origin": {
-        "name": "7in1sensor",
-        "sw_version": "0.1",
-        "support_url": "https://github.com/synodriver",
-    },
-    "components": {
-        "%s.temperature" % object_id: {
-            "platform": "sensor",
-            "device_class": "temperature",
-            "unit_of_measurement": "°C",
-            "value_template": "{{value_json.temperature}}",
-            "unique_id": "%s.temperature" % object_id
-        },
-        "%s.humidity" % object_id: {
-            "platform": "sensor",
-            "device_class": "humidity",
-            "unit_of_measurement": "%",
-            "value_template": "{{value_json.humidity}}",
-            "unique_id": "%s.humidity" % object_id
-        },
-        "%s.tvoc" % object_id: {
-            "platform": "sensor",
-            "device_class": "volatile_organic_compounds",
-            "unit_of_measurement": "µg/m³",
-            "value_template": "{{value_json.voc}}",
-            "unique_id": "%s.tvoc" % object_id
-        },
-        "%s.pm25" % object_id: {
-            "platform": "sensor",
-            "device_class": "pm25",
-            "unit_of_measurement": "µg/m³",
-            "value_template": "{{value_json.pm25}}",
-            "unique_id": "%s.pm25" % object_id
-        },
-        "%s.pm10" % object_id: {
-            "platform": "sensor",
-            "device_class": "pm10",
-            "unit_of_measurement": "µg/m³",
-            "value_template": "{{value_json.pm10}}",
-            "unique_id": "%s.pm10" % object_id
-        },
-        "%s.ch2o" % object_id: {
-            "platform": "sensor",
-            "icon": "mdi:chemical-weapon",
-            "name": "甲醛",
-            "unit_of_measurement": "µg/m³",
-            "value_template": "{{value_json.ch2o}}",
-            "unique_id": "%s.ch2o" % object_id
-        },
-        "%s.co2" % object_id: {
-            "platform": "sensor",
-            "device_class": "carbon_dioxide",
-            "unit_of_measurement": "ppm",
-            "value_template": "{{value_json.co2}}",
-            "unique_id": "%s.co2" % object_id
-        },
-        "%s.light" % object_id: {
-            "platform": "sensor",
-            "device_class": "illuminance",
-            "unit_of_measurement": "lx",
-            "value_template": "{{value_json.light}}",
-            "unique_id": "%s.light" % object_id
-        },
-        "%s.uv" % object_id: {
-            "platform": "sensor",
-            "name": "紫外线指数",
-            "unit_of_measurement": "UV index",
-            "value_template": "{{value_json.uv}}",
-            "unique_id": "%s.uv" % object_id
-        },
-        "%s.pressure" % object_id: {
-            "platform": "sensor",
-            "device_class": "pressure",
-            "unit_of_measurement": "kPa",
-            "value_template": "{{value_json.pressure}}",
-            "unique_id": "%s.pressure" % object_id
-        },
-        "%s.pressure_temperature" % object_id: {
-            "platform": "sensor",
-            "name": "气压传感器内部温度",
-            "enabled_by_default": False,
-            "device_class": "temperature",
-            "unit_of_measurement": "°C",
-            "value_template": "{{value_json.pressure_temperature}}",
-            "unique_id": "%s.pressure_temperature" % object_id
-        },
-
-        "%s.ip_address" % object_id: {
-            "platform": "sensor",
-            "icon": "mdi:ip",
-            "name": "IP地址",
-            "value_template": "{{value_json.ip_address}}",
-            "unique_id": "%s.ip_address" % object_id,
-            "entity_category": "diagnostic"
-        },
-        "%s.ssid" % object_id: {
-            "platform": "sensor",
-            "icon": "mdi:wifi",
-            "name": "SSID",
-            "value_template": "{{value_json.ssid}}",
-            "unique_id": "%s.ssid" % object_id,
-            "entity_category": "diagnostic"
-        },
-        "%s.essid" % object_id: {
-            "platform": "sensor",
-            "icon": "mdi:wifi",
-            "name": "ESSID",
-            "value_template": "{{value_json.essid}}",
-            "unique_id": "%s.essid" % object_id.encode(),
-            "entity_category": "diagnostic"
-        },
-        "%s.mac_address" % object_id: {
-            "platform": "sensor",
-            "icon": "mdi:wifi",
-            "name": "MAC",
-            "value_template": "{{value_json.mac_address}}",
-            "unique_id": "%s.mac_address" % object_id,
-            "entity_category": "diagnostic"
-        },
-        "%s.dns_address" % object_id: {
-            "platform": "sensor",
-            "icon": "mdi:dns",
-            "name": "DNS",
-            "value_template": "{{value_json.dns_address}}",
-            "unique_id": "%s.dns_address" % object_id,
-            "entity_category": "diagnostic"
-        },
-        "%s.txpower" % object_id: {
-            "platform": "sensor",
-            "icon": "mdi:wifi",
-            "name": "发射功率",
-            "value_template": "{{value_json.txpower}}",
-            "unique_id": "%s.txpower" % object_id,
-            "unit_of_measurement": "dBm",
-            "entity_category": "diagnostic"
-        },
-        "%s.flash_size" % object_id: {
-            "platform": "sensor",
-            "icon": "mdi:file",
-            "name": "flash总大小",
-            "device_class": "data_size",
-            "value_template": "{{value_json.flash_size}}",
-            "unique_id": "%s.flash_size" % object_id,
-            "unit_of_measurement": "B",
-            "entity_category": "diagnostic"
-        },
-        "%s.raw_temperature" % object_id: {
-            "platform": "sensor",
-            "icon": "mdi:cpu-32-bit",
-            "name": "核心温度",
-            "device_class": "temperature",
-            "unit_of_measurement": "°C",
-            "value_template": "{{value_json.raw_temperature}}",
-            "unique_id": "%s.raw_temperature" % object_id,
-            "entity_category": "diagnostic"
-        },
-        "%s.flash_available" % object_id: {
-            "platform": "sensor",
-            "icon": "mdi:file-alert",
-            "name": "flash剩余空间",
-            "device_class": "data_size",
-            "value_template": "{{value_json.flash_available}}",
-            "unique_id": "%s.flash_available" % object_id,
-            "unit_of_measurement": "B",
-            "entity_category": "diagnostic"
-        },
-        "%s.free_memory" % object_id: {
-            "platform": "sensor",
-            "icon": "mdi:memory",
-            "name": "剩余内存",
-            "device_class": "data_size",
-            "value_template": "{{value_json.free_memory}}",
-            "unique_id": "%s.free_memory" % object_id,
-            "unit_of_measurement": "B",
-            "entity_category": "diagnostic"
-        },
-
-        "%s.uvs_resolution" % object_id: {
-            "platform": "select",
-            "icon": "mdi:numeric",
-            "name": "紫外线传感器分辨率(位)",
-            "value_template": "{{value_json.uvs_resolution}}",
-            "unique_id": "%s.uvs_resolution" % object_id,
-            "options": ["20", "19", "18", "17", "16", "13"],  # option list must be List[str]
-            # "entity_category": "diagnostic",
-            "command_template": "{\"uvs_resolution\":  \"{{value}}}\"",
-        },
-        "%s.uvs_rate" % object_id: {
-            "platform": "select",
-            "icon": "mdi:numeric",
-            "name": "紫外线传感器测量速率",
-            "value_template": "{{value_json.uvs_rate}}",
-            "unique_id": "%s.uvs_rate" % object_id,
-            "options": ["25ms", "50ms", "100ms", "200ms", "500ms", "1000ms", "2000ms"],
-            "command_template": "{\"uvs_rate\":  \"{{value}}\"}",
-        },
-        "%s.uvs_gain" % object_id: {
-            "platform": "select",
-            "icon": "mdi:numeric",
-            "name": "紫外线传感器增益",
-            "value_template": "{{value_json.uvs_gain}}",
-            "unique_id": "%s.uvs_gain" % object_id,
-            "options": ["1", "3", "6", "9", "18"],
-            "command_template": "{\"uvs_gain\":  \"{{value}}\"}",
-        },
-        "%s.uvs_sensitivity_max" % object_id: {
-            "platform": "number",
-            "icon": "mdi:numeric",
-            "name": "紫外线传感器sensitivity_max",
-            "value_template": "{{value_json.uvs_sensitivity_max}}",
-            "unique_id": "%s.uvs_sensitivity_max" % object_id,
-            "min": 0,
-            "max": 10000,
-            "step": 1,
-            "command_template": "{\"uvs_sensitivity_max\":  {{value}}}",
-        },
-        "%s.Wfac" % object_id: {
-            "platform": "number",
-            "icon": "mdi:numeric",
-            "name": "紫外线传感器Wfac",
-            "value_template": "{{value_json.Wfac}}",
-            "unique_id": "%s.Wfac" % object_id,
-            "min": 1,
-            "max": 10,
-            "step": 0.01,
-            "command_template": "{\"Wfac\":  {{value}}}",
-        },
-        "%s.altitude" % object_id: {
-            "platform": "number",
-            "icon": "mdi:terrain",
-            "name": "参考海拔高度",
-            "value_template": "{{value_json.altitude}}",
-            "unique_id": "%s.altitude" % object_id,
-            "min": -1000000,
-            "max": 1000000,
-            "step": 0.1,
-            "command_template": "{\"altitude\":  {{value}}}",
-        },
-        "%s.reset" % object_id: {
-            "platform": "button",
-            "name": "重启",
-            "icon": "mdi:restart",
-            "unique_id": "%s.reset" % object_id,
-            "entity_category": "diagnostic",
-            "command_template": "{\"reset\": \"{{value}}\"}",
-        }
-    },
-    "state_topic": state_topic,
-    "availability_topic": availability_topic,
-    "command_topic": command_topic,
-    "qos": 1
-}
-
 config['mqttv5'] = True
 # Optional: Set the properties for the connection
 config['mqttv5_con_props'] = {
@@ -401,8 +203,40 @@ client = MQTTClient(config)
 #     print((topic, msg, retained, properties))
 
 sensor_state = {}  # global sensor state
+deadbands = DEFAULT_DEADBANDS.copy()
+deadbands.update(netconfig["deadbands"])
+tracker = ChangeTracker(deadbands, netconfig["heartbeat_interval"])  # delta模式下记录已发送的状态
+components = discovery.components(netconfig)  # 按配置发布的HA实体
+serializer = StateSerializer(discovery.state_keys(components), {"pressure": 3})  # 字段顺序和discovery里的组件顺序一致
+state_topic_b = state_topic.encode()
+command_topic_b = command_topic.encode()
+discovery_hash_topic_b = discovery_hash_topic.encode()
+dart_timeouts = 0  # DART连续应答超时的次数
+# 状态只由send_state任务发送，serializer的缓冲区只有一块，也只在那里序列化
+state_wanted = asyncio.Event()  # 有登记的状态发送
+state_full = False  # 下一次发送完整状态
+state_keys = []  # 命令要求立即发送的键
+sending_since = None  # 正在进行的状态发送开始的ticks_ms，None表示空闲
+spool = Spool(SPOOL_FIELDS, max_segments=netconfig["spool_segments"])
 
 wdt = machine.WDT(timeout=30000) # 30 seconds watchdog
+profiler = Profiler(heap=netconfig["heap_attribution"]) if netconfig["profile_interval"] else None
+heap = HeapMonitor() if netconfig["heap_interval"] else None
+scheduler = Scheduler(debug=debug, profiler=profiler, heap=heap)
+
+
+def collect():
+    """代替gc.collect()，开启堆统计时先记下回收之前的分配量"""
+    if heap is None:
+        gc.collect()
+    else:
+        heap.collect()
+
+
+def heap_sample():
+    """在内存占用可能达到峰值的地方记录最低剩余"""
+    if heap is not None:
+        heap.sample()
 
 async def update_wdt():
     while True:
@@ -415,64 +249,231 @@ async def update_sensor_state(value: dict):
         # print(f"Sensor {sensor} updated to {value}")
 
 
-async def read_airdmod(airmod: AirMod):
+def dart_available(dart) -> bool:
+    """DART接上了并且最近有应答，这时ch2o用DART的读数"""
+    return dart is not None and dart_timeouts < netconfig["dart_max_timeouts"]
+
+
+async def read_airdmod(airmod: AirMod, dart=None):
+    record = airmod.record
+    version = record.version
     while True:
         await airmod.has_data.wait()
         airmod.has_data.clear()
-        data = airmod.data
+        if record.version == version:
+            continue
+        version = record.version
         dprint("got airmod data")
-        await update_sensor_state(data)
+        record.store(sensor_state, not dart_available(dart))  # 直接写入状态，不经过中间dict
+
+
+async def read_dart(dart: Dart):
+    """询问模式下读一次甲醛浓度，应答超时就保留上一次的值，连续超时太多次之后由read_airdmod接管ch2o"""
+    global dart_timeouts
+    try:
+        ch2o, ppb = await dart.query(0.5)
+    except asyncio.TimeoutError:
+        dprint("dart query timeout")
+        dart_timeouts += 1
+        if dart_timeouts == netconfig["dart_max_timeouts"]:
+            dprint("dart not responding, ch2o falls back to airmod")
+        return
+    dprint("got dart data")
+    dart_timeouts = 0
+    sensor_state["ch2o"] = ch2o
+
+
+async def read_sht4x(sht: sht4x.SHT4X):
+    temperature, humidity = await sht.measurements  # 一次转换同时得到温度和湿度
+    dprint("got sht4x data")
+    sensor_state["sht4x_temperature"] = temperature
+    sensor_state["sht4x_humidity"] = humidity
 
 
 async def read_ltr390(ltr390: LTR390):
-    while True:
-        data = await get_ltr390_data(ltr390)
-        dprint("got ltr390 data")
-        await update_sensor_state(data)
-        await asyncio.sleep_ms(200)  # Avoid busy waiting
+    data = await get_ltr390_data(ltr390)
+    dprint("got ltr390 data")
+    await update_sensor_state(data)
 
 
 async def read_bmp390(bmp390: BMP3XX_I2C):
-    while True:
-        data = {
-            "pressure": bmp390.pressure / 1000,
-            "pressure_temperature": bmp390.temperature,
-            "altitude": bmp390.altitude
-        }
-        dprint("got bmp390 data")
-        await update_sensor_state(data)
-        await asyncio.sleep(1)  # Avoid busy waiting
+    pressure, temperature, altitude = await bmp390.measure_forced()
+    data = {
+        "pressure": pressure / 1000,
+        "pressure_temperature": temperature,
+        "altitude": altitude
+    }
+    dprint("got bmp390 data")
+    await update_sensor_state(data)
 
 
 async def read_wifi(client: MQTTClient):
-    while True:
-        data = get_wifi_data(client)
-        dprint("got wifi data")
-        await update_sensor_state(data)
-        await asyncio.sleep(30)
+    data = get_wifi_data(client)
+    dprint("got wifi data")
+    await update_sensor_state(data)
 
 
 async def read_esp_info():
+    flash_size = esp.flash_size()  # byte
+    raw_temperature = (esp32.raw_temperature() - 32) / 1.8
+    size_info = os.statvfs('/flash')
+    flash_available = size_info[0] * size_info[3]
+    free = gc.mem_free()
+    await update_sensor_state({
+        "flash_size": flash_size,
+        "raw_temperature": raw_temperature,
+        "flash_available": flash_available,
+        "free_memory": free,
+    })
+
+
+i2c_last = {}  # bus name -> (ticks_us, busy_us)
+
+
+async def read_i2c_stats():
+    """各条I2C总线在上一个统计周期内的占用率和累计错误数"""
+    now = time.ticks_us()
+    data = {}
+    errors = 0
+    for bus in i2cbus.buses():
+        transactions, nbytes, bus_errors, busy_us = bus.stats()
+        errors += bus_errors
+        last = i2c_last.get(bus.name)
+        if last is not None:
+            elapsed = time.ticks_diff(now, last[0])
+            if elapsed > 0:
+                data["%s_usage" % bus.name] = 100 * (busy_us - last[1]) / elapsed
+        i2c_last[bus.name] = (now, busy_us)
+    data["i2c_errors"] = errors
+    await update_sensor_state(data)
+
+
+async def read_airmod_stats(airmod: AirMod):
+    """空气模块串口解析的诊断计数"""
+    await update_sensor_state(airmod.stats())
+
+
+async def read_profile(client: MQTTClient):
+    """上一个窗口的事件循环延迟和任务单步耗时，各任务的明细发到log topic"""
+    data = profiler.snapshot()
+    report = profiler.report()
+    if profiler.heap:
+        report = "%s; %s" % (report, profiler.alloc_report())
+    profiler.reset()
+    await update_sensor_state(data)
+    dprint(report)
+    if client.isconnected():
+        await client.publish(log_topic.encode(), report.encode())
+
+
+async def read_heap(client: MQTTClient):
+    """上一个窗口的最低剩余内存、最大空闲块和每个发布周期的分配量"""
+    data = heap.snapshot()
+    report = heap.report()
+    heap.reset()
+    await update_sensor_state(data)
+    dprint(report)
+    if client.isconnected():
+        await client.publish(log_topic.encode(), report.encode())
+
+
+def spawn(name, coro):
+    """创建长期运行的任务，开启统计时按name记录它每一步的耗时"""
+    if profiler is None:
+        return asyncio.create_task(coro)
+    return asyncio.create_task(profiler.run(name, coro))
+
+
+last_spool = None  # 上一次缓存采样的ticks_ms
+clock_synced = False  # RTC是否用NTP校准过，没有校准过的采样时间戳记为未知
+
+
+def sync_clock(timeout=1):
+    """
+    用NTP校准RTC，只需要成功一次；ntptime.settime()会阻塞事件循环，最多timeout秒
+    开机时在调度器启动之前调用，之后重连时只在还没校准过的情况下用更短的超时再试
+    """
+    global clock_synced
+    if clock_synced:
+        return
+    ntptime.host = netconfig["ntp_host"]
+    ntptime.timeout = timeout
+    try:
+        ntptime.settime()
+    except (OSError, OverflowError) as e:
+        dprint(f"ntp sync fail: {e}")
+        return
+    clock_synced = True
+
+
+def request_state(keys=None):
+    """
+    登记一次状态发送，由send_state任务完成，调用方不等待网络
+    :param keys: None表示发送完整状态；否则是必须发送的键，delta模式下再加上超过死区的变化
+    """
+    global state_full
+    if keys is None:
+        state_full = True
+    else:
+        for key in keys:
+            if key not in state_keys:
+                state_keys.append(key)
+    state_wanted.set()
+
+
+def next_state():
+    """取出登记的发送并序列化，没有需要发送的键时返回None"""
+    global state_full
+    keys = None  # 完整状态
+    if not state_full:
+        if netconfig["publish_mode"] != "delta":
+            keys = state_keys
+        elif not tracker.heartbeat_due():
+            keys = tracker.changes(sensor_state)
+            for key in state_keys:
+                if key not in keys:
+                    keys.append(key)
+        if keys is not None and not keys:
+            return None
+    payload = serializer.serialize(sensor_state, keys)
+    if netconfig["publish_mode"] == "delta":
+        # 紧接着序列化记录，记下的就是发出去的值；发送期间其他任务写入的新值留给下一次比较
+        tracker.mark_sent(sensor_state, keys)
+    state_full = False
+    state_keys.clear()
+    return payload
+
+
+async def send_state(client: MQTTClient):
+    """唯一发送状态的任务，发送卡住的时候publish_data和命令处理不会跟着阻塞"""
+    global sending_since
     while True:
-        flash_size = esp.flash_size()  # byte
-        raw_temperature = (esp32.raw_temperature() - 32) / 1.8
-        size_info = os.statvfs('/flash')
-        flash_available = size_info[0] * size_info[3]
-        free = gc.mem_free()
-        await update_sensor_state({
-            "flash_size": flash_size,
-            "raw_temperature": raw_temperature,
-            "flash_available": flash_available,
-            "free_memory": free,
-        })
-        await asyncio.sleep(60)
+        await state_wanted.wait()
+        state_wanted.clear()
+        payload = next_state()
+        if payload is None:
+            continue
+        sending_since = time.ticks_ms()
+        await client.publish(state_topic_b, payload, qos=1)  # 断网时mqtt_as一直重试到重新连上
+        sending_since = None
+
+
+def link_stalled() -> bool:
+    """上一次状态发送超过publish_timeout还没完成，mqtt_as可能还没发现断线"""
+    return sending_since is not None and \
+        time.ticks_diff(time.ticks_ms(), sending_since) >= netconfig["publish_timeout"] * 1000
 
 
 async def publish_data(client: MQTTClient):
-    await asyncio.sleep(5)  # Wait for the first data in sensor state
-    while True:
-        await client.publish(state_topic.encode(), json.dumps(sensor_state).encode(), qos=1)  # do not block
-        await asyncio.sleep(1)
+    """每个发布周期登记一次发送；断网或者发送卡住的时候改为缓存到flash"""
+    global last_spool
+    if not client.isconnected() or link_stalled():
+        now = time.ticks_ms()
+        if last_spool is None or time.ticks_diff(now, last_spool) >= netconfig["spool_interval"] * 1000:
+            spool.append(sensor_state, time.time() if clock_synced else 0)
+            last_spool = now
+        return
+    request_state(None if netconfig["publish_mode"] != "delta" else ())
 
 
 # async def read_sensors(client: MQTTClient, airmod: AirMod, ltr390: LTR390):
@@ -497,66 +498,109 @@ def get_wifi_data(client: MQTTClient) -> dict:
     return attr_data
 
 
-async def get_ltr390_data(ltr390: LTR390) -> dict:
-    re, rate = ltr390.get_resolution_rate()
-    if re == LTR390.RESOLUTION_13BIT_TIME12_5MS:
-        re = "13"
-    elif re == LTR390.RESOLUTION_16BIT_TIME25MS:
-        re = "16"
-    elif re == LTR390.RESOLUTION_17BIT_TIME50MS:
-        re = "17"
-    elif re == LTR390.RESOLUTION_18BIT_TIME100MS:
-        re = "18"
-    elif re == LTR390.RESOLUTION_19BIT_TIME200MS:
-        re = "19"
-    elif re == LTR390.RESOLUTION_20BIT_TIME400MS:
-        re = "20"
-
-    if rate == LTR390.RATE_25MS:
-        rate = "25ms"
-    elif rate == LTR390.RATE_50MS:
-        rate = "50ms"
-    elif rate == LTR390.RATE_100MS:
-        rate = "100ms"
-    elif rate == LTR390.RATE_200MS:
-        rate = "200ms"
-    elif rate == LTR390.RATE_500MS:
-        rate = "500ms"
-    elif rate == LTR390.RATE_1000MS:
-        rate = "1000ms"
-    elif rate == LTR390.RATE_2000MS:
-        rate = "2000ms"
-    gain = ltr390.get_gain()
-    if gain == LTR390.GAIN_1:
-        gain = "1"
-    elif gain == LTR390.GAIN_3:
-        gain = "3"
-    elif gain == LTR390.GAIN_6:
-        gain = "6"
-    elif gain == LTR390.GAIN_9:
-        gain = "9"
-    elif gain == LTR390.GAIN_18:
-        gain = "18"
-    attr_data = {
-        "light": await ltr390.read_als(),
-        "uv": await ltr390.read_uvs(),
-        "uvs_resolution": re,
-        "uvs_rate": rate,
-        "uvs_gain": gain,
+def ltr390_settings(ltr390: LTR390) -> dict:
+    """LTR390的可调参数，和discovery里的select/number组件对应"""
+    return {
+        "uvs_resolution": ltr390.resolution_label,
+        "uvs_rate": ltr390.rate_label,
+        "uvs_gain": ltr390.gain_label,
         "uvs_sensitivity_max": ltr390.sensitivity_max,
         "Wfac": ltr390.wfac,
     }
+
+
+async def get_ltr390_data(ltr390: LTR390) -> dict:
+    attr_data = ltr390_settings(ltr390)
+    attr_data["light"] = await ltr390.read_als()
+    attr_data["uv"] = await ltr390.read_uvs()
     return attr_data
 
 
+def load_discovery_hash():
+    try:
+        with open(DISCOVERY_HASH_FILE, 'rb') as f:
+            return f.read()
+    except OSError:
+        return None
+
+
+def save_discovery_hash(digest: bytes):
+    with open(DISCOVERY_HASH_FILE, 'wb') as f:
+        f.write(digest)
+
+
+retained_hash = None  # broker上保留的discovery hash，由listen_mqtt收到后填写
+retained_hash_received = asyncio.Event()
+
+
+async def fetch_retained_hash(client: MQTTClient, listening: bool, timeout=3):
+    """
+    订阅hash topic取回broker上保留的hash，超时没有收到说明broker丢了retained消息
+    :param listening: listen_mqtt是否已经在消费client.queue
+    """
+    global retained_hash
+    retained_hash = None
+    retained_hash_received.clear()
+    topic_b = discovery_hash_topic_b
+    await client.subscribe(topic_b, qos=1)
+    try:
+        if listening:
+            await asyncio.wait_for(retained_hash_received.wait(), timeout)
+            return retained_hash
+        while True:
+            topic, msg, retained, properties = await asyncio.wait_for(client.queue.__anext__(), timeout)
+            if topic == topic_b:
+                return bytes(msg)
+    except asyncio.TimeoutError:
+        return None
+    finally:
+        await client.unsubscribe(topic_b)
+
+
+async def publish_discovery(client: MQTTClient, listening=False):
+    """发布retained discovery信息，本地和broker上的hash都没变时跳过"""
+    digest, size = discovery.fingerprint(object_id, state_topic, availability_topic, command_topic, components)
+    if load_discovery_hash() == digest:
+        if await fetch_retained_hash(client, listening) == digest:
+            dprint("discovery unchanged, skip publishing")
+            return
+        dprint("broker lost retained discovery, republish")
+    collect()
+    payload = discovery.build_payload(size, object_id, state_topic, availability_topic, command_topic, components)
+    heap_sample()
+    await client.publish(discovery_topic.encode(), payload, retain=True, qos=1)
+    del payload
+    collect()
+    await client.publish(discovery_hash_topic_b, digest, retain=True, qos=1)
+    save_discovery_hash(digest)
+
+
+async def forward_spool(client: MQTTClient):
+    """把断网期间缓存的采样按固定速率发到history topic，HA不会读取这些数据，见history_topic"""
+    topic = history_topic.encode()
+
+    async def send(payload):
+        await client.publish(topic, payload, qos=1)
+
+    await spool.replay(send, batch=20, interval=1)
+    if spool.dropped:
+        await client.publish(log_topic.encode(), f"spool dropped {spool.dropped} samples".encode())
+        spool.dropped = 0
+
+
 async def handle_online(client: MQTTClient):
     # global ap
     while True:
         await client.up.wait()
         client.up.clear()
         # await setup_ap(False)
+        sync_clock(0.3)  # 开机时没有校准成功才会真的执行
+        await publish_discovery(client, listening=True)  # broker可能重启过
         await client.publish(availability_topic.encode(), b"online", retain=True, qos=1)
-        await client.subscribe(command_topic.encode(), qos=1)
+        await client.subscribe(command_topic_b, qos=1)
+        tracker.reset()  # 断线期间HA可能已经重启，重新发送完整状态
+        if spool.pending():
+            asyncio.create_task(forward_spool(client))
 
 
 async def handle_offline():
@@ -566,123 +610,226 @@ async def handle_offline():
         # await setup_ap(True)
 
 
+class CommandContext:
+    """命令处理函数共用的设备和暂存的LTR390配置"""
+    __slots__ = ("client", "ltr390", "bmp390", "ltr390_config")
+
+    def __init__(self, client, ltr390, bmp390):
+        self.client = client
+        self.ltr390 = ltr390
+        self.bmp390 = bmp390
+        self.ltr390_config = {}  # 这条消息里的分辨率/速率/增益，处理完所有键之后一次写入
+
+
+# 命令键 -> (validate, handler, state keys)
+# validate把负载里的值转换成handler需要的参数，值不合法时抛出ValueError/KeyError/TypeError；
+# handler是async def handler(ctx, value, payload)；state keys是执行之后需要立刻发布的状态
+COMMANDS = {}
+
+
+def command(key, validate=None, state_keys=()):
+    def register(handler):
+        COMMANDS[key] = (validate, handler, state_keys)
+        return handler
+
+    return register
+
+
+def number(low, high):
+    """数值在[low, high]之内，和discovery里number组件的min/max一致"""
+
+    def validate(value):
+        value = float(value)
+        if not low <= value <= high:
+            raise ValueError("out of range")
+        return value
+
+    return validate
+
+
+LTR390_RESOLUTIONS = {
+    20: LTR390.RESOLUTION_20BIT_TIME400MS,
+    19: LTR390.RESOLUTION_19BIT_TIME200MS,
+    18: LTR390.RESOLUTION_18BIT_TIME100MS,
+    17: LTR390.RESOLUTION_17BIT_TIME50MS,
+    16: LTR390.RESOLUTION_16BIT_TIME25MS,
+    13: LTR390.RESOLUTION_13BIT_TIME12_5MS,
+}
+LTR390_RATES = {
+    "25ms": LTR390.RATE_25MS,
+    "50ms": LTR390.RATE_50MS,
+    "100ms": LTR390.RATE_100MS,
+    "200ms": LTR390.RATE_200MS,
+    "500ms": LTR390.RATE_500MS,
+    "1000ms": LTR390.RATE_1000MS,
+    "2000ms": LTR390.RATE_2000MS,
+}
+LTR390_GAINS = {
+    1: LTR390.GAIN_1,
+    3: LTR390.GAIN_3,
+    6: LTR390.GAIN_6,
+    9: LTR390.GAIN_9,
+    18: LTR390.GAIN_18,
+}
+
+
+@command("uvs_resolution", lambda value: LTR390_RESOLUTIONS[int(value)], ("uvs_resolution",))
+async def set_uvs_resolution(ctx: CommandContext, value, payload):
+    ctx.ltr390_config["resolution"] = value
+
+
+@command("uvs_rate", lambda value: LTR390_RATES[value], ("uvs_rate",))
+async def set_uvs_rate(ctx: CommandContext, value, payload):
+    ctx.ltr390_config["rate"] = value
+
+
+@command("uvs_gain", lambda value: LTR390_GAINS[int(value)], ("uvs_gain",))
+async def set_uvs_gain(ctx: CommandContext, value, payload):
+    ctx.ltr390_config["gain"] = value
+
+
+@command("Wfac", number(1, 10), ("Wfac",))
+async def set_wfac(ctx: CommandContext, value, payload):
+    async with ctx.ltr390.lock:  # 不在读取中途换系数
+        ctx.ltr390.wfac = value
+
+
+@command("uvs_sensitivity_max", number(1, 10000), ("uvs_sensitivity_max",))
+async def set_uvs_sensitivity_max(ctx: CommandContext, value, payload):
+    async with ctx.ltr390.lock:
+        ctx.ltr390.sensitivity_max = value
+
+
+@command("altitude", number(-1000000, 1000000), ("pressure", "pressure_temperature", "altitude"))
+async def set_altitude(ctx: CommandContext, value, payload):
+    """气压传感器设置当前海拔，校准之后马上测一次"""
+    bmp390 = ctx.bmp390
+    async with bmp390.lock:  # 复位和校准期间不能插入调度器的强制测量
+        while not bmp390.begin():
+            dprint('Please check that the device is properly connected')
+            await asyncio.sleep(3)
+        while not bmp390.set_common_sampling_mode(BMP3XX_I2C.ULTRA_PRECISION):
+            dprint('Set samping mode fail, retrying...')
+            await asyncio.sleep(3)
+        if bmp390.calibrated_absolute_difference(value):
+            dprint("Absolute difference base value set successfully!")
+    await bmp390.set_power_mode_async(BMP3XX_I2C.SLEEP_MODE)  # 自己拿锁
+    await read_bmp390(bmp390)
+
+
+@command("reset")
+async def reset_device(ctx: CommandContext, value, payload):
+    dprint("reset")
+    machine.reset()
+
+
+@command("file", str)
+async def update_file(ctx: CommandContext, filename, payload):
+    """
+    {"file": filename, "verify": true} 在log topic上返回文件的md5
+    {"file": filename, "content": "base64 content or text", "bin": False, "url": "http://xxx"} 写入或者下载文件
+    只有file没有content/url时删除文件
+    """
+    client = ctx.client
+    if payload.get("verify"):
+        dprint("verify")
+        md5 = hashlib.md5()
+        with open(filename, "rb") as f:
+            while data := f.read(100):
+                md5.update(data)
+        await client.publish(log_topic.encode(), binascii.hexlify(md5.digest()))
+        return
+    dprint("update")
+    content = payload.get("content", None)
+    url = payload.get("url", None)
+    if not content and not url:
+        os.remove(filename)
+        return
+    if url:
+        try:
+            collect()
+            import aiohttp
+            with open(filename, "wb") as f:
+                async with aiohttp.ClientSession() as session:
+                    async with session.get(url) as response:
+                        while chunk := await response.read(100):  # type: ignore
+                            f.write(chunk)
+        except Exception as e:  # 可能内存不够
+            await client.publish(log_topic.encode(), str(e).encode())
+        return
+    if payload.get("bin", False):
+        with open(filename, "wb") as f:
+            f.write(binascii.a2b_base64(content))
+    else:
+        with open(filename, "w") as f:
+            f.write(content)
+    heap_sample()
+    dprint("update done")
+
+
+@command("ota")
+async def ota_update(ctx: CommandContext, value, payload):
+    """{"ota": True, "url": "micropython.bin"}"""
+    try:
+        collect()
+        import ota.update
+        heap_sample()
+        collect()
+        ota.update.from_file(payload["url"], reboot=True)
+    except Exception as e:  # 可能内存不够
+        await ctx.client.publish(log_topic.encode(), str(e).encode())
+
+
+async def handle_command(ctx: CommandContext, payload: dict):
+    """按COMMANDS分发一条命令消息，执行完之后立刻发布受影响的状态，不用等下一次发布"""
+    changed = []
+    for key, value in payload.items():
+        entry = COMMANDS.get(key)
+        if entry is None:  # content/url/bin之类的参数键
+            continue
+        validate, handler, state_keys = entry
+        if validate is not None:
+            try:
+                value = validate(value)
+            except (ValueError, KeyError, TypeError):
+                dprint("invalid %s: %r" % (key, value))
+                await ctx.client.publish(log_topic.encode(), ("invalid %s: %r" % (key, value)).encode())
+                continue
+        dprint("change %s" % key)
+        await handler(ctx, value, payload)
+        changed.extend(state_keys)
+    if ctx.ltr390_config:
+        await ctx.ltr390.configure_async(**ctx.ltr390_config)  # 分辨率/速率/增益合并成一次写入
+        ctx.ltr390_config.clear()
+    if not changed:
+        return
+    sensor_state.update(ltr390_settings(ctx.ltr390))
+    request_state(changed)  # 交给send_state，不等下一个发布周期
+
+
 async def listen_mqtt(client: MQTTClient, ltr390: LTR390, bmp390: BMP3XX_I2C):
-    resolution_map = {
-        20: LTR390.RESOLUTION_20BIT_TIME400MS,
-        19: LTR390.RESOLUTION_19BIT_TIME200MS,
-        18: LTR390.RESOLUTION_18BIT_TIME100MS,
-        17: LTR390.RESOLUTION_17BIT_TIME50MS,
-        16: LTR390.RESOLUTION_16BIT_TIME25MS,
-        13: LTR390.RESOLUTION_13BIT_TIME12_5MS,
-    }
-    rate_map = {
-        "25ms": LTR390.RATE_25MS,
-        "50ms": LTR390.RATE_50MS,
-        "100ms": LTR390.RATE_100MS,
-        "200ms": LTR390.RATE_200MS,
-        "500ms": LTR390.RATE_500MS,
-        "1000ms": LTR390.RATE_1000MS,
-        "2000ms": LTR390.RATE_2000MS,
-    }
+    global retained_hash
+    ctx = CommandContext(client, ltr390, bmp390)
     async for topic, msg, retained, properties in client.queue:
-        if topic == command_topic.encode():
-            dprint(f"Received command: {msg.decode()}")
+        if topic == discovery_hash_topic_b:
+            retained_hash = bytes(msg)
+            retained_hash_received.set()
+            continue
+        if topic == command_topic_b:
+            dprint("Received command:", msg)
             try:
-                payload = json.loads(msg.decode())
-            except:
+                payload = json.loads(msg)
+            except ValueError:
                 dprint("Invalid JSON payload received in command topic")
                 continue
-            if "uvs_resolution" in payload:
-                dprint("change uvs_resolution")
-                uvs_resolution: int = int(payload["uvs_resolution"])
-                _, rate = ltr390.get_resolution_rate()
-                ltr390.set_resolution_rate(resolution_map[uvs_resolution], rate)
-            if "uvs_rate" in payload:
-                dprint("change uvs_rate")
-                uvs_rate: str = payload["uvs_rate"]
-                resolution, _ = ltr390.get_resolution_rate()
-                ltr390.set_resolution_rate(resolution, rate_map[uvs_rate])
-            if "Wfac" in payload:
-                dprint("change Wfac")
-                Wfac: float = payload["Wfac"]
-                ltr390.wfac = Wfac
-            if "uvs_gain" in payload:
-                dprint("change uvs_gain")
-                uvs_gain: int = int(payload["uvs_gain"])
-                if uvs_gain == 1:
-                    uvs_gain = LTR390.GAIN_1
-                elif uvs_gain == 3:
-                    uvs_gain = LTR390.GAIN_3
-                elif uvs_gain == 6:
-                    uvs_gain = LTR390.GAIN_6
-                elif uvs_gain == 9:
-                    uvs_gain = LTR390.GAIN_9
-                elif uvs_gain == 18:
-                    uvs_gain = LTR390.GAIN_18
-                ltr390.set_gain(uvs_gain)
-            if "uvs_sensitivity_max" in payload:
-                dprint("change uvs_sensitivity_max")
-                uvs_sensitivity_max = payload["uvs_sensitivity_max"]
-                ltr390.sensitivity_max = uvs_sensitivity_max
-            if "altitude" in payload:  # 气压传感器设置当前海拔
-                dprint("change altitude")
-                altitude: float = payload["altitude"]
-                while not bmp390.begin():
-                    dprint('Please check that the device is properly connected')
-                    await asyncio.sleep(3)
-                while not bmp390.set_common_sampling_mode(BMP3XX_I2C.ULTRA_PRECISION):
-                    dprint('Set samping mode fail, retrying...')
-                    await asyncio.sleep(3)
-                if bmp390.calibrated_absolute_difference(altitude):
-                    dprint("Absolute difference base value set successfully!")
-            if "reset" in payload:
-                dprint("reset")
-                machine.reset()
-            if "verify" in payload:  # {"file": filename, "verify": true}
-                dprint("verify")
-                md5 = hashlib.md5()
-                with open(payload["file"], "rb") as f:
-                    while data := f.read(100):
-                        md5.update(data)
-                ret = binascii.hexlify(md5.digest())
-                await client.publish(log_topic.encode(), ret)
+            if not isinstance(payload, dict):
+                dprint("Command payload is not a JSON object")
                 continue
-            if "file" in payload: # {"file": filename, "content": "base64 content or text", "bin": False, "url": "http://xxx"}
-                dprint("update")
-                filename = payload["file"]
-                content = payload.get("content", None)
-                bin_ = payload.get("bin", False)
-                url = payload.get("url", None)
-                if not content and not url:
-                    os.remove(filename)
-                    continue
-                if url:
-                    try:
-                        gc.collect()
-                        import aiohttp
-                        with open(filename, "wb") as f:
-                            async with aiohttp.ClientSession() as session:
-                                async with session.get(url) as response:
-                                    while chunk := await response.read(100):  # type: ignore
-                                        f.write(chunk)
-                    except Exception as e:  # 可能内存不够
-                        await client.publish(log_topic.encode(), str(e).encode())
-                    continue
-                if bin_:
-                    with open(filename, "wb") as f:
-                        f.write(binascii.a2b_base64(content))
-                else:
-                    with open(filename, "w") as f:
-                        f.write(content)
-                dprint("update done")
-            if "ota" in payload: #  {"ota": True, "url": "micropython.bin"}
-                try:
-                    gc.collect()
-                    import ota.update
-                    gc.collect()
-                    ota.update.from_file(payload["url"], reboot=True)
-                except Exception as e:  # 可能内存不够
-                    await client.publish(log_topic.encode(), str(e).encode())
+            try:
+                await handle_command(ctx, payload)
+            except Exception as e:
+                dprint("command failed: %s" % e)
+                await client.publish(log_topic.encode(), ("command failed: %s" % e).encode())
 
 
 async def main(client: MQTTClient):
@@ -697,12 +844,14 @@ async def main(client: MQTTClient):
         await client.up.wait()
         client.up.clear()
         dprint("client ready")
+        sync_clock()
         await client.publish(log_topic.encode(), f"mpy version {sys.version}".encode())
-        await client.subscribe(command_topic.encode(), qos=1)
-
-        await client.publish(discovery_topic.encode(), json.dumps(discovery_payload).encode(), retain=True, qos=1)
+        await publish_discovery(client)  # 先于订阅command topic，期间直接从client.queue取消息
+        await client.subscribe(command_topic_b, qos=1)
         await client.publish(availability_topic.encode(), b"online", retain=True, qos=1)
         dprint("online info published")
+        if spool.pending():  # 上次断网期间重启留下的缓存
+            asyncio.create_task(forward_spool(client))
         try:
             airmod = AirMod(1, 17, 16)
         except Exception as e:
@@ -711,10 +860,23 @@ async def main(client: MQTTClient):
             return
         dprint("Connected to airmod uart")
         await client.publish(log_topic.encode(), b"Connected to airmod uart")
+        dart = None
+        if netconfig["dart_uart"] is not None:
+            try:
+                dart = Dart(*netconfig["dart_uart"])
+                await dart.ask_mode()
+            except Exception as e:
+                dprint(f"create dart uart fail: {e}")
+                await client.publish(log_topic.encode(), f"create dart uart fail: {e}".encode())
+                dart = None  # 没有DART也能继续用空气模块的ch2o
+            else:
+                dprint("Connected to dart uart")
+                await client.publish(log_topic.encode(), b"Connected to dart uart")
         try:
-            i2c = machine.I2C(1, sda=machine.Pin(18), scl=machine.Pin(19), freq=400000)
-            ltr390 = LTR390(i2c, LTR390.GAIN_18, 1400, debug)
-            ltr390.set_thresh(5, 20)
+            i2c = i2cbus.get_bus(1, *I2C_PINS[1])
+            ltr390 = LTR390(i2c, LTR390.GAIN_18, 1400, debug, netconfig["ltr390_int_pin"])
+            if netconfig["ltr390_int_pin"] is None:
+                ltr390.set_thresh(5, 20)
         except Exception as e:
             dprint(f"create ltr390 iic fail: {e}")
             await client.publish(log_topic.encode(), f"create ltr390 iic fail: {e}".encode())
@@ -722,7 +884,7 @@ async def main(client: MQTTClient):
         dprint("Connected to ltr390 iic uv sensor")
         await client.publish(log_topic.encode(), b"Connected to ltr390 iic uv sensor")
         try:
-            i2c2 = machine.I2C(0, sda=machine.Pin(4), scl=machine.Pin(5), freq=40000)
+            i2c2 = i2cbus.get_bus(0, *I2C_PINS[0])
             bmp390 = BMP3XX_I2C(i2c2, 0x77, debug)
             while not bmp390.begin():
                 dprint('Please check that the device is properly connected')
@@ -732,23 +894,55 @@ async def main(client: MQTTClient):
                 await asyncio.sleep(3)
             if bmp390.calibrated_absolute_difference(280.0):
                 dprint("Absolute difference base value set successfully!")
+            # 校准完进入睡眠，之后每次读取用强制模式只转换一次
+            await bmp390.set_power_mode_async(BMP3XX_I2C.SLEEP_MODE)
         except Exception as e:
             dprint(f"create bmp390 iic fail: {e}")
             await client.publish(log_topic.encode(), f"create bmp390 iic fail: {e}".encode())
             return
         dprint("Connected to bmp390 iic pressure sensor")
         await client.publish(log_topic.encode(), b"Connected to bmp390 iic pressure sensor")
-        t1 = asyncio.create_task(handle_online(client))
+        sht = None
+        if netconfig["sht4x_bus"] is not None:
+            try:
+                sht = sht4x.SHT4X(i2cbus.get_bus(netconfig["sht4x_bus"], *I2C_PINS[netconfig["sht4x_bus"]]))
+                sht.temperature_precision = SHT4X_PRECISIONS[netconfig["sht4x_precision"]]
+                await sht.reset()
+            except Exception as e:
+                dprint(f"create sht4x iic fail: {e}")
+                await client.publish(log_topic.encode(), f"create sht4x iic fail: {e}".encode())
+                sht = None  # SHT4X是可选的，失败了不影响其他传感器
+            else:
+                dprint("Connected to sht4x iic temperature sensor")
+                await client.publish(log_topic.encode(), b"Connected to sht4x iic temperature sensor")
+        t1 = spawn("online", handle_online(client))
         # asyncio.create_task(handle_offline())
-        t2 = asyncio.create_task(listen_mqtt(client, ltr390, bmp390))
-        t3 = asyncio.create_task(read_airdmod(airmod))
-        t4 = asyncio.create_task(read_ltr390(ltr390))
-        t5 = asyncio.create_task(read_wifi(client))
-        t6 = asyncio.create_task(read_bmp390(bmp390))
-        t7 = asyncio.create_task(read_esp_info())
-        t8 = asyncio.create_task(publish_data(client))
-        t9 = asyncio.create_task(update_wdt())
-        await asyncio.gather(t1, t2, t3, t4, t5, t6, t7, t8, t9)
+        t2 = spawn("listen", listen_mqtt(client, ltr390, bmp390))
+        t6 = spawn("sender", send_state(client))  # 唯一发送状态的任务
+        t3 = spawn("airmod", read_airdmod(airmod, dart))
+        # 周期性的读取和发布都由同一个调度器执行，读取对齐到发布之前，保证每次发布的数据都是新的
+        # wdt单独一个任务，publish阻塞的时候也能喂狗
+        publish_ms = int(netconfig["publish_interval"] * 1000)
+        scheduler.add_publish("publish", publish_ms, lambda: publish_data(client), delay=5000,
+                              collect=netconfig["idle_collect"])  # Wait for the first data in sensor state
+        scheduler.add("ltr390", 2000, lambda: read_ltr390(ltr390), lead=1500)
+        scheduler.add("bmp390", 1000, lambda: read_bmp390(bmp390), lead=100)
+        if sht is not None:
+            scheduler.add("sht4x", int(netconfig["sht4x_interval"] * 1000), lambda: read_sht4x(sht), lead=100)
+        if dart is not None:
+            scheduler.add("dart", 1000, lambda: read_dart(dart), lead=600)  # 在发布前询问，留出应答超时的时间
+        scheduler.add("wifi", 30000, lambda: read_wifi(client), lead=100)
+        scheduler.add("esp_info", 60000, read_esp_info, lead=100)
+        scheduler.add("i2c", 60000, read_i2c_stats, lead=100)
+        scheduler.add("airmod_stats", 60000, lambda: read_airmod_stats(airmod), lead=100)
+        if profiler is not None:
+            scheduler.add("profile", int(netconfig["profile_interval"] * 1000), lambda: read_profile(client), lead=100)
+            asyncio.create_task(profiler.probe())
+        if heap is not None:
+            scheduler.add("heap", int(netconfig["heap_interval"] * 1000), lambda: read_heap(client), lead=100)
+        t4 = asyncio.create_task(scheduler.run())
+        t5 = spawn("wdt", update_wdt())
+        await asyncio.gather(t1, t2, t3, t4, t5, t6)
         # await read_sensors(client, airmod, ltr390)
     except OSError as e:
         dprint(f"Connection failed: {str(e)}.")
@@ -0,0 +1,196 @@
+# -*- coding: utf-8 -*-
+"""
+Copyright (c) 2008-2025 synodriver <diguohuangjiajinweijun@gmail.com>
+
+事件循环的轻量级性能统计
+- 延迟探针：一个固定周期sleep的任务，实际唤醒时间和预定时间之差就是事件循环被占用的时间
+- 任务单步耗时：wrap()包装的协程每次从恢复执行到再次让出都用ticks_us计时，单步耗时就是这个任务阻塞事件循环的时间
+统计都放在固定的分桶直方图里，记录一次只有两次ticks_us和几次整数比较，不分配内存，可以在生产环境一直开着
+heap=True时每一步还会比较前后的gc.mem_alloc()，把分配量记到任务上；mem_alloc要扫描整个堆的分配表，默认关闭
+"""
+import asyncio
+import gc
+import time
+
+try:
+    from types import coroutine
+except ImportError:  # micropython的生成器本身就可以await
+    def coroutine(fn):
+        return fn
+
+# 直方图分桶的上界(us)，1-2-5序列，最后一个桶放所有更大的值
+BOUNDS = (50, 100, 200, 500, 1000, 2000, 5000, 10000, 20000, 50000, 100000, 200000, 500000, 1000000)
+
+
+class Histogram:
+    """
+    固定分桶的直方图，分位数取所在桶的上界，最大值是精确的
+    """
+
+    def __init__(self):
+        self.counts = [0] * (len(BOUNDS) + 1)
+        self.total = 0
+        self.max = 0
+
+    def add(self, us):
+        i = 0
+        for bound in BOUNDS:
+            if us <= bound:
+                break
+            i += 1
+        self.counts[i] += 1
+        self.total += 1
+        if us > self.max:
+            self.max = us
+
+    def percentile(self, p):
+        """第p百分位(us)，没有样本时返回0"""
+        if not self.total:
+            return 0
+        rank = (self.total * p + 99) // 100
+        seen = 0
+        for i, count in enumerate(self.counts):
+            seen += count
+            if seen >= rank:
+                return min(BOUNDS[i], self.max) if i < len(BOUNDS) else self.max
+        return self.max
+
+    def reset(self):
+        counts = self.counts
+        for i in range(len(counts)):
+            counts[i] = 0
+        self.total = 0
+        self.max = 0
+
+
+class TaskStat:
+    __slots__ = ("name", "steps", "busy_us", "max_us", "alloc")
+
+    def __init__(self, name):
+        self.name = name
+        self.steps = 0
+        self.busy_us = 0  # 统计窗口内实际占用事件循环的时间
+        self.max_us = 0  # 最长的一步
+        self.alloc = 0  # 统计窗口内分配的字节数，只在Profiler(heap=True)时记录
+
+
+@coroutine
+def _timed(profiler, stat, coro):
+    """逐步驱动coro，统计每一步的耗时；外层事件循环发来的值和异常原样转交"""
+    value = None
+    exc = None
+    heap = profiler.heap
+    used = 0
+    while True:
+        if heap:
+            used = gc.mem_alloc()
+        start = time.ticks_us()
+        try:
+            if exc is None:
+                yielded = coro.send(value)
+            else:
+                yielded = coro.throw(exc)
+        except StopIteration as e:
+            profiler._step(stat, time.ticks_diff(time.ticks_us(), start), used)
+            return e.value
+        except BaseException:
+            profiler._step(stat, time.ticks_diff(time.ticks_us(), start), used)
+            raise
+        profiler._step(stat, time.ticks_diff(time.ticks_us(), start), used)
+        exc = None
+        value = None
+        try:
+            value = yield yielded
+        except GeneratorExit:
+            coro.close()
+            raise
+        except BaseException as e:  # 取消等
+            exc = e
+
+
+class Profiler:
+    def __init__(self, probe_ms=100, heap=False):
+        """
+        :param probe_ms: 延迟探针的唤醒周期
+        :param heap: 是否按任务统计分配的内存
+        """
+        self.probe_ms = probe_ms
+        self.heap = heap
+        self.lag = Histogram()  # 探针的唤醒延迟
+        self.steps = Histogram()  # 所有包装过的任务的单步耗时
+        self._tasks = {}
+        self._window_start = time.ticks_ms()
+
+    def _stat(self, name):
+        stat = self._tasks.get(name)
+        if stat is None:
+            stat = self._tasks[name] = TaskStat(name)
+        return stat
+
+    def _step(self, stat, us, used):
+        stat.steps += 1
+        stat.busy_us += us
+        if us > stat.max_us:
+            stat.max_us = us
+        self.steps.add(us)
+        if self.heap:
+            alloc = gc.mem_alloc() - used
+            if alloc > 0:  # 小于0说明这一步里自动gc回收过
+                stat.alloc += alloc
+
+    def wrap(self, name, coro):
+        """返回可以await的包装，统计coro每一步的耗时，同名的协程计入同一项"""
+        return _timed(self, self._stat(name), coro)
+
+    async def run(self, name, coro):
+        """wrap()之后直接await，可以交给asyncio.create_task"""
+        return await self.wrap(name, coro)
+
+    async def probe(self):
+        """延迟探针任务"""
+        period_us = self.probe_ms * 1000
+        while True:
+            start = time.ticks_us()
+            await asyncio.sleep_ms(self.probe_ms)
+            lag = time.ticks_diff(time.ticks_us(), start) - period_us
+            self.lag.add(lag if lag > 0 else 0)
+
+    def snapshot(self) -> dict:
+        """当前统计窗口的结果(ms)，用reset()开始新的窗口"""
+        lag = self.lag
+        steps = self.steps
+        worst = None
+        for stat in self._tasks.values():
+            if worst is None or stat.max_us > worst.max_us:
+                worst = stat
+        return {
+            "loop_lag_p50": lag.percentile(50) / 1000,
+            "loop_lag_p99": lag.percentile(99) / 1000,
+            "loop_lag_max": lag.max / 1000,
+            "task_step_p50": steps.percentile(50) / 1000,
+            "task_step_p99": steps.percentile(99) / 1000,
+            "task_step_max": steps.max / 1000,
+            "blocking_task": worst.name if worst is not None and worst.steps else None,
+        }
+
+    def report(self) -> str:
+        """当前窗口内每个任务的 最长单步ms/占用率%，按最长单步排序"""
+        elapsed = time.ticks_diff(time.ticks_ms(), self._window_start) or 1
+        stats = sorted(self._tasks.values(), key=lambda stat: stat.max_us, reverse=True)
+        return "tasks (max step ms/busy %%): %s" % ", ".join(
+            "%s %.1f/%.1f" % (stat.name, stat.max_us / 1000, stat.busy_us / elapsed / 10) for stat in stats if stat.steps)
+
+    def alloc_report(self) -> str:
+        """当前窗口内每个任务分配的字节数，只在heap=True时有意义"""
+        stats = sorted(self._tasks.values(), key=lambda stat: stat.alloc, reverse=True)
+        return "tasks alloc (B): %s" % ", ".join("%s %d" % (stat.name, stat.alloc) for stat in stats if stat.alloc)
+
+    def reset(self):
+        self.lag.reset()
+        self.steps.reset()
+        for stat in self._tasks.values():
+            stat.steps = 0
+            stat.busy_us = 0
+            stat.max_us = 0
+            stat.alloc = 0
+        self._window_start = time.ticks_ms()
@@ -0,0 +1,170 @@
+# -*- coding: utf-8 -*-
+"""
+Copyright (c) 2008-2025 synodriver <diguohuangjiajinweijun@gmail.com>
+
+截止时间调度器
+一个任务按ticks_ms计算的截止时间唤醒，相近的截止时间合并成一次唤醒；
+每个任务有一个常驻的worker，到期时唤醒它执行，慢的I/O读取不会推迟排在它后面的任务和发布，
+也不用每个周期创建新的asyncio任务。任务列表一直按截止时间排好序，推进截止时间时插回原位，调度循环里不分配内存
+"""
+import asyncio
+import time
+
+
+class Job:
+    __slots__ = ("name", "period", "fn", "delay", "lead", "collect", "deadline", "running", "wake", "runs",
+                 "overruns", "errors", "last_us", "max_us", "max_late_ms")
+
+    def __init__(self, name, period, fn, delay, lead, collect=False):
+        self.name = name
+        self.period = period
+        self.fn = fn
+        self.delay = delay
+        self.lead = lead
+        self.collect = collect  # 执行之前的空闲间隙里先gc.collect()
+        self.deadline = 0
+        self.running = False
+        self.wake = asyncio.Event()  # 到期时由调度循环设置，worker等待它
+        self.runs = 0
+        self.overruns = 0  # 启动晚于截止时间，或者上一次还没执行完被跳过的次数
+        self.errors = 0
+        self.last_us = 0
+        self.max_us = 0
+        self.max_late_ms = 0  # 启动时间比截止时间晚得最多的一次
+
+
+class Scheduler:
+    def __init__(self, coalesce_ms=50, debug=False, profiler=None, heap=None, collect_ms=20, tolerance_ms=5):
+        """
+        :param coalesce_ms: 截止时间落在这个窗口内的任务合并到同一次唤醒里启动
+        :param tolerance_ms: 启动比截止时间晚超过这么多就算一次overrun，只用来容忍唤醒本身的误差
+        :param profiler: profiler.Profiler，不为None时按任务名统计每一步占用事件循环的时间
+        :param heap: heap.HeapMonitor，不为None时每次发布之后结算一个周期，其他任务之后不采样
+        :param collect_ms: 空闲间隙至少有这么长才在collect=True的任务之前回收内存
+        """
+        self.coalesce_ms = coalesce_ms
+        self.profiler = profiler
+        self.heap = heap
+        self.collect_ms = collect_ms
+        self.tolerance_ms = tolerance_ms
+        self._jobs = []
+        self._anchor = None
+        self._debug = debug
+
+    def dprint(self, *args, **kwargs):
+        if self._debug:
+            print(*args, **kwargs)
+
+    def add(self, name, period, fn, delay=0, lead=None, collect=False):
+        """
+        注册周期任务
+        :param period: 周期(ms)
+        :param fn: 无参数的async函数
+        :param delay: 第一次执行前的等待(ms)，对齐的任务忽略这个参数
+        :param lead: 不为None时对齐到发布任务，在每次发布之前lead毫秒开始读取
+        :param collect: 分配内存比较多的任务，设置了heap时在它之前的空闲间隙里先回收，避免执行中途触发gc
+        """
+        job = Job(name, period, fn, delay, lead, collect)
+        self._jobs.append(job)
+        return job
+
+    def add_publish(self, name, period, fn, delay=0, collect=False):
+        """注册发布任务，设置了lead的读取任务都对齐到它"""
+        self._anchor = self.add(name, period, fn, delay, collect=collect)
+        return self._anchor
+
+    def stats(self) -> dict:
+        return {job.name: (job.runs, job.overruns, job.errors, job.max_us, job.max_late_ms) for job in self._jobs}
+
+    def _start(self):
+        now = time.ticks_ms()
+        anchor = self._anchor
+        if anchor is not None:
+            anchor.deadline = time.ticks_add(now, anchor.delay)
+        for job in self._jobs:
+            if job is anchor:
+                continue
+            if job.lead is not None and anchor is not None:
+                job.deadline = time.ticks_add(anchor.deadline, -job.lead)
+                while time.ticks_diff(job.deadline, now) < 0:
+                    job.deadline = time.ticks_add(job.deadline, job.period)
+            else:
+                job.deadline = time.ticks_add(now, job.delay)
+        self._jobs.sort(key=lambda job: time.ticks_diff(job.deadline, now))
+
+    def _insert(self, job):
+        """按截止时间把job插回已排序的列表"""
+        jobs = self._jobs
+        i = 0
+        for other in jobs:
+            if time.ticks_diff(other.deadline, job.deadline) > 0:
+                break
+            i += 1
+        jobs.insert(i, job)
+
+    def _dispatch(self, job, now):
+        """记录延迟，推进截止时间，唤醒任务的worker"""
+        late = time.ticks_diff(now, job.deadline)
+        if late > job.max_late_ms:
+            job.max_late_ms = late
+        if late > self.tolerance_ms:
+            job.overruns += 1
+            self.dprint("job %s started %d ms late" % (job.name, late))
+        job.deadline = time.ticks_add(job.deadline, job.period)
+        while time.ticks_diff(job.deadline, now) <= 0:  # 跳过错过的周期，保持相位
+            job.deadline = time.ticks_add(job.deadline, job.period)
+        if job.running:  # 上一次还没执行完，不叠加执行
+            job.overruns += 1
+            self.dprint("job %s still running, skipped" % job.name)
+            return
+        job.running = True
+        job.wake.set()
+
+    async def _worker(self, job):
+        """每个任务一个常驻的worker，执行完等下一次唤醒"""
+        wake = job.wake
+        while True:
+            await wake.wait()
+            wake.clear()
+            start = time.ticks_us()
+            try:
+                if self.profiler is None:
+                    await job.fn()
+                else:
+                    await self.profiler.wrap(job.name, job.fn())
+            except Exception as e:
+                job.errors += 1
+                self.dprint("job %s failed: %s" % (job.name, e))
+            finally:
+                job.running = False
+            job.last_us = time.ticks_diff(time.ticks_us(), start)
+            if job.last_us > job.max_us:
+                job.max_us = job.last_us
+            job.runs += 1
+            if self.heap is not None and job is self._anchor:
+                self.heap.end_cycle()
+
+    async def run(self):
+        self._start()
+        jobs = self._jobs
+        for job in jobs:
+            asyncio.create_task(self._worker(job))
+        while True:
+            now = time.ticks_ms()
+            wait = time.ticks_diff(jobs[0].deadline, now)
+            if wait > self.collect_ms and jobs[0].collect and self.heap is not None:
+                self.heap.collect()  # 趁空闲回收，接下来的分配不会在任务中途触发gc
+                wait = time.ticks_diff(jobs[0].deadline, time.ticks_ms())
+            if wait > 0:
+                await asyncio.sleep_ms(wait)
+            now = time.ticks_ms()
+            # 合并唤醒：按截止时间顺序唤醒窗口内所有到期的任务，不等它们执行完
+            due = 0
+            for job in jobs:
+                if time.ticks_diff(job.deadline, now) > self.coalesce_ms:
+                    break
+                due += 1
+            for _ in range(due):
+                job = jobs.pop(0)
+                self._dispatch(job, now)
+                self._insert(job)
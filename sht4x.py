@@ -14,7 +14,6 @@ MicroPython Driver fot the Sensirion Temperature and Humidity SHT40, SHT41 and S
 """
 import asyncio
 import time
-import struct
 from micropython import const
 
 try:
@@ -53,6 +52,41 @@ wat_config = {
 }
 
 
+def _make_crc_table() -> bytes:
+    """CRC-8 lookup table, polynomial 0x31"""
+    table = bytearray(256)
+    for i in range(256):
+        crc = i
+        for _ in range(8):
+            if crc & 0x80:
+                crc = ((crc << 1) ^ 0x31) & 0xFF
+            else:
+                crc = (crc << 1) & 0xFF
+        table[i] = crc
+    return bytes(table)
+
+
+_CRC_TABLE = _make_crc_table()
+
+
+def _check_crc(data, table=_CRC_TABLE) -> bool:
+    """Check both words of a 6-byte measurement in place: [T_msb, T_lsb, T_crc, RH_msb, RH_lsb, RH_crc]"""
+    return (
+        table[table[0xFF ^ data[0]] ^ data[1]] == data[2]
+        and table[table[0xFF ^ data[3]] ^ data[4]] == data[5]
+    )
+
+
+# Native version of _check_crc where the viper emitter is available. It lives in
+# its own module because a port without viper fails while compiling it, which
+# is only catchable at import time: SyntaxError from source, ValueError from an
+# .mpy built for another arch, AttributeError from the CPython stub.
+try:
+    from sht4x_viper import check_crc as _check_crc
+except (ImportError, SyntaxError, ValueError, AttributeError):  # keep the Python version
+    pass
+
+
 class SHT4X:
     """Driver for the SHT4X Sensor connected over I2C.
 
@@ -93,6 +127,7 @@ class SHT4X:
         self._data = bytearray(6)
 
         self._command = 0xFD
+        self._command_buf = bytearray((self._command,))
         self._temperature_precision = HIGH_PRECISION
         self._heater_power = HEATER20mW
         self._heat_time = TEMP_0_1
@@ -121,7 +156,7 @@ class SHT4X:
         if value not in temperature_precision_values:
             raise ValueError("Value must be a valid temperature_precision setting")
         self._temperature_precision = value
-        self._command = temperature_precision_values[value]
+        self._set_command(temperature_precision_values[value])
 
     @property
     async def relative_humidity(self) -> float:
@@ -148,23 +183,21 @@ class SHT4X:
         back. Waiting time is added to the logic to account for this situation
         """
 
-        self._i2c.writeto(self._address, bytes([self._command]))
-        if self._command in (0x39, 0x2F, 0x1E):
-            await asyncio.sleep(1.2)
-        elif self._command in (0x32, 0x24, 0x15):
-            await asyncio.sleep(0.2)
-        await asyncio.sleep_ms(10)
-        self._i2c.readfrom_into(self._address, self._data)
-
-        temperature, temp_crc, humidity, humidity_crc = struct.unpack_from(
-            ">HBHB", self._data
-        )
-
-        if temp_crc != self._crc(
-                memoryview(self._data[0:2])
-        ) or humidity_crc != self._crc(memoryview(self._data[3:5])):
+        if hasattr(self._i2c, "write_then_read"):  # i2cbus.I2CBus, holds the device lock, other devices can use the bus meanwhile
+            await self._i2c.write_then_read(self._address, self._command_buf, self._data,
+                                            self._measure_delay_ms())
+        else:
+            self._i2c.writeto(self._address, self._command_buf)
+            await asyncio.sleep_ms(self._measure_delay_ms())
+            self._i2c.readfrom_into(self._address, self._data)
+
+        data = self._data
+        if not _check_crc(data, _CRC_TABLE):
             raise RuntimeError("Invalid CRC calculated")
 
+        temperature = data[0] << 8 | data[1]
+        humidity = data[3] << 8 | data[4]
+
         temperature = -45.0 + 175.0 * temperature / 65535.0
 
         humidity = -6.0 + 125.0 * humidity / 65535.0
@@ -172,18 +205,25 @@ class SHT4X:
 
         return temperature, humidity
 
+    def _measure_delay_ms(self) -> int:
+        """heater commands need the heating time before the result is ready"""
+        if self._command in (0x39, 0x2F, 0x1E):
+            return 1210
+        if self._command in (0x32, 0x24, 0x15):
+            return 210
+        return 10
+
+    def _set_command(self, command: int) -> None:
+        self._command = command
+        self._command_buf[0] = command
+
     @staticmethod
     def _crc(buffer) -> int:
         """verify the crc8 checksum"""
         crc = 0xFF
         for byte in buffer:
-            crc ^= byte
-            for _ in range(8):
-                if crc & 0x80:
-                    crc = (crc << 1) ^ 0x31
-                else:
-                    crc = crc << 1
-        return crc & 0xFF
+            crc = _CRC_TABLE[crc ^ byte]
+        return crc
 
     @property
     def heater_power(self) -> str:
@@ -218,7 +258,7 @@ class SHT4X:
         if value not in heater_power_values:
             raise ValueError("Value must be a valid heater power setting")
         self._heater_power = value
-        self._command = wat_config[value][self._heat_time]
+        self._set_command(wat_config[value][self._heat_time])
 
     @property
     def heat_time(self) -> str:
@@ -250,7 +290,7 @@ class SHT4X:
         if value not in heat_time_values:
             raise ValueError("Value must be a valid heat_time setting")
         self._heat_time = value
-        self._command = wat_config[self._heater_power][value]
+        self._set_command(wat_config[self._heater_power][value])
 
     async def reset(self):
         """
@@ -0,0 +1,20 @@
+# SPDX-FileCopyrightText: Copyright (c) 2023 Jose D. Montoya
+#
+# SPDX-License-Identifier: MIT
+"""
+Native CRC check for `sht4x`
+
+Kept in its own module: ports built without the viper emitter reject the
+decorator while compiling the module, and that error can only be caught by
+whoever imports it. `sht4x` imports this inside try/except and keeps its
+pure-Python check when the import fails.
+"""
+import micropython
+
+
+@micropython.viper
+def check_crc(data, table) -> bool:
+    """Same as sht4x._check_crc, both words of a 6-byte measurement against the CRC table"""
+    d = ptr8(data)
+    t = ptr8(table)
+    return t[t[0xFF ^ d[0]] ^ d[1]] == d[2] and t[t[0xFF ^ d[3]] ^ d[4]] == d[5]
@@ -0,0 +1,193 @@
+# -*- coding: utf-8 -*-
+"""
+Copyright (c) 2008-2025 synodriver <diguohuangjiajinweijun@gmail.com>
+
+在CPython上运行固件代码的模拟环境
+install()之后可以直接import main和各个驱动：
+- sim/stubs下的machine/esp/esp32/micropython/mqtt_as/ota/utime替代固件模块
+- time/gc/asyncio补上MicroPython特有的接口(ticks_*, sleep_ms, mem_free, ThreadSafeFlag, Stream)
+- 传感器挂在sim.board.board上，可以在运行中修改读数或者注入故障
+
+    python -m sim.run --duration 30
+"""
+import asyncio
+import gc
+import os
+import sys
+import time
+
+_STUBS = os.path.join(os.path.dirname(os.path.abspath(__file__)), "stubs")
+_ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+TICKS_PERIOD = 1 << 30
+_TICKS_MASK = TICKS_PERIOD - 1
+_TICKS_HALF = TICKS_PERIOD >> 1
+
+_installed = False
+
+
+# time: MicroPython的ticks在2**30回绕
+def ticks_ms():
+    return int(time.monotonic() * 1000) & _TICKS_MASK
+
+
+def ticks_us():
+    return (time.monotonic_ns() // 1000) & _TICKS_MASK
+
+
+def ticks_cpu():
+    return time.perf_counter_ns() & _TICKS_MASK
+
+
+def ticks_diff(end, start):
+    return ((end - start + _TICKS_HALF) & _TICKS_MASK) - _TICKS_HALF
+
+
+def ticks_add(ticks, delta):
+    return (ticks + delta) & _TICKS_MASK
+
+
+def sleep_ms(ms):
+    time.sleep(ms / 1000)
+
+
+def sleep_us(us):
+    time.sleep(us / 1000000)
+
+
+# gc: CPython没有堆大小的概念，按ESP32上的典型值给一个固定的堆
+HEAP_SIZE = 160 * 1024
+
+
+def mem_alloc():
+    try:
+        import tracemalloc
+        if tracemalloc.is_tracing():
+            return tracemalloc.get_traced_memory()[0]
+    except ImportError:
+        pass
+    return 0
+
+
+def mem_free():
+    return max(HEAP_SIZE - mem_alloc(), 0)
+
+
+# asyncio
+async def _sleep_ms(ms):
+    await asyncio.sleep(ms / 1000)
+
+
+class ThreadSafeFlag:
+    """
+    asyncio.ThreadSafeFlag，set()在模拟的中断里调用，和事件循环在同一个线程
+    wait()返回时自动清除
+    """
+
+    def __init__(self):
+        self._event = None
+        self._state = False
+
+    def _get_event(self):
+        if self._event is None:
+            self._event = asyncio.Event()
+            if self._state:
+                self._event.set()
+        return self._event
+
+    def set(self):
+        self._state = True
+        if self._event is not None:
+            self._event.set()
+
+    def clear(self):
+        self._state = False
+        if self._event is not None:
+            self._event.clear()
+
+    async def wait(self):
+        await self._get_event().wait()
+        self.clear()
+
+
+class Stream:
+    """
+    MicroPython的asyncio.Stream，StreamReader(uart)和StreamWriter(uart, {})都是它
+    底层对象只需要非阻塞的read/readinto/write
+    """
+    poll_ms = 5
+
+    def __init__(self, s, extra=None):
+        self.s = s
+        self.e = extra or {}
+        self.out_buf = b""
+
+    async def read(self, n=-1):
+        while True:
+            data = self.s.read(n)
+            if data:
+                return data
+            await _sleep_ms(self.poll_ms)
+
+    async def readinto(self, buf):
+        while True:
+            n = self.s.readinto(buf)
+            if n:
+                return n
+            await _sleep_ms(self.poll_ms)
+
+    async def readexactly(self, n):
+        data = b""
+        while len(data) < n:
+            data += await self.read(n - len(data))
+        return data
+
+    async def readline(self):
+        data = b""
+        while not data.endswith(b"\n"):
+            data += await self.read(1)
+        return data
+
+    def write(self, buf):
+        self.out_buf += bytes(buf)
+
+    async def drain(self):
+        if self.out_buf:
+            self.s.write(self.out_buf)
+            self.out_buf = b""
+
+    def close(self):
+        pass
+
+    async def wait_closed(self):
+        pass
+
+
+_statvfs = os.statvfs
+
+
+def statvfs(path):
+    """固件的文件系统挂在/flash，模拟时对应当前工作目录"""
+    if path == "/flash" or path.startswith("/flash/"):
+        path = "." + path[6:]
+    return _statvfs(path)
+
+
+def install():
+    """把stub模块放到导入路径最前面，并给CPython的time/gc/asyncio补上MicroPython的接口"""
+    global _installed
+    if _installed:
+        return
+    _installed = True
+    for path in (_ROOT, _STUBS):
+        if path not in sys.path:
+            sys.path.insert(0, path)
+    for name in ("ticks_ms", "ticks_us", "ticks_cpu", "ticks_diff", "ticks_add", "sleep_ms", "sleep_us"):
+        setattr(time, name, globals()[name])
+    os.statvfs = statvfs
+    gc.mem_alloc = mem_alloc
+    gc.mem_free = mem_free
+    asyncio.sleep_ms = _sleep_ms
+    asyncio.ThreadSafeFlag = ThreadSafeFlag
+    # 固件只用到MicroPython风格的Stream，CPython的StreamReader/StreamWriter构造参数不兼容
+    asyncio.Stream = asyncio.StreamReader = asyncio.StreamWriter = Stream
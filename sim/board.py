@@ -0,0 +1,52 @@
+# -*- coding: utf-8 -*-
+"""
+Copyright (c) 2008-2025 synodriver <diguohuangjiajinweijun@gmail.com>
+
+模拟的开发板：哪条I2C总线/哪个串口上接了什么设备，以及各个引脚的电平
+stub里的machine模块通过这里找到设备
+"""
+from sim import devices
+
+
+class Board:
+    def __init__(self):
+        self.i2c = {}  # bus id -> {address: I2CDevice}
+        self.uart = {}  # uart id -> UARTDevice
+        self.pins = {}  # pin id -> machine.Pin
+        self.unique_id = b"\xa0\xb7\x65\xc3\xd2\xe1"
+        self.wdt_timeout = None
+        self.wdt_max_gap_ms = 0  # 两次喂狗之间最长的间隔
+        self.resets = 0
+
+    def attach_i2c(self, bus, device):
+        self.i2c.setdefault(bus, {})[device.address] = device
+        return device
+
+    def attach_uart(self, id_, device):
+        self.uart[id_] = device
+        return device
+
+    def set_pin(self, pin_id, level):
+        """外部驱动引脚电平，电平变化且匹配触发条件时调用中断处理函数"""
+        pin = self.pins.get(pin_id)
+        if pin is None:
+            from machine import Pin
+            pin = Pin(pin_id)
+        pin.drive(level)
+
+
+board = Board()
+LTR390_INT_PIN = 27
+
+
+def default_board():
+    """
+    和main.py里的接线一致：I2C1上LTR390和SHT4X，I2C0上BMP390，UART1接空气模块，UART2接DART
+    LTR390的INT接在LTR390_INT_PIN上，配置里设置ltr390_int_pin之后才会用到
+    """
+    board.attach_i2c(1, devices.LTR390(int_pin=LTR390_INT_PIN))
+    board.attach_i2c(1, devices.SHT4X())
+    board.attach_i2c(0, devices.BMP390())
+    board.attach_uart(1, devices.AirMod())
+    board.attach_uart(2, devices.Dart())
+    return board
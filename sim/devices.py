@@ -0,0 +1,513 @@
+# -*- coding: utf-8 -*-
+"""
+Copyright (c) 2008-2025 synodriver <diguohuangjiajinweijun@gmail.com>
+
+模拟的传感器
+I2C设备是寄存器表加读写钩子，UART设备按时间产生帧；读数都是普通属性，运行中可以直接修改
+LTR390和BMP390按数据手册的转换时间置数据就绪位，接了int_pin时转换完成会驱动INT引脚
+"""
+import asyncio
+import struct
+import time
+
+
+def _now_ms():
+    return int(time.monotonic() * 1000)
+
+
+def _call_later(ms, fn):
+    """事件循环里的定时回调，用来在转换完成时驱动INT；没有运行中的事件循环时返回None，数据就绪位照样按时间计算"""
+    try:
+        loop = asyncio.get_running_loop()
+    except RuntimeError:
+        return None
+    return loop.call_later(max(ms, 0) / 1000, fn)
+
+
+def _set_pin(pin_id, level):
+    from sim.board import board  # board.py会import这个模块
+
+    board.set_pin(pin_id, level)
+
+
+class I2CDevice:
+    """256字节寄存器表，machine.I2C的读写都转到这里"""
+
+    def __init__(self, address):
+        self.address = address
+        self.regs = bytearray(256)
+        self.reads = 0
+        self.writes = 0
+        self._fail = 0
+        self._response = b""
+
+    def fail_next(self, count=1):
+        """接下来count次访问返回EIO，模拟总线干扰"""
+        self._fail = count
+
+    def check(self):
+        if self._fail:
+            self._fail -= 1
+            raise OSError(5)  # EIO
+
+    def read_mem(self, reg, nbytes) -> bytes:
+        self.reads += 1
+        self.on_read(reg, nbytes)
+        return bytes(self.regs[reg:reg + nbytes])
+
+    def write_mem(self, reg, data):
+        self.writes += 1
+        for i, value in enumerate(data):
+            self.regs[reg + i] = value
+        self.on_write(reg, bytes(data))
+
+    def on_read(self, reg, nbytes):
+        pass
+
+    def on_write(self, reg, data):
+        pass
+
+    # 不带寄存器地址的命令型访问
+    def write_raw(self, data):
+        self.writes += 1
+        if data:
+            self.on_command(bytes(data))
+
+    def read_raw(self, nbytes) -> bytes:
+        self.reads += 1
+        data = self._response[:nbytes]
+        return data + bytes(nbytes - len(data))
+
+    def on_command(self, data):
+        self.write_mem(data[0], data[1:])
+
+
+class LTR390(I2CDevice):
+    """
+    uvs/als是原始计数
+    MAIN_CTRL打开或者切换模式、写MEAS_RATE之后重新开始测量，每次转换的积分时间由分辨率决定，
+    转换周期取测量速率和积分时间中较长的一个。读MAIN_STATUS清除数据就绪位和中断状态，同时释放INT
+    """
+    MAIN_CTRL = 0x00
+    MEAS_RATE = 0x04
+    MAIN_STATUS = 0x07
+    ALS_DATA = 0x0D
+    UVS_DATA = 0x10
+    INT_CFG = 0x19
+    THRES_UP = 0x21
+    THRES_LOW = 0x24
+    # 按MEAS_RATE的位索引
+    RATE_MS = (25, 50, 100, 200, 500, 1000, 2000, 2000)
+    CONVERSION_MS = (400, 200, 100, 50, 25, 12.5, 12.5, 12.5)
+
+    def __init__(self, address=0x53, uvs=120, als=2400, int_pin=None):
+        """:param int_pin: INT接到的引脚号，低电平有效，None表示没有接"""
+        super().__init__(address)
+        self.uvs = uvs
+        self.als = als
+        self.int_pin = int_pin
+        self.conversions = 0  # 完成的转换次数
+        self.interrupts = 0  # INT拉低的次数
+        self.regs[0x04] = 0x22  # MEAS_RATE默认值
+        self.regs[0x05] = 0x01  # GAIN默认值
+        self.regs[0x06] = 0xB2  # PART_ID
+        self._ctrl = 0
+        self._started = None  # 开始测量的时间(ms)，None表示待机
+        self._seen = 0  # 上次读MAIN_STATUS时已经完成的转换次数
+        self._int_active = False
+        self._timer = None
+
+    def _timing(self):
+        """(积分时间, 转换周期) ms"""
+        meas = self.regs[self.MEAS_RATE]
+        conversion = self.CONVERSION_MS[(meas >> 4) & 0x07]
+        return conversion, max(self.RATE_MS[meas & 0x07], conversion)
+
+    def _completed(self, now):
+        if self._started is None:
+            return 0
+        conversion, period = self._timing()
+        elapsed = now - self._started
+        if elapsed < conversion:
+            return 0
+        return int((elapsed - conversion) // period) + 1
+
+    def _restart(self):
+        if self._timer is not None:
+            self._timer.cancel()
+            self._timer = None
+        self._seen = 0
+        if self._ctrl & 0x02:
+            self._started = time.monotonic() * 1000
+            self._schedule()
+        else:
+            self._started = None
+
+    def _schedule(self):
+        conversion, period = self._timing()
+        due = self._started + conversion + self._completed(time.monotonic() * 1000) * period
+        self._timer = _call_later(due - time.monotonic() * 1000, self._on_conversion)
+
+    def _on_conversion(self):
+        self.conversions += 1
+        cfg = self.regs[self.INT_CFG]
+        if cfg & 0x04 and not self._int_active:  # LS_INT_EN
+            value = self.uvs if cfg & 0x30 == 0x30 else self.als
+            up = int.from_bytes(self.regs[self.THRES_UP:self.THRES_UP + 3], "little") & 0xFFFFF
+            low = int.from_bytes(self.regs[self.THRES_LOW:self.THRES_LOW + 3], "little") & 0xFFFFF
+            if value > up or value < low:
+                self._int_active = True
+                self.interrupts += 1
+                if self.int_pin is not None:
+                    _set_pin(self.int_pin, 0)
+        self._schedule()
+
+    def on_read(self, reg, nbytes):
+        if reg == self.MAIN_STATUS:
+            completed = self._completed(time.monotonic() * 1000)
+            status = 0x08 if completed > self._seen else 0
+            if self._int_active:
+                status |= 0x10
+                self._int_active = False
+                if self.int_pin is not None:
+                    _set_pin(self.int_pin, 1)
+            self._seen = completed
+            self.regs[reg] = status
+        elif reg == self.UVS_DATA:
+            self.regs[reg:reg + 3] = int(self.uvs).to_bytes(3, "little")
+        elif reg == self.ALS_DATA:
+            self.regs[reg:reg + 3] = int(self.als).to_bytes(3, "little")
+
+    def on_write(self, reg, data):
+        if reg == self.MAIN_CTRL:
+            if data[0] != self._ctrl:  # 写入相同的值不会打断正在进行的测量
+                self._ctrl = data[0]
+                self._restart()
+        elif reg <= self.MEAS_RATE < reg + len(data) and self._started is not None:
+            self._restart()
+
+
+def _crc8(data):
+    crc = 0xFF
+    for byte in data:
+        crc ^= byte
+        for _ in range(8):
+            crc = ((crc << 1) ^ 0x31) & 0xFF if crc & 0x80 else (crc << 1) & 0xFF
+    return crc
+
+
+class BMP390(I2CDevice):
+    """
+    pressure(Pa)和temperature(°C)在读数据寄存器时按校准系数反算成ADC值
+    强制模式按OSR算出的转换时间之后才置drdy，读数据寄存器清除；打开drdy中断时转换完成会驱动INT，读INT_STATUS释放
+    """
+    STATUS = 0x03
+    DATA = 0x04
+    INT_STATUS = 0x11
+    INT_CTRL = 0x19
+    PWR_CTRL = 0x1B
+    OSR = 0x1C
+    CALIB = 0x31
+    # 一组典型的NVM校准数据 (0x31-0x45)
+    NVM = bytes([0x1E, 0x6B, 0xE4, 0x48, 0xF6, 0x8C, 0xFC, 0x1E, 0x03, 0x1A, 0x00,
+                 0x23, 0x4A, 0xA6, 0x74, 0x03, 0xFA, 0x0E, 0x0B, 0x0D, 0x00])
+
+    def __init__(self, address=0x77, pressure=97000.0, temperature=25.0, chip_id=0x60, int_pin=None):
+        """:param int_pin: INT接到的引脚号，电平极性由INT_CTRL决定，None表示没有接"""
+        super().__init__(address)
+        self.pressure = pressure
+        self.temperature = temperature
+        self.int_pin = int_pin
+        self.conversions = 0
+        self.regs[0x00] = chip_id
+        self.regs[self.STATUS] = 0x10  # cmd_rdy
+        self.regs[self.INT_CTRL] = 0x02  # int_level高电平有效
+        self._ready_at = None  # 正在进行的转换完成的时间(ms)
+        self._timer = None
+        self.regs[self.CALIB:self.CALIB + len(self.NVM)] = self.NVM
+        t1, t2, t3, p1, p2, p3, p4, p5, p6, p7, p8, p9, p10, p11 = struct.unpack("<HHbhhbbHHbbhbb", self.NVM)
+        self._calib = (t1 * 2.0 ** 8, t2 / 2.0 ** 30, t3 / 2.0 ** 48,
+                       (p1 - 2 ** 14) / 2.0 ** 20, (p2 - 2 ** 14) / 2.0 ** 29, p3 / 2.0 ** 32, p4 / 2.0 ** 37,
+                       p5 * 2.0 ** 3, p6 / 2.0 ** 6, p7 / 2.0 ** 8, p8 / 2.0 ** 15,
+                       p9 / 2.0 ** 48, p10 / 2.0 ** 48, p11 / 2.0 ** 65)
+        self._cache = None
+
+    def _compensate(self, adc_p, adc_t):
+        t1, t2, t3, p1, p2, p3, p4, p5, p6, p7, p8, p9, p10, p11 = self._calib
+        pd1 = adc_t - t1
+        t = pd1 * t2 + pd1 * pd1 * t3
+        po1 = p5 + p6 * t + p7 * t * t + p8 * t * t * t
+        po2 = adc_p * (p1 + p2 * t + p3 * t * t + p4 * t * t * t)
+        pd4 = adc_p * adc_p * (p9 + p10 * t) + p11 * adc_p * adc_p * adc_p
+        return po1 + po2 + pd4, t
+
+    @staticmethod
+    def _solve(fn, target):
+        """在24位ADC范围内二分查找fn(adc)最接近target的adc，fn单调，方向不限"""
+        lo, hi = 0, (1 << 24) - 1
+        rising = fn(hi) > fn(lo)
+        while lo < hi:
+            mid = (lo + hi) // 2
+            if (fn(mid) < target) == rising:
+                lo = mid + 1
+            else:
+                hi = mid
+        return lo
+
+    def _adc(self):
+        """反算出使补偿结果等于设定值的ADC值"""
+        key = (self.pressure, self.temperature)
+        if self._cache is not None and self._cache[0] == key:
+            return self._cache[1]
+        adc_t = self._solve(lambda adc: self._compensate(0, adc)[1], self.temperature)
+        adc_p = self._solve(lambda adc: self._compensate(adc, adc_t)[0], self.pressure)
+        self._cache = (key, (adc_p, adc_t))
+        return adc_p, adc_t
+
+    def conversion_ms(self) -> float:
+        """数据手册3.9.2的典型转换时间，按PWR_CTRL里打开的通道和OSR计算"""
+        pwr = self.regs[self.PWR_CTRL]
+        osr = self.regs[self.OSR]
+        us = 234
+        if pwr & 0x01:
+            us += 392 + (2020 << (osr & 0x07))
+        if pwr & 0x02:
+            us += 163 + (2020 << ((osr >> 3) & 0x07))
+        return us / 1000
+
+    def _start(self):
+        """开始一次转换，完成之前drdy保持清零"""
+        if self._timer is not None:
+            self._timer.cancel()
+        self.regs[self.STATUS] &= ~0x60
+        ms = self.conversion_ms()
+        self._ready_at = time.monotonic() * 1000 + ms
+        self._timer = _call_later(ms, self._update)
+
+    def _update(self):
+        """转换完成：置drdy，强制模式回到睡眠，正常模式开始下一次"""
+        if self._ready_at is None or time.monotonic() * 1000 < self._ready_at:
+            return
+        self._ready_at = None
+        self._timer = None
+        self.conversions += 1
+        self.regs[self.STATUS] |= 0x60  # drdy_press, drdy_temp
+        pwr = self.regs[self.PWR_CTRL]
+        if pwr & 0x30 == 0x30:
+            self._start()
+        else:
+            self.regs[self.PWR_CTRL] = pwr & 0x03
+        ctrl = self.regs[self.INT_CTRL]
+        if ctrl & 0x40:  # drdy_en
+            self.regs[self.INT_STATUS] |= 0x08
+            if self.int_pin is not None:
+                _set_pin(self.int_pin, ctrl & 0x02)
+
+    def on_read(self, reg, nbytes):
+        self._update()  # 没有事件循环驱动定时器时按时间补上
+        if reg <= self.DATA + 5 and reg + nbytes > self.DATA:
+            adc_p, adc_t = self._adc()
+            self.regs[self.DATA:self.DATA + 3] = adc_p.to_bytes(3, "little")
+            self.regs[self.DATA + 3:self.DATA + 6] = adc_t.to_bytes(3, "little")
+
+    def read_mem(self, reg, nbytes) -> bytes:
+        data = super().read_mem(reg, nbytes)
+        # 读出来之后才清除：读数据寄存器清drdy，读INT_STATUS清中断并释放INT
+        if reg <= self.DATA + 5 and reg + nbytes > self.DATA:
+            self.regs[self.STATUS] &= ~0x60
+        if reg <= self.INT_STATUS < reg + nbytes and self.regs[self.INT_STATUS]:
+            self.regs[self.INT_STATUS] = 0
+            if self.int_pin is not None:
+                _set_pin(self.int_pin, not self.regs[self.INT_CTRL] & 0x02)
+        return data
+
+    def on_write(self, reg, data):
+        if reg == self.PWR_CTRL:
+            if data[0] & 0x30:
+                self._start()
+            else:  # 睡眠模式放弃正在进行的转换
+                if self._timer is not None:
+                    self._timer.cancel()
+                self._ready_at = self._timer = None
+        elif reg == 0x7E:  # CMD
+            if data[0] == 0xB6:  # 软复位
+                self.regs[self.PWR_CTRL] = 0
+                self.regs[0x1C] = 0x02  # OSR
+
+
+class SHT4X(I2CDevice):
+    """命令型设备，写测量命令之后读6个字节"""
+    MEASURE_COMMANDS = (0xFD, 0xF6, 0xE0, 0x39, 0x32, 0x2F, 0x24, 0x1E, 0x15)
+
+    def __init__(self, address=0x44, temperature=24.0, humidity=42.0):
+        super().__init__(address)
+        self.temperature = temperature
+        self.humidity = humidity
+        self.measurements = 0
+
+    def on_command(self, data):
+        if data[0] in self.MEASURE_COMMANDS:
+            self.measurements += 1
+            t_raw = max(0, min(65535, round((self.temperature + 45) * 65535 / 175)))
+            rh_raw = max(0, min(65535, round((self.humidity + 6) * 65535 / 125)))
+            t = t_raw.to_bytes(2, "big")
+            rh = rh_raw.to_bytes(2, "big")
+            self._response = t + bytes((_crc8(t),)) + rh + bytes((_crc8(rh),))
+        else:  # 复位或者读序列号，这里都不需要返回数据
+            self._response = b""
+
+
+class UARTDevice:
+    """按时间产生数据的串口设备，字节在available_at之后才能读到"""
+
+    def __init__(self):
+        self._pending = []  # [(available_at_ms, bytes)]
+        self._rx = bytearray()
+        self.written = bytearray()
+
+    def send(self, data, delay_ms=0):
+        """设备 -> 主机"""
+        self._pending.append((_now_ms() + delay_ms, bytes(data)))
+
+    def inject(self, data):
+        """立刻插入任意字节，用来模拟噪声和丢字节"""
+        self._rx += data
+
+    def poll(self, now):
+        pass
+
+    def _collect(self):
+        now = _now_ms()
+        self.poll(now)
+        self._pending.sort(key=lambda item: item[0])
+        while self._pending and self._pending[0][0] <= now:
+            self._rx += self._pending.pop(0)[1]
+
+    def any(self):
+        self._collect()
+        return len(self._rx)
+
+    def read(self, nbytes=-1):
+        self._collect()
+        if not self._rx:
+            return None
+        if nbytes < 0:
+            nbytes = len(self._rx)
+        data = bytes(self._rx[:nbytes])
+        del self._rx[:nbytes]
+        return data
+
+    def readinto(self, buf):
+        data = self.read(len(buf))
+        if not data:
+            return None
+        buf[:len(data)] = data
+        return len(data)
+
+    def write(self, data):
+        self.written += data
+        self.receive(bytes(data))
+        return len(data)
+
+    def receive(self, data):
+        """主机 -> 设备"""
+        pass
+
+
+class AirMod(UARTDevice):
+    """每period_ms发送一帧17字节的数据"""
+
+    def __init__(self, period_ms=1000, co2=612, ch2o=3, voc=12, pm25=8, pm10=11, temperature=23.4, humidity=45.1):
+        super().__init__()
+        self.period_ms = period_ms
+        self.co2 = co2
+        self.ch2o = ch2o
+        self.voc = voc
+        self.pm25 = pm25
+        self.pm10 = pm10
+        self.temperature = temperature
+        self.humidity = humidity
+        self.frames = 0
+        self._next = None
+
+    def frame(self) -> bytes:
+        t = abs(self.temperature)
+        t10 = round(t * 10)
+        rh10 = round(self.humidity * 10)
+        data = bytearray([0x3C, 0x02])
+        for value in (self.co2, self.ch2o, self.voc, self.pm25, self.pm10):
+            data += int(value).to_bytes(2, "big")
+        data += bytes(((t10 // 10) | (0x80 if self.temperature < 0 else 0), t10 % 10, rh10 // 10, rh10 % 10))
+        data.append(sum(data) & 0xFF)
+        return bytes(data)
+
+    def poll(self, now):
+        if self._next is None:
+            self._next = now + self.period_ms
+        while now >= self._next:
+            self._pending.append((self._next, self.frame()))
+            self.frames += 1
+            self._next += self.period_ms
+
+
+def _dart_checksum(data):
+    return ((0xFF ^ (sum(data) & 0xFF)) + 1) & 0xFF
+
+
+class Dart(UARTDevice):
+    """默认主动上传；收到切换命令后进入询问模式，只在收到0x86询问时应答"""
+    QUERY = b"\xff\x01\x86\x00\x00\x00\x00\x00y"
+    ASK_MODE = b"\xff\x01xA\x00\x00\x00\x00F"
+    AUTO_MODE = b"\xff\x01x@\x00\x00\x00\x00G"
+
+    def __init__(self, ppb=25, period_ms=1000, latency_ms=10):
+        super().__init__()
+        self.ppb = ppb
+        self.period_ms = period_ms
+        self.latency_ms = latency_ms
+        self.mode = 0
+        self.queries = 0
+        self._cmd = bytearray()
+        self._next = None
+
+    @property
+    def ugm3(self) -> int:
+        return round(self.ppb * 30.03 / 24.45)  # 25°C下甲醛ppb换算成µg/m³
+
+    def _frame(self, body) -> bytes:
+        body = bytes(body)
+        return body + bytes((_dart_checksum(body[1:]),))
+
+    def poll(self, now):
+        if self.mode != 0:
+            self._next = None
+            return
+        if self._next is None:
+            self._next = now + self.period_ms
+        while now >= self._next:
+            ppb = int(self.ppb)
+            self._pending.append((self._next, self._frame((0xFF, 0x17, 0x04, 0x00, ppb >> 8, ppb & 0xFF, 0x07, 0xD0))))
+            self._next += self.period_ms
+
+    def receive(self, data):
+        self._cmd += data
+        while len(self._cmd) >= 9:
+            start = self._cmd.find(b"\xff")
+            if start < 0:
+                self._cmd = bytearray()
+                return
+            del self._cmd[:start]
+            if len(self._cmd) < 9:
+                return
+            cmd = bytes(self._cmd[:9])
+            del self._cmd[:9]
+            if cmd == self.ASK_MODE:
+                self.mode = 1
+            elif cmd == self.AUTO_MODE:
+                self.mode = 0
+            elif cmd == self.QUERY:
+                self.queries += 1
+                ug = self.ugm3
+                ppb = int(self.ppb)
+                self.send(self._frame((0xFF, 0x86, ug >> 8, ug & 0xFF, 0, 0, ppb >> 8, ppb & 0xFF)),
+                          self.latency_ms)
@@ -0,0 +1,172 @@
+# -*- coding: utf-8 -*-
+"""
+Copyright (c) 2008-2025 synodriver <diguohuangjiajinweijun@gmail.com>
+
+在CPython上原样运行main.py一段时间，然后打印发布统计
+
+    python -m sim.run --duration 30
+    python -m sim.run --duration 120 --config '{"publish_mode": "full"}' --dump publishes.jsonl
+    python -m sim.run --duration 30 --config '{"ltr390_int_pin": 27}'  # LTR390用INT代替轮询
+
+在脚本里用simulate()可以改设备读数、注入MQTT命令或者模拟断网:
+
+    async def scenario(client, board):
+        await asyncio.sleep(10)
+        board.uart[1].inject(b"\\x00")  # 空气模块串口丢一个字节
+        client.inject(main.command_topic, '{"uvs_gain": "3"}')
+
+    main = simulate(30, scenario=scenario)
+
+SCENARIOS里是可以用--scenario直接运行的场景:
+
+    python -m sim.run --duration 60 --scenario outage --config '{"spool_interval": 1}'
+"""
+import argparse
+import asyncio
+import json
+import os
+import sys
+import tempfile
+
+import sim
+
+# 模拟环境的默认配置：不连真实broker，可选的传感器都接上
+SIM_CONFIG = {
+    "debug": False,
+    "dart_uart": [2, 25, 26],
+    "sht4x_bus": 1,
+}
+
+
+def _prepare(config, workdir, board_setup):
+    sim.install()
+    from sim.board import board, default_board
+
+    default_board()
+    if board_setup is not None:
+        board_setup(board)
+    workdir = workdir or tempfile.mkdtemp(prefix="sim-")
+    os.chdir(workdir)
+    cfg = dict(SIM_CONFIG)
+    cfg.update(config or {})
+    with open("config.json", "w") as f:
+        json.dump(cfg, f)
+    return board
+
+
+def _import_main(fake_run):
+    run = asyncio.run
+    asyncio.run = fake_run
+    sys.modules.pop("main", None)
+    try:
+        import main
+    except SystemExit as e:  # machine.reset()
+        print("simulation stopped: %s" % e)
+        main = sys.modules["main"]
+    finally:
+        asyncio.run = run
+    return main
+
+
+def simulate(duration, config=None, workdir=None, scenario=None, board_setup=None):
+    """
+    运行main.py，duration秒之后停止事件循环
+    :param config: 覆盖SIM_CONFIG，写进工作目录的config.json
+    :param workdir: 工作目录，config.json/discovery.hash/spool都在这里；None时用临时目录
+    :param scenario: async def scenario(client, board)，和main一起运行
+    :param board_setup: def board_setup(board)，main启动之前修改接线或者设备读数
+    :return: main模块，可以检查main.client.published/main.scheduler等
+    """
+    board = _prepare(config, workdir, board_setup)
+    run = asyncio.run
+
+    def bounded_run(coro, **kwargs):
+        async def bounded():
+            if scenario is not None:
+                asyncio.create_task(scenario(sys.modules["main"].client, board))
+            try:
+                await asyncio.wait_for(coro, duration)
+            except asyncio.TimeoutError:
+                pass
+
+        return run(bounded(), **kwargs)
+
+    return _import_main(bounded_run)
+
+
+async def outage(client, board, start=10, down=20):
+    """
+    发送状态的过程中链路悄悄断开，客户端response_time之后才发现断线，down秒之后恢复；
+    这段时间的采样应该进入spool，恢复之后在history topic上重放
+    """
+    main = sys.modules["main"]
+    await asyncio.sleep(start)
+    client.publish_delay_ms = 200  # 让发送持续一段时间，好在中途断开
+    while main.sending_since is None:
+        await asyncio.sleep(0.01)
+    client.drop()
+    client.publish_delay_ms = 0
+    print("link dropped during a publish")
+    await asyncio.sleep(down)
+    client.reconnect()
+    print("link restored")
+
+
+SCENARIOS = {"outage": outage}
+
+
+def load_main(config=None, workdir=None, board_setup=None):
+    """import main但不启动main()，用来单独调用或者测量里面的函数"""
+    _prepare(config, workdir, board_setup)
+    return _import_main(lambda coro, **kwargs: coro.close())
+
+
+def report(main):
+    from sim.board import board
+
+    client = main.client
+    print("publishes by topic:")
+    counts = {}
+    for _, topic, msg, _, _ in client.published:
+        count, size = counts.get(topic, (0, 0))
+        counts[topic] = (count + 1, size + len(msg))
+    for topic, (count, size) in sorted(counts.items()):
+        print("  %-60s %5d msgs %8d B" % (topic.decode(), count, size))
+    states = client.messages(main.state_topic)
+    if states:
+        print("last state: %s" % states[-1][2].decode())
+    print("scheduler (runs, overruns, errors, max_us, max_late_ms):")
+    for name, stats in main.scheduler.stats().items():
+        print("  %-16s %s" % (name, stats))
+    print("i2c (device, reads, writes, conversions):")
+    for bus, devices in sorted(board.i2c.items()):
+        for address, device in sorted(devices.items()):
+            print("  %d:0x%02X %-8s %6d %6d %6s" % (bus, address, type(device).__name__, device.reads, device.writes,
+                                                    getattr(device, "conversions", "-")))
+    spool = main.spool
+    print("spool (writes, dropped, pending, history msgs): (%d, %d, %s, %d)" % (
+        spool.writes, spool.dropped, spool.pending(), len(client.messages(main.history_topic))))
+    print("longest gap between WDT feeds: %d ms" % board.wdt_max_gap_ms)
+
+
+def main_():
+    parser = argparse.ArgumentParser(description="run main.py against simulated hardware")
+    parser.add_argument("--duration", type=float, default=30, help="seconds to run")
+    parser.add_argument("--config", default="{}", help="JSON merged into config.json")
+    parser.add_argument("--workdir", default=None, help="working directory, defaults to a temp dir")
+    parser.add_argument("--dump", default=None, help="write every publish to this JSON lines file")
+    parser.add_argument("--scenario", default=None, choices=sorted(SCENARIOS), help="run a scripted scenario")
+    args = parser.parse_args()
+    dump = os.path.abspath(args.dump) if args.dump else None
+    scenario = SCENARIOS[args.scenario] if args.scenario else None
+    main = simulate(args.duration, json.loads(args.config), args.workdir, scenario=scenario)
+    report(main)
+    if dump:
+        with open(dump, "w") as f:
+            for ticks, topic, msg, retain, qos in main.client.published:
+                f.write(json.dumps({"ticks_ms": ticks, "topic": topic.decode(), "msg": msg.decode("utf-8", "replace"),
+                                    "retain": retain, "qos": qos}) + "\n")
+
+
+if __name__ == "__main__":
+    main_()
@@ -0,0 +1,12 @@
+# -*- coding: utf-8 -*-
+"""esp模块的替代"""
+
+FLASH_SIZE = 4 * 1024 * 1024
+
+
+def flash_size():
+    return FLASH_SIZE
+
+
+def osdebug(level):
+    pass
@@ -0,0 +1,19 @@
+# -*- coding: utf-8 -*-
+"""esp32模块的替代"""
+
+RAW_TEMPERATURE = 118  # 华氏度，和芯片上读到的一样
+
+
+def raw_temperature():
+    return RAW_TEMPERATURE
+
+
+HEAP_DATA = 4
+HEAP_EXEC = 1
+
+# idf_heap_info返回的各个区域：(total, free, largest_free_block, min_free)
+HEAP_REGIONS = [(240000, 120000, 65536, 98304), (30000, 12000, 8192, 10240)]
+
+
+def idf_heap_info(capabilities):
+    return list(HEAP_REGIONS)
@@ -0,0 +1,191 @@
+# -*- coding: utf-8 -*-
+"""
+machine模块的替代
+I2C/UART把访问转给sim.board上挂的模拟设备，Pin的电平和中断由sim.board.set_pin驱动
+"""
+import time
+
+from sim.board import board
+from sim.devices import UARTDevice
+
+
+class Pin:
+    IN = 1
+    OUT = 3
+    OPEN_DRAIN = 7
+    PULL_UP = 1
+    PULL_DOWN = 2
+    IRQ_RISING = 1
+    IRQ_FALLING = 2
+
+    def __new__(cls, id_, *args, **kwargs):
+        # 同一个引脚号只有一个对象，和硬件一样共享电平和中断
+        pin = board.pins.get(id_)
+        if pin is None:
+            pin = board.pins[id_] = super().__new__(cls)
+            pin.id = id_
+            pin._level = 0
+            pin._handler = None
+            pin._trigger = 0
+        return pin
+
+    def __init__(self, id_, mode=-1, pull=-1, value=None, **kwargs):
+        if pull == Pin.PULL_UP:
+            self._level = 1
+        if value is not None:
+            self._level = 1 if value else 0
+
+    def init(self, mode=-1, pull=-1, value=None, **kwargs):
+        self.__init__(self.id, mode, pull, value)
+
+    def value(self, level=None):
+        if level is None:
+            return self._level
+        self._level = 1 if level else 0
+
+    def on(self):
+        self._level = 1
+
+    def off(self):
+        self._level = 0
+
+    def __call__(self, level=None):
+        return self.value(level)
+
+    def irq(self, handler=None, trigger=IRQ_FALLING | IRQ_RISING, **kwargs):
+        self._handler = handler
+        self._trigger = trigger
+
+    def drive(self, level):
+        level = 1 if level else 0
+        if level == self._level:
+            return
+        self._level = level
+        edge = Pin.IRQ_RISING if level else Pin.IRQ_FALLING
+        if self._handler is not None and self._trigger & edge:
+            self._handler(self)
+
+
+class I2C:
+    def __init__(self, id_, scl=None, sda=None, freq=400000, timeout=50000):
+        self.id = id_
+        self.freq = freq
+        self._devices = board.i2c.setdefault(id_, {})
+
+    def _device(self, addr):
+        device = self._devices.get(addr)
+        if device is None:
+            raise OSError(19)  # ENODEV，和ESP32上没有应答时一样
+        device.check()
+        return device
+
+    def scan(self):
+        return sorted(self._devices)
+
+    def readfrom_mem(self, addr, memaddr, nbytes, addrsize=8):
+        return self._device(addr).read_mem(memaddr, nbytes)
+
+    def readfrom_mem_into(self, addr, memaddr, buf, addrsize=8):
+        data = self._device(addr).read_mem(memaddr, len(buf))
+        buf[:] = data
+
+    def writeto_mem(self, addr, memaddr, buf, addrsize=8):
+        self._device(addr).write_mem(memaddr, buf)
+
+    def readfrom(self, addr, nbytes, stop=True):
+        return self._device(addr).read_raw(nbytes)
+
+    def readfrom_into(self, addr, buf, stop=True):
+        buf[:] = self._device(addr).read_raw(len(buf))
+
+    def writeto(self, addr, buf, stop=True):
+        self._device(addr).write_raw(buf)
+        return 1
+
+
+SoftI2C = I2C
+
+
+class UART:
+    def __init__(self, id_, baudrate=9600, bits=8, parity=None, stop=1, tx=None, rx=None, timeout=0, **kwargs):
+        self.id = id_
+        self.baudrate = baudrate
+        self._device = board.uart.get(id_)
+        if self._device is None:  # 没接设备的串口，读不到任何东西
+            self._device = board.attach_uart(id_, UARTDevice())
+
+    def any(self):
+        return self._device.any()
+
+    def read(self, nbytes=-1):
+        return self._device.read(nbytes)
+
+    def readinto(self, buf, nbytes=None):
+        if nbytes is not None:
+            buf = memoryview(buf)[:nbytes]
+        return self._device.readinto(buf)
+
+    def write(self, buf):
+        return self._device.write(buf)
+
+    def deinit(self):
+        pass
+
+
+class WDT:
+    def __init__(self, id=0, timeout=5000):
+        board.wdt_timeout = timeout
+        self._last = time.ticks_ms()
+
+    def feed(self):
+        now = time.ticks_ms()
+        gap = time.ticks_diff(now, self._last)
+        if gap > board.wdt_max_gap_ms:
+            board.wdt_max_gap_ms = gap
+        if gap > board.wdt_timeout:
+            print("WDT: %d ms since last feed, device would have reset" % gap)
+        self._last = now
+
+
+class PWM:
+    def __init__(self, pin, freq=0, duty=0, **kwargs):
+        self._freq = freq
+        self._duty = duty
+
+    def freq(self, value=None):
+        if value is None:
+            return self._freq
+        self._freq = value
+
+    def duty(self, value=None):
+        if value is None:
+            return self._duty
+        self._duty = value
+
+    def deinit(self):
+        pass
+
+
+def unique_id():
+    return board.unique_id
+
+
+def reset():
+    board.resets += 1
+    raise SystemExit("machine.reset()")
+
+
+def soft_reset():
+    reset()
+
+
+def freq(value=None):
+    return 240000000
+
+
+def time_pulse_us(pin, pulse_level, timeout_us=1000000):
+    raise OSError(110)  # ETIMEDOUT，模拟环境里没有回波
+
+
+def idle():
+    time.sleep(0.001)
@@ -0,0 +1,27 @@
+# -*- coding: utf-8 -*-
+"""
+micropython模块的替代
+没有native/viper，依赖它们的代码会走纯Python的回退路径
+"""
+
+
+def const(value):
+    return value
+
+
+def alloc_emergency_exception_buf(size):
+    pass
+
+
+def schedule(func, arg):
+    func(arg)
+
+
+def mem_info(verbose=False):
+    import gc
+    print("stack: 0 out of 15360\nGC: total: %d, used: %d, free: %d" % (
+        gc.mem_alloc() + gc.mem_free(), gc.mem_alloc(), gc.mem_free()))
+
+
+def opt_level(level=None):
+    return 0
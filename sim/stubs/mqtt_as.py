@@ -0,0 +1,200 @@
+# -*- coding: utf-8 -*-
+"""
+mqtt_as的替代：进程内的broker和客户端
+publish的内容带时间戳记录在client.published里，retained消息在订阅时送回，
+inject()模拟broker转发过来的消息，disconnect()/reconnect()模拟断网，
+drop()模拟链路悄悄断掉：publish卡住，过一段时间客户端才发现断线
+"""
+import asyncio
+import time
+
+config = {
+    "client_id": b"sim",
+    "server": None,
+    "port": 0,
+    "user": "",
+    "password": "",
+    "keepalive": 60,
+    "ping_interval": 0,
+    "ssl": False,
+    "ssl_params": {},
+    "response_time": 10,
+    "clean_init": True,
+    "clean": True,
+    "max_repubs": 4,
+    "will": None,
+    "subs_cb": None,
+    "wifi_coro": None,
+    "connect_coro": None,
+    "ssid": None,
+    "wifi_pw": None,
+    "queue_len": 0,
+    "gateway": False,
+    "mqttv5": False,
+    "mqttv5_con_props": None,
+}
+
+
+class _WLAN:
+    """network.WLAN(STA_IF)的替代，只提供get_wifi_data用到的部分"""
+
+    def __init__(self, ssid):
+        self._config = {
+            "ssid": ssid or "sim-ssid",
+            "essid": ssid or "sim-ssid",
+            "mac": b"\xa0\xb7\x65\xc3\xd2\xe1",
+            "txpower": 20,
+        }
+        self._ifconfig = ("192.168.0.101", "255.255.255.0", "192.168.0.1", "192.168.0.1")
+
+    def ifconfig(self):
+        return self._ifconfig
+
+    def config(self, key):
+        return self._config[key]
+
+    def isconnected(self):
+        return True
+
+    def status(self, param=None):
+        return -61 if param == "rssi" else 1010
+
+
+def _topic_matches(pattern, topic):
+    pattern = pattern.split(b"/")
+    topic = topic.split(b"/")
+    for i, part in enumerate(pattern):
+        if part == b"#":
+            return True
+        if i >= len(topic) or (part != b"+" and part != topic[i]):
+            return False
+    return len(pattern) == len(topic)
+
+
+class _MessageQueue:
+    """client.queue，async for得到(topic, msg, retained, properties)"""
+
+    def __init__(self):
+        self._items = []
+        self._event = None
+
+    def put(self, item):
+        self._items.append(item)
+        if self._event is not None:
+            self._event.set()
+
+    def __aiter__(self):
+        return self
+
+    async def __anext__(self):
+        if self._event is None:
+            self._event = asyncio.Event()
+        while not self._items:
+            self._event.clear()
+            await self._event.wait()
+        return self._items.pop(0)
+
+
+class MQTTClient:
+    def __init__(self, config):
+        self._config = config
+        self.up = asyncio.Event()
+        self.down = asyncio.Event()
+        self.queue = _MessageQueue()
+        self._sta_if = _WLAN(config.get("ssid"))
+        self._connected = False
+        self._subscriptions = set()
+        self.retained = {}  # broker上的retained消息
+        self.published = []  # [(ticks_ms, topic, msg, retain, qos)]
+        self.publish_delay_ms = 0  # 每次publish的模拟网络延迟
+        self._link = True  # False时publish发不出去，但isconnected()还是True，直到发现断线
+
+    # mqtt_as接口
+    async def connect(self, quick=False):
+        self._connected = True
+        self.up.set()
+
+    def isconnected(self):
+        return self._connected
+
+    async def publish(self, topic, msg, retain=False, qos=0, properties=None):
+        while not (self._connected and self._link):  # mqtt_as会一直重试到重新连上
+            await asyncio.sleep(0.1)
+        if self.publish_delay_ms:
+            await asyncio.sleep(self.publish_delay_ms / 1000)
+        topic = bytes(topic)
+        msg = bytes(msg)
+        self.published.append((time.ticks_ms(), topic, msg, retain, qos))
+        if retain:
+            if msg:
+                self.retained[topic] = msg
+            else:
+                self.retained.pop(topic, None)
+        for pattern in self._subscriptions:
+            if _topic_matches(pattern, topic):
+                self.queue.put((topic, msg, False, None))
+                break
+
+    async def subscribe(self, topic, qos=0, properties=None):
+        topic = bytes(topic)
+        self._subscriptions.add(topic)
+        for retained_topic, msg in self.retained.items():
+            if _topic_matches(topic, retained_topic):
+                self.queue.put((retained_topic, msg, True, None))
+
+    async def unsubscribe(self, topic, properties=None):
+        self._subscriptions.discard(bytes(topic))
+
+    def close(self):
+        self._connected = False
+
+    async def broker_up(self):
+        return self._connected
+
+    async def wan_ok(self, packet=None):
+        return self._connected
+
+    def dprint(self, msg, *args):
+        pass
+
+    # 模拟用的接口
+    def inject(self, topic, msg, retained=False):
+        """broker转发一条消息给设备，只有订阅了才会收到"""
+        if isinstance(topic, str):
+            topic = topic.encode()
+        if isinstance(msg, str):
+            msg = msg.encode()
+        for pattern in self._subscriptions:
+            if _topic_matches(pattern, topic):
+                self.queue.put((topic, msg, retained, None))
+                return True
+        return False
+
+    def disconnect(self):
+        self._connected = False
+        self.down.set()
+
+    def drop(self, detect_ms=None):
+        """
+        链路断开但客户端还不知道，之后的publish都会卡住；
+        detect_ms毫秒之后客户端发现断线(相当于mqtt_as的response_time)，None时用config里的response_time
+        """
+        self._link = False
+        if detect_ms is None:
+            detect_ms = self._config.get("response_time", 10) * 1000
+        asyncio.get_running_loop().call_later(detect_ms / 1000, self._detect)
+
+    def _detect(self):
+        if not self._link and self._connected:
+            self.disconnect()
+
+    def reconnect(self):
+        self._link = True
+        self._connected = True
+        self.up.set()
+
+    def messages(self, topic):
+        """某个topic上发布过的所有消息"""
+        if isinstance(topic, str):
+            topic = topic.encode()
+        return [item for item in self.published if item[1] == topic]
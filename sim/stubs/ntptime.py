@@ -0,0 +1,9 @@
+# -*- coding: utf-8 -*-
+"""ntptime的替代，CPython的时钟本来就是准的，不需要校准"""
+
+host = "pool.ntp.org"
+timeout = 1
+
+
+def settime():
+    pass
@@ -0,0 +1,6 @@
+# -*- coding: utf-8 -*-
+"""ota.rollback的替代，模拟环境里没有分区可以回滚"""
+
+
+def cancel():
+    pass
@@ -0,0 +1,8 @@
+# -*- coding: utf-8 -*-
+"""ota.update的替代，只记录请求，不写分区"""
+requests = []
+
+
+def from_file(url, reboot=False, **kwargs):
+    requests.append(url)
+    print("ota.update.from_file(%r) ignored in simulation" % url)
@@ -0,0 +1,4 @@
+# -*- coding: utf-8 -*-
+"""utime就是打过补丁的time"""
+from time import *  # noqa: F401,F403
+from time import ticks_add, ticks_cpu, ticks_diff, ticks_ms, ticks_us, sleep_ms, sleep_us  # noqa: F401
@@ -44,6 +44,83 @@ class HCSR04:
         self.trigger.value(0)
         # Init echo pin (in)
         self.echo = Pin(echo_pin, mode=Pin.IN, pull=None)
+        # async模式：echo两个边沿在硬中断里打时间戳，第一次调用async方法时才挂中断
+        self._flag = None
+        self._rise = 0
+        self._fall = 0
+        self._edges = 2  # 触发之后收到的边沿数，2表示没有在等待
+
+    def _on_echo(self, pin):
+        """
+        echo引脚硬中断，只记录时间戳，不分配内存
+        短回波的两个边沿挨得很近，中断里再读引脚可能已经变了，所以按触发之后的第几个边沿区分上升和下降
+        """
+        now = time.ticks_us()
+        edges = self._edges
+        if edges == 0:
+            self._rise = now
+        elif edges == 1:
+            self._fall = now
+            self._flag.set()
+        else:
+            return
+        self._edges = edges + 1
+
+    def _init_irq(self):
+        self._flag = asyncio.ThreadSafeFlag()
+        self.echo.irq(self._on_echo, Pin.IRQ_RISING | Pin.IRQ_FALLING, hard=True)
+
+    async def pulse_us_async(self) -> int:
+        """
+        触发一次测量，等待echo高电平结束，等待期间不占用事件循环
+        :return: echo高电平持续的微秒数
+        """
+        if self._flag is None:
+            self._init_irq()
+        self._flag.clear()  # 丢掉上一次超时之后才到的边沿
+        self._edges = 0 if not self.echo.value() else 2  # echo还是高电平说明上一次的回波没结束，这次直接超时
+        self.trigger.value(0)  # Stabilize the sensor
+        time.sleep_us(5)
+        self.trigger.value(1)
+        time.sleep_us(10)
+        self.trigger.value(0)
+        try:
+            # 触发之后到echo升高还有一段时间，多留10ms
+            await asyncio.wait_for(self._flag.wait(), self.echo_timeout_us / 1_000_000 + 0.01)
+        except asyncio.TimeoutError:
+            raise OSError('Out of range')
+        finally:
+            self._edges = 2
+        return time.ticks_diff(self._fall, self._rise)
+
+    async def _median_pulse_us(self, samples, interval_ms) -> int:
+        """连续测量samples次取中位数，超时的次数不参与计算"""
+        pulses = []
+        for i in range(samples):
+            if i:
+                await asyncio.sleep_ms(interval_ms)  # 等上一次的回波散掉
+            try:
+                pulses.append(await self.pulse_us_async())
+            except OSError:
+                pass
+        if not pulses:
+            raise OSError('Out of range')
+        pulses.sort()
+        return pulses[len(pulses) // 2]
+
+    async def distance_mm_async(self, samples=1, interval_ms=60):
+        """
+        async版本的distance_mm
+        :param samples: 测量次数，取中位数
+        :param interval_ms: 两次测量的间隔，数据手册建议不小于60ms
+        """
+        pulse_time = await self._median_pulse_us(samples, interval_ms)
+        return pulse_time * 100 // 582
+
+    async def distance_cm_async(self, samples=1, interval_ms=60):
+        pulse_time = await self._median_pulse_us(samples, interval_ms)
+        return (pulse_time / 2) / 29.1
+
     def _send_pulse_and_wait(self):
         self.trigger.value(0) # Stabilize the sensor
         time.sleep_us(5)
@@ -0,0 +1,152 @@
+# -*- coding: utf-8 -*-
+"""
+Copyright (c) 2008-2025 synodriver <diguohuangjiajinweijun@gmail.com>
+
+断网期间的采样缓存
+定长二进制记录先攒在内存里，攒够一批才追加写入flash上的分段文件，分段数量有上限，超过就丢掉最旧的分段
+"""
+import asyncio
+import json
+import os
+import struct
+import time
+
+_NAN = float("nan")
+# MicroPython在ESP32上的epoch是2000-01-01，发出去的时间戳统一换成Unix时间
+UNIX_EPOCH_OFFSET = 946684800 if time.gmtime(0)[0] == 2000 else 0
+
+
+class Spool:
+    def __init__(self, fields, path="spool", segment_records=60, max_segments=8, batch=10, max_writes=200):
+        """
+        :param fields: 每条记录保存的状态键，缺失的值记为NaN
+        :param path: 分段文件所在目录
+        :param segment_records: 每个分段文件最多保存的记录数
+        :param max_segments: 分段文件数量上限，超过会删除最旧的分段；正在重放的分段不会被删除，所以至少是2
+        :param batch: 内存里攒多少条记录写一次flash
+        :param max_writes: 一次断网期间最多写多少次flash，超过之后的记录直接丢弃
+        """
+        self.fields = tuple(fields)
+        self._fmt = "<I%df" % len(self.fields)
+        self.record_size = struct.calcsize(self._fmt)
+        self.segment_size = self.record_size * segment_records
+        self.path = path
+        self.max_segments = max(max_segments, 2)
+        self.max_writes = max_writes
+        self._batch = batch
+        self._stage = bytearray(self.record_size * batch)
+        self._staged = 0
+        self._offset = 0  # 最旧分段里已经重放的字节数
+        self._replaying = False
+        self.writes = 0
+        self.dropped = 0
+        try:
+            os.mkdir(path)
+        except OSError:
+            pass
+        self._segments = sorted(int(name[:-4]) for name in os.listdir(path) if name.endswith(".bin"))
+
+    def _segment_path(self, seq):
+        return "%s/%d.bin" % (self.path, seq)
+
+    def _segment_bytes(self, seq):
+        try:
+            return os.stat(self._segment_path(seq))[6]
+        except OSError:
+            return 0
+
+    def pending(self) -> bool:
+        return bool(self._segments) or self._staged > 0
+
+    def append(self, state: dict, timestamp=None):
+        """
+        记录一条采样
+        :param timestamp: time.time()的秒数，RTC还没有校准过时传0，重放时记为null
+        """
+        if timestamp is None:
+            timestamp = time.time()
+        values = [state.get(field, _NAN) for field in self.fields]
+        for i, value in enumerate(values):
+            if not isinstance(value, (int, float)):
+                values[i] = _NAN
+        struct.pack_into(self._fmt, self._stage, self._staged * self.record_size, int(timestamp), *values)
+        self._staged += 1
+        if self._staged >= self._batch:
+            self.flush()
+
+    def flush(self):
+        """把内存里的记录追加写入最新的分段，一次flush只写一次flash"""
+        if not self._staged:
+            return
+        if self.writes >= self.max_writes:
+            self.dropped += self._staged
+            self._staged = 0
+            return
+        size = self._staged * self.record_size
+        if not self._segments or self._segment_bytes(self._segments[-1]) + size > self.segment_size:
+            self._segments.append(self._segments[-1] + 1 if self._segments else 0)
+            while len(self._segments) > self.max_segments:
+                if self._replaying:  # 最旧的分段正在重放，_offset指向它，删掉第二旧的
+                    oldest = self._segments.pop(1)
+                    self.dropped += self._segment_bytes(oldest) // self.record_size
+                else:
+                    oldest = self._segments.pop(0)
+                    self.dropped += (self._segment_bytes(oldest) - self._offset) // self.record_size
+                    self._offset = 0
+                os.remove(self._segment_path(oldest))
+        with open(self._segment_path(self._segments[-1]), "ab") as f:
+            f.write(memoryview(self._stage)[:size])
+        self.writes += 1
+        self._staged = 0
+
+    def _read_batch(self, count) -> list:
+        """从最旧的分段读取最多count条还没重放的记录"""
+        seq = self._segments[0]
+        with open(self._segment_path(seq), "rb") as f:
+            f.seek(self._offset)
+            data = f.read(count * self.record_size)
+        size = self.record_size
+        samples = []
+        for pos in range(0, len(data) - size + 1, size):
+            sample = list(struct.unpack_from(self._fmt, data, pos))
+            sample[0] = sample[0] + UNIX_EPOCH_OFFSET if sample[0] else None
+            for i in range(1, len(sample)):
+                if sample[i] != sample[i]:  # NaN不是合法JSON
+                    sample[i] = None
+                else:
+                    sample[i] = round(sample[i], 2)
+            samples.append(sample)
+        return samples
+
+    def _consume(self, count):
+        self._offset += count * self.record_size
+        seq = self._segments[0]
+        if self._offset >= self._segment_bytes(seq):
+            os.remove(self._segment_path(seq))
+            self._segments.pop(0)
+            self._offset = 0
+
+    async def replay(self, send, batch=20, interval=1):
+        """
+        按固定速率分批重放缓存的记录
+        :param send: async def send(payload: bytes)，返回之后才认为这一批已经送达
+        :param batch: 每条消息包含的记录数
+        :param interval: 两条消息之间的间隔(秒)
+        """
+        if self._replaying:
+            return
+        self._replaying = True
+        try:
+            self.flush()
+            while self._segments:
+                samples = self._read_batch(batch)
+                if samples:
+                    await send(json.dumps({"fields": self.fields, "samples": samples}).encode())
+                    self._consume(len(samples))
+                else:  # 空分段或者只剩半条记录
+                    os.remove(self._segment_path(self._segments.pop(0)))
+                    self._offset = 0
+                await asyncio.sleep(interval)
+            self.writes = 0
+        finally:
+            self._replaying = False
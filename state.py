@@ -0,0 +1,197 @@
+# -*- coding: utf-8 -*-
+"""
+Copyright (c) 2008-2025 synodriver <diguohuangjiajinweijun@gmail.com>
+"""
+import json
+import time
+
+
+class ChangeTracker:
+    """
+    记录上一次发送出去的状态，挑出变化量超过死区的键
+    死区按键配置，数值类型的变化小于死区不算变化；其他类型只要不相等就算变化
+    """
+
+    def __init__(self, deadbands=None, heartbeat=60):
+        """
+        :param deadbands: {key: 死区}，未配置的键任何变化都会发送
+        :param heartbeat: 强制发送完整状态的间隔(秒)，0表示不发送心跳
+        """
+        self.deadbands = deadbands or {}
+        self.heartbeat_ms = int(heartbeat * 1000)
+        self._sent = {}
+        self._last_full = None  # ticks_ms, None表示下一次必须发送完整状态
+
+    def reset(self):
+        """下一次强制发送完整状态，比如重新连上broker之后"""
+        self._last_full = None
+
+    def heartbeat_due(self) -> bool:
+        if self._last_full is None:
+            return True
+        if self.heartbeat_ms <= 0:
+            return False
+        return time.ticks_diff(time.ticks_ms(), self._last_full) >= self.heartbeat_ms
+
+    def changes(self, state: dict) -> list:
+        """
+        返回和上次发送相比发生变化的键
+        """
+        sent = self._sent
+        deadbands = self.deadbands
+        keys = []
+        for key in state:
+            value = state[key]
+            if key not in sent:
+                keys.append(key)
+                continue
+            last = sent[key]
+            band = deadbands.get(key, 0)
+            if band and isinstance(value, (int, float)) and isinstance(last, (int, float)):
+                if abs(value - last) >= band:
+                    keys.append(key)
+            elif value != last:
+                keys.append(key)
+        return keys
+
+    def mark_sent(self, state: dict, keys=None):
+        """
+        记录已发送的值，在序列化之后、await发送之前调用，这时state里的值和发出去的一致
+        :param keys: 本次发送的键，None表示发送的是完整状态
+        """
+        if keys is None:
+            self._sent.update(state)
+            self._last_full = time.ticks_ms()
+        else:
+            for key in keys:
+                self._sent[key] = state[key]
+
+
+_TRUE = b"true"
+_FALSE = b"false"
+_NULL = b"null"
+_INF = float("inf")
+_NINF = float("-inf")
+
+
+class StateSerializer:
+    """
+    把状态按固定的字段顺序写进一块预先分配好的bytearray，生成JSON
+    整数和浮点数直接逐位写入缓冲区，字符串编码后按字段缓存，值不变就不会重新编码
+    """
+
+    def __init__(self, fields, decimals=None, size=1536):
+        """
+        :param fields: 字段顺序，不在其中的键不会被发送
+        :param decimals: {key: 小数位数}，浮点数默认保留2位
+        :param size: 缓冲区初始大小，不够时会自动扩大
+        """
+        self.fields = tuple(fields)
+        self._prefix = tuple(('"%s":' % field).encode() for field in self.fields)
+        decimals = decimals or {}
+        self._scale = tuple(10 ** decimals.get(field, 2) for field in self.fields)
+        self._str_cache = [None] * len(self.fields)  # (str, 编码后的bytes)
+        self._buf = bytearray(size)
+        self._mv = memoryview(self._buf)
+
+    def serialize(self, state: dict, keys=None) -> memoryview:
+        """
+        :param keys: 只写入这些键，None表示写入所有字段
+        :return: 指向内部缓冲区的memoryview，下一次serialize之前有效
+        """
+        self._buf[0] = 0x7B  # {
+        pos = 1
+        prefix = self._prefix
+        for i, field in enumerate(self.fields):
+            if field not in state or (keys is not None and field not in keys):
+                continue
+            if pos > 1:
+                pos = self._put_byte(pos, 0x2C)  # ,
+            pos = self._put(pos, prefix[i])
+            pos = self._put_value(pos, i, state[field])
+        pos = self._put_byte(pos, 0x7D)  # }
+        return self._mv[:pos]
+
+    def _reserve(self, pos, n):
+        size = len(self._buf)
+        if pos + n > size:
+            buf = bytearray(size * 2 + n)
+            buf[:pos] = self._mv[:pos]
+            self._buf = buf
+            self._mv = memoryview(buf)
+
+    def _put_byte(self, pos, byte):
+        self._reserve(pos, 1)
+        self._buf[pos] = byte
+        return pos + 1
+
+    def _put(self, pos, data):
+        n = len(data)
+        self._reserve(pos, n)
+        self._mv[pos:pos + n] = data
+        return pos + n
+
+    def _put_int(self, pos, value):
+        if value < 0:
+            pos = self._put_byte(pos, 0x2D)  # -
+            value = -value
+        n = 1
+        tmp = value // 10
+        while tmp:
+            n += 1
+            tmp //= 10
+        self._reserve(pos, n)
+        buf = self._buf
+        end = pos + n
+        i = end
+        while True:
+            i -= 1
+            buf[i] = 0x30 + value % 10
+            value //= 10
+            if not value:
+                break
+        return end
+
+    def _put_float(self, pos, value, scale):
+        if value != value or value == _INF or value == _NINF:
+            return self._put(pos, _NULL)
+        scaled = round(value * scale)
+        if scaled < 0:
+            pos = self._put_byte(pos, 0x2D)
+            scaled = -scaled
+        pos = self._put_int(pos, scaled // scale)
+        if scale > 1:
+            pos = self._put_byte(pos, 0x2E)  # .
+            frac = scaled % scale
+            digits = 0
+            tmp = scale // 10
+            while tmp:
+                digits += 1
+                tmp //= 10
+            self._reserve(pos, digits)
+            buf = self._buf
+            for i in range(pos + digits - 1, pos - 1, -1):
+                buf[i] = 0x30 + frac % 10
+                frac //= 10
+            pos += digits
+        return pos
+
+    def _put_value(self, pos, i, value):
+        if value is True:
+            return self._put(pos, _TRUE)
+        if value is False:
+            return self._put(pos, _FALSE)
+        if value is None:
+            return self._put(pos, _NULL)
+        if isinstance(value, int):
+            return self._put_int(pos, value)
+        if isinstance(value, float):
+            return self._put_float(pos, value, self._scale[i])
+        cached = self._str_cache[i]
+        if cached is None or cached[0] is not value:
+            if isinstance(value, (bytes, bytearray)):
+                encoded = json.dumps(value.decode()).encode()
+            else:
+                encoded = json.dumps(value).encode()
+            cached = self._str_cache[i] = (value, encoded)
+        return self._put(pos, cached[1])